@@ -1,25 +1,56 @@
 """
-Initialize Flask app with SQLAlchemy and Flask-Migrate.
+Application factory of the payment service.
 
-Creates a Flask app instance, configures it using 'config.py',
-sets up SQLAlchemy for database operations, and configures Flask-Migrate.
+``create_app`` builds a Flask app configured from 'config.py', binds
+SQLAlchemy and Flask-Migrate to it and registers the payment endpoints. The
+Daraja client, token cache and other shared objects are only created once
+the app first uses them (see ``app.clients``), so building an app is cheap
+and every app, e.g. in tests, gets its own.
 """
 
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 
-# Create a Flask app instance
-app = Flask(__name__)
+# Extensions, bound to every app by create_app
+db = SQLAlchemy()
+migrate = Migrate()
 
-# Load configuration settings from 'config.py'
-app.config.from_pyfile('config.py')
 
-# Initialize SQLAlchemy with the app for database operations
-db = SQLAlchemy(app)
+def create_app(config=None):
+    """Create and configure an instance of the payment service.
 
-# Set up Flask-Migrate for handling database migrations
-migrate = Migrate(app, db)
+    Args:
+        config (dict): Settings overriding the ones loaded from 'config.py'.
 
-# Import application modules
-from app import routes, models, services
+    Returns:
+        Flask: The application.
+    """
+    app = Flask(__name__)
+
+    # Load configuration settings from 'config.py'
+    app.config.from_pyfile('config.py')
+    if config:
+        app.config.from_mapping(config)
+
+    # Import application modules; they import db from this package
+    # pylint: disable=import-outside-toplevel
+    from app import (  # pylint: disable=unused-import
+        archive, clients, database, metrics, models, routes, serialization, summary, tenants
+    )
+
+    # Initialize SQLAlchemy and Flask-Migrate with the app
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', database.engine_options(app.config))
+    db.init_app(app)
+    database.init_app(app)
+    migrate.init_app(app, db)
+
+    clients.init_app(app)
+    tenants.init_app(app)
+    serialization.init_app(app)
+    summary.init_app(app)
+    archive.init_app(app)
+    # Time every request for the /metrics endpoint
+    metrics.init_app(app)
+    app.register_blueprint(routes.bp)
+    return app
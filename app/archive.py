@@ -0,0 +1,145 @@
+"""
+Module providing the archival of old transactions.
+
+``mpesa_transaction`` only ever grows, so its indexes and the share of it the
+database keeps cached grow with it. The archiver moves transactions with a
+final status created more than ``ARCHIVE_AFTER_DAYS`` days ago to
+``archived_transaction``, one bounded batch per database transaction, so the
+live table holds only recent and pending ones. Lookups by checkout request ID
+fall back to the archive (see ``find``), so clients still get the status of
+archived transactions.
+"""
+
+import logging
+import threading
+from datetime import timedelta
+import click
+from flask import current_app
+from sqlalchemy import and_, delete, insert, literal, select
+from app import db, models
+
+logger = logging.getLogger(__name__)
+
+
+def find(checkout_request_ids):
+    """Look up archived transactions.
+
+    Returns:
+        dict: The ``ArchivedTransaction`` of each checkout request ID found, by ID.
+    """
+    if not checkout_request_ids:
+        return {}
+    archived = models.ArchivedTransaction
+    return {
+        transaction.checkout_request_id: transaction for transaction in archived.query.filter(
+            archived.checkout_request_id.in_(set(checkout_request_ids))
+        )
+    }
+
+
+class Archiver:
+    """
+    Moves old transactions with a final status to the archive table.
+
+    Must be used inside an application context.
+
+    Attributes:
+        after_days (int): Age in days of the transactions archived.
+        batch_size (int): Maximum number of transactions moved per database transaction.
+        pause (float): Seconds between batches, so archiving doesn't crowd out live writes.
+        archived (int): Number of transactions archived.
+    """
+
+    def __init__(self, after_days=90, batch_size=1000, pause=0.1):
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.pause = pause
+        self.archived = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """Create an archiver from the application configuration."""
+        return cls(
+            after_days=config['ARCHIVE_AFTER_DAYS'],
+            batch_size=config['ARCHIVE_BATCH_SIZE'],
+            pause=config['ARCHIVE_BATCH_PAUSE']
+        )
+
+    def cutoff(self):
+        """Creation time before which final transactions are archived."""
+        return models.utcnow() - timedelta(days=self.after_days)
+
+    def archive_batch(self, cutoff):
+        """Move up to ``batch_size`` final transactions created before ``cutoff``.
+
+        The copy and the delete commit together, so a transaction is never in
+        both tables or in neither.
+
+        Returns:
+            int: Number of transactions moved.
+        """
+        live = models.MpesaTransaction.__table__
+        archive = models.ArchivedTransaction.__table__
+        # Served by the (status, created_at) index, one range per final status
+        ids = db.session.execute(select(live.c.id).where(and_(
+            live.c.status.in_(sorted(models.TERMINAL_STATUSES)),
+            live.c.created_at < cutoff
+        )).limit(self.batch_size)).scalars().all()
+        if not ids:
+            return 0
+        columns = [column.name for column in live.columns]
+        db.session.execute(insert(archive).from_select(
+            columns + ['archived_at'],
+            select(*live.columns, literal(models.utcnow(), archive.c.archived_at.type))
+            .where(live.c.id.in_(ids))
+        ))
+        db.session.execute(delete(live).where(live.c.id.in_(ids)))
+        db.session.commit()
+        self.archived += len(ids)
+        return len(ids)
+
+    def run(self, cutoff=None, max_batches=None, stop=None):
+        """Archive batches until none is left, ``max_batches`` ran or ``stop`` is set.
+
+        Args:
+            cutoff (datetime): Creation time before which final transactions
+                are archived; defaults to ``after_days`` ago.
+
+        Returns:
+            int: Number of transactions moved.
+        """
+        cutoff = cutoff or self.cutoff()
+        stop = stop or threading.Event()
+        moved = batches = 0
+        while max_batches is None or batches < max_batches:
+            count = self.archive_batch(cutoff)
+            moved += count
+            batches += 1
+            logger.info("Archived %d transactions created before %s", count, cutoff)
+            if count < self.batch_size or stop.wait(self.pause):
+                break
+        return moved
+
+
+@click.group('archive')
+def cli():
+    """Archive old transactions."""
+
+
+@cli.command('run')
+@click.option('--after-days', type=int, help='Age in days of the transactions archived.')
+@click.option('--batch-size', type=int, help='Transactions moved per database transaction.')
+@click.option('--max-batches', type=int, help='Stop after this many batches.')
+def run_command(after_days, batch_size, max_batches):
+    """Move old transactions with a final status to the archive table."""
+    archiver = Archiver.from_config(current_app.config)
+    if after_days is not None:
+        archiver.after_days = after_days
+    if batch_size is not None:
+        archiver.batch_size = batch_size
+    click.echo(f"Archived {archiver.run(max_batches=max_batches)} transactions.")
+
+
+def init_app(app):
+    """Register the ``flask archive`` commands."""
+    app.cli.add_command(cli)
@@ -0,0 +1,308 @@
+"""
+Module providing asyncio versions of the M-Pesa API functions.
+
+All coroutines run on one long-lived event loop owned by ``engine``, so that
+every in-flight STK push in the process shares a single pooled HTTP client.
+Database work is handed to a small thread pool so it never blocks the loop.
+"""
+
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app import clients, metrics, services
+from app.daraja import ENDPOINTS, DEFAULT_TIMEOUT, RETRY_STATUSES, retry_after
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDarajaClient:
+    """
+    Async counterpart of ``DarajaClient`` built on ``aiohttp.ClientSession``.
+
+    Must be used from a single event loop, since its connections belong to it.
+    aiohttp is imported on first use: it is the slowest import of the service
+    and most processes never make an async call.
+    """
+
+    def __init__(self, base_url, pool_size=100, timeouts=None, retries=2, backoff=0.5,
+                 guards=None):
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeouts = dict(timeouts or {})
+        self.retries = retries
+        self.backoff = backoff
+        self.guards = guards or {}
+        self._session = None
+
+    @classmethod
+    def from_config(cls, config, guards=None):
+        """Create a client from the application configuration."""
+        return cls(
+            config['MPESA_API_BASE_URL'],
+            pool_size=config['MPESA_ASYNC_POOL_SIZE'],
+            timeouts=config['MPESA_HTTP_TIMEOUTS'],
+            retries=config['MPESA_HTTP_RETRIES'],
+            backoff=config['MPESA_HTTP_BACKOFF'],
+            guards=guards
+        )
+
+    @property
+    def session(self):
+        """Pooled session, created on first use inside the running loop."""
+        if self._session is None:
+            import aiohttp  # pylint: disable=import-outside-toplevel
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def request(self, endpoint, **kwargs):
+        """Call a Daraja endpoint, retrying idempotent calls like ``DarajaClient``.
+
+        Returns:
+            aiohttp.ClientResponse: The upstream response, with its body already read.
+        """
+        import aiohttp  # pylint: disable=import-outside-toplevel
+        method, path, idempotent = ENDPOINTS[endpoint]
+        connect, read = self.timeouts.get(endpoint, DEFAULT_TIMEOUT)
+        timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        attempts = 1 + (self.retries if idempotent else 0)
+        guard = self.guards.get(endpoint)
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            delay = self.backoff * 2 ** attempt
+            if guard is not None:
+                if guard.limited:
+                    # Waiting for the rate limit must not block the loop
+                    await asyncio.to_thread(guard.admit)
+                else:
+                    guard.admit()
+            started = time.perf_counter()
+            try:
+                async with self.session.request(
+                    method, f"{self.base_url}{path}", timeout=timeout, **kwargs
+                ) as response:
+                    await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                elapsed = time.perf_counter() - started
+                metrics.DARAJA_REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, status='error')
+                if guard is not None:
+                    guard.record(True, elapsed)
+                if last_attempt:
+                    raise
+                logger.warning("Daraja %s call failed, retrying: %s", endpoint, error)
+            except BaseException:
+                if guard is not None:
+                    guard.cancel()
+                raise
+            else:
+                elapsed = time.perf_counter() - started
+                metrics.DARAJA_REQUEST_SECONDS.observe(
+                    elapsed, endpoint=endpoint, status=response.status
+                )
+                if guard is not None:
+                    guard.record(response.status in RETRY_STATUSES, elapsed)
+                if last_attempt or response.status not in RETRY_STATUSES:
+                    return response
+                logger.warning("Daraja %s call returned %s, retrying", endpoint, response.status)
+                delay = max(delay, retry_after(response.headers))
+            await asyncio.sleep(delay)
+        return None
+
+    async def close(self):
+        """Close the pooled connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class AsyncEngine:
+    """
+    Runs payment coroutines on a dedicated event loop thread.
+
+    Synchronous code submits coroutines with ``run`` or ``submit``; async views
+    running on their own loop await them with ``wrap``. Coroutines run in an
+    application context of ``app``.
+    """
+
+    def __init__(self, app, db_workers=4):
+        self.app = app
+        self.db_workers = db_workers
+        self.client = None
+        self._loop = None
+        self._thread = None
+        self._db_executor = None
+        self._lock = threading.Lock()
+        # Running tasks by key, for ``once``; only touched on the engine loop
+        self._flights = {}
+
+    @property
+    def loop(self):
+        """Event loop of the engine, started on first use."""
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    self.client = AsyncDarajaClient.from_config(
+                        self.app.config, guards=services.endpoint_guards(self.app)
+                    )
+                    self._db_executor = ThreadPoolExecutor(
+                        max_workers=self.db_workers, thread_name_prefix='async-db'
+                    )
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(
+                        target=loop.run_forever, name='async-engine', daemon=True
+                    )
+                    self._thread.start()
+                    self._loop = loop
+                    atexit.register(self.stop)
+        return self._loop
+
+    async def _in_app_context(self, coro):
+        """Await a coroutine in an application context, private to its task."""
+        with self.app.app_context():
+            return await coro
+
+    def submit(self, coro):
+        """Schedule a coroutine on the engine and return a ``concurrent.futures.Future``."""
+        return asyncio.run_coroutine_threadsafe(self._in_app_context(coro), self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the engine and wait for its result."""
+        return self.submit(coro).result(timeout)
+
+    async def wrap(self, coro):
+        """Await a coroutine scheduled on the engine from another event loop."""
+        return await asyncio.wrap_future(self.submit(coro))
+
+    async def run_db(self, func, *args):
+        """Run a database function in an application context off the event loop."""
+        def call():
+            with self.app.app_context():
+                return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._db_executor, call)
+
+    async def once(self, key, coro_func):
+        """Await ``coro_func()``, or the task already running for ``key``.
+
+        Concurrent callers with the same key share one task and its result.
+        Must run on the engine loop.
+        """
+        task = self._flights.get(key)
+        if task is None:
+            task = self._flights[key] = asyncio.ensure_future(coro_func())
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+        # A cancelled caller must not cancel the task the others wait on
+        return await asyncio.shield(task)
+
+    @staticmethod
+    async def _drain(timeout):
+        """Wait up to ``timeout`` seconds for the coroutines in flight on the loop."""
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            if pending:
+                logger.warning("Stopping the async engine with %d calls in flight", len(pending))
+
+    def stop(self, timeout=None):
+        """Close the HTTP client and stop the event loop.
+
+        Args:
+            timeout (float): Seconds to wait for the calls in flight to finish
+                first; None stops at once.
+        """
+        atexit.unregister(self.stop)
+        with self._lock:
+            if self._loop is None:
+                return
+            if timeout:
+                asyncio.run_coroutine_threadsafe(self._drain(timeout), self._loop).result()
+            asyncio.run_coroutine_threadsafe(self.client.close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._db_executor.shutdown()
+            self._loop = None
+
+
+# Shared engine for all async M-Pesa API calls of the app
+engine = clients.proxy(
+    'async_engine', lambda app: AsyncEngine(app, db_workers=app.config['ASYNC_DB_WORKERS'])
+)
+
+
+async def generate_access_token(tenant=None):
+    """Return a cached access token without blocking the event loop."""
+    # Unlike run_in_executor, to_thread carries the app context over to the thread
+    return await asyncio.to_thread(services.generate_access_token, tenant)
+
+
+async def call_daraja(endpoint, payload, tenant=None):
+    """Make an authenticated Daraja call like ``services.call_daraja``. Must run on the engine loop.
+
+    The call is made within the tenant's rate limit and concurrency budget,
+    waited for on a thread, but over the engine's shared connection pool.
+
+    Returns:
+        dict: The parsed response body.
+    """
+    tenant = services.get_tenant(tenant)
+    if tenant.limited:
+        await asyncio.to_thread(tenant.acquire)
+    try:
+        for attempt in range(2):
+            access_token = await generate_access_token(tenant)
+            response = await engine.client.request(
+                endpoint, json=payload, headers=services.auth_headers(access_token)
+            )
+            with metrics.DARAJA_DECODE_SECONDS.time(endpoint=endpoint):
+                response_data = await response.json(content_type=None)
+            metrics.count_response(endpoint, response_data)
+            if attempt or not services.token_rejected(response.status, response_data):
+                return response_data
+            logger.warning("Daraja rejected the access token, fetching a new one")
+            tenant.token_manager.invalidate(access_token)
+    finally:
+        tenant.release()
+    return response_data
+
+
+async def initiate_stk_push(full_name, phone_number, amount, tenant=None):
+    """Initiate STK push for M-Pesa payment. Must run on the engine loop."""
+    tenant = services.get_tenant(tenant)
+    payload = services.stk_push_payload(phone_number, amount, tenant)
+
+    response_data = await call_daraja('stk_push', payload, tenant)
+    await engine.run_db(
+        services.record_transaction, full_name, phone_number, amount, response_data,
+        tenant.shortcode
+    )
+    return response_data
+
+
+async def _load_transaction_status(checkout_request_id, tenant=None):
+    """Answer a status query from the database or Daraja, and cache the answer."""
+    response_data = await engine.run_db(services.stored_status_response, checkout_request_id)
+    if response_data is None:
+        tenant = await engine.run_db(services.transaction_tenant, checkout_request_id, tenant)
+        query_data = services.stk_query_payload(checkout_request_id, tenant)
+        response_data = await call_daraja('stk_query', query_data, tenant)
+        await engine.run_db(services.record_query_result, checkout_request_id, response_data)
+    services.status_cache.remember(checkout_request_id, response_data)
+    return response_data
+
+
+async def query_transaction_status(checkout_request_id, tenant=None):
+    """Query transaction status like ``services.query_transaction_status``.
+
+    Must run on the engine loop.
+    """
+    response_data = services.status_cache.get(checkout_request_id)
+    if response_data is not None:
+        return response_data
+    return await engine.once(
+        ('stk_query', checkout_request_id),
+        lambda: _load_transaction_status(checkout_request_id, tenant)
+    )
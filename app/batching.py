@@ -0,0 +1,118 @@
+"""
+Module providing an in-process buffer that flushes items in batches.
+"""
+
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class BatchBuffer:
+    """
+    Collects keyed items and hands them to a flush function in batches.
+
+    Items are flushed by a background thread once ``batch_size`` of them are
+    waiting or ``interval`` seconds after the previous flush, whichever comes
+    first, and once more when the process exits. Adding an item under a key
+    that is already waiting replaces the waiting item. Items stay visible to
+    ``get`` until their flush has completed.
+
+    Attributes:
+        batch_size (int): Number of waiting items that triggers a flush.
+        interval (float): Maximum seconds between flushes.
+        flushed (int): Number of items handed to the flush function.
+        batches (int): Number of successful flushes.
+    """
+
+    def __init__(self, flush_func, batch_size=100, interval=1.0):
+        """
+        Args:
+            flush_func (callable): Called with a list of items; may raise to have
+                them put back and retried on the next flush.
+            batch_size (int): Number of waiting items that triggers a flush.
+            interval (float): Maximum seconds between flushes.
+        """
+        self._flush_func = flush_func
+        self.batch_size = batch_size
+        self.interval = interval
+        self._items = {}
+        # Items handed to the flush function that is running
+        self._flushing = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.flushed = 0
+        self.batches = 0
+
+    def add(self, key, item):
+        """Queue an item for the next flush."""
+        with self._lock:
+            self._items[key] = item
+            full = len(self._items) >= self.batch_size
+            if self._thread is None:
+                self._start()
+        if full:
+            self._wakeup.set()
+
+    def get(self, key, default=None):
+        """Return the item waiting under ``key``, if it has not been flushed yet."""
+        with self._lock:
+            return self._items.get(key, self._flushing.get(key, default))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def flush(self):
+        """Hand every waiting item to the flush function.
+
+        Returns:
+            int: Number of items flushed.
+        """
+        with self._flush_lock:
+            with self._lock:
+                items, self._items = self._items, {}
+                self._flushing = items
+            if not items:
+                return 0
+            try:
+                self._flush_func(list(items.values()))
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Flushing %d buffered items failed", len(items))
+                with self._lock:
+                    # Keep items that were replaced while the flush was running
+                    for key, item in items.items():
+                        self._items.setdefault(key, item)
+                    self._flushing = {}
+                return 0
+            with self._lock:
+                self._flushing = {}
+            self.flushed += len(items)
+            self.batches += 1
+            return len(items)
+
+    def close(self):
+        """Stop the background thread and flush what is left."""
+        atexit.unregister(self.close)
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+    def _start(self):
+        """Start the background flush thread. Called with the lock held."""
+        self._thread = threading.Thread(target=self._run, name='batch-buffer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        """Flush on every wakeup or interval until stopped."""
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
@@ -0,0 +1,218 @@
+"""
+Module providing bulk STK pushes and status syncs with concurrent fan-out.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from flask import current_app
+from app import archive, clients, metrics, models, services
+from app.ratelimit import RateLimiter
+from app.tenants import TenantBusyError
+
+logger = logging.getLogger(__name__)
+
+# Shared by every bulk request of the app, so concurrent batches don't add up
+limiter = clients.proxy('bulk_limiter', lambda app: RateLimiter(app.config['BULK_RATE']))
+
+
+class BulkStkPush:
+    """
+    Sends a batch of validated STK pushes concurrently.
+
+    Daraja calls run on a thread pool, throttled by the shared rate limiter.
+    Accepted pushes are recorded with bulk inserts from the calling thread,
+    which must be inside an application context.
+
+    Attributes:
+        concurrency (int): Maximum number of Daraja calls in flight.
+        insert_batch_size (int): Accepted transactions inserted at a time.
+    """
+
+    def __init__(self, concurrency=8, insert_batch_size=100, rate_limiter=None):
+        self.concurrency = concurrency
+        self.insert_batch_size = insert_batch_size
+        self.limiter = rate_limiter or limiter
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a sender from the application configuration."""
+        return cls(
+            concurrency=config['BULK_CONCURRENCY'],
+            insert_batch_size=config['BULK_INSERT_BATCH_SIZE']
+        )
+
+    def _send(self, app, tenant, full_name, phone_number, amount):
+        """Send one STK push and return its response, or the error that prevented it."""
+        with app.app_context():
+            self.limiter.acquire()
+            try:
+                return services.send_stk_push(phone_number, amount, tenant), None
+            except (requests.RequestException, ValueError, TenantBusyError) as error:
+                logger.warning("Bulk STK push to %s failed: %s", phone_number, error)
+                return None, str(error)
+
+    def run(self, items, tenant=None):
+        """Send every item and yield its result as soon as it completes.
+
+        Args:
+            items (list): ``(full_name, phone_number, amount)`` tuples.
+            tenant: Tenant to pay, or its name or shortcode; defaults to the default tenant.
+
+        Yields:
+            dict: ``index`` of the item, ``status`` ('accepted', 'rejected' or
+                'error') and the M-Pesa ``response`` or the ``error``.
+        """
+        # The pool threads work in the app of the caller
+        app = current_app._get_current_object()  # pylint: disable=protected-access
+        tenant = services.get_tenant(tenant)
+        rows = []
+        futures = {}
+        executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix='bulk-stk-push'
+        )
+        try:
+            for index, item in enumerate(items):
+                futures[executor.submit(self._send, app, tenant, *item)] = (index, item)
+            for future in as_completed(list(futures)):
+                index, item = futures.pop(future)
+                response, error = future.result()
+                if error is not None:
+                    yield {'index': index, 'status': 'error', 'error': error}
+                    continue
+                row = services.transaction_row(*item, response, tenant.shortcode)
+                if row is not None:
+                    rows.append(row)
+                    if len(rows) >= self.insert_batch_size:
+                        services.record_transactions(rows)
+                        rows = []
+                status = 'accepted' if row is not None else 'rejected'
+                yield {'index': index, 'status': status, 'response': response}
+        finally:
+            # If the client went away, stop sending but still record what M-Pesa accepted
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future, (index, item) in futures.items():
+                if not future.cancelled() and future.result()[0] is not None:
+                    row = services.transaction_row(*item, future.result()[0], tenant.shortcode)
+                    if row is not None:
+                        rows.append(row)
+            services.record_transactions(rows)
+
+
+class BulkStatusSync:
+    """
+    Queries the status of many transactions and writes the results at once.
+
+    Only transactions that are still pending are queried; Daraja calls run on
+    a thread pool, throttled by the shared rate limiter, and every result
+    they bring back is written in a single database transaction by the
+    calling thread, which must be inside an application context.
+
+    Attributes:
+        concurrency (int): Maximum number of Daraja calls in flight.
+    """
+
+    def __init__(self, concurrency=8, rate_limiter=None):
+        self.concurrency = concurrency
+        self.limiter = rate_limiter or limiter
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a syncer from the application configuration."""
+        return cls(concurrency=config['BULK_CONCURRENCY'])
+
+    def _query(self, app, checkout_request_id, shortcode):
+        """Query one status and return the response, or the error that prevented it."""
+        with app.app_context():
+            self.limiter.acquire()
+            try:
+                tenant = services.tenant_registry.for_shortcode(shortcode)
+                return services.request_transaction_status(
+                    checkout_request_id, tenant=tenant
+                ), None
+            except (requests.RequestException, ValueError, TenantBusyError) as error:
+                logger.warning("Status sync of %s failed: %s", checkout_request_id, error)
+                return None, str(error)
+
+    def run(self, checkout_request_ids):
+        """Sync the status of every checkout request.
+
+        Args:
+            checkout_request_ids (list): Checkout request IDs; duplicates are
+                synced once.
+
+        Returns:
+            list: One dictionary per distinct ID, in order, with its
+                ``checkout_request_id``, ``status`` ('unknown' if there is no
+                such transaction, 'error' if its query failed), whether it was
+                ``updated`` and its ``result_code`` and ``result_desc`` or the
+                ``error``.
+        """
+        checkout_request_ids = list(dict.fromkeys(checkout_request_ids))
+        # Transactions still in the write-behind buffer are written first
+        pending = clients.of(current_app).peek('transaction_buffer')
+        if pending is not None:
+            pending.flush()
+        transaction = models.MpesaTransaction
+        stored = {
+            row.checkout_request_id: row for row in transaction.query.filter(
+                transaction.checkout_request_id.in_(checkout_request_ids)
+            )
+        }
+        stored.update(archive.find(
+            [checkout_request_id for checkout_request_id in checkout_request_ids
+             if checkout_request_id not in stored]
+        ))
+        due = [
+            checkout_request_id for checkout_request_id in checkout_request_ids
+            if checkout_request_id in stored
+            and stored[checkout_request_id].status == models.PENDING
+        ]
+
+        # The pool threads work in the app of the caller
+        app = current_app._get_current_object()  # pylint: disable=protected-access
+        responses = {}
+        if due:
+            with ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix='bulk-status-sync'
+            ) as executor:
+                responses = dict(zip(due, executor.map(
+                    lambda key: self._query(app, key, stored[key].shortcode), due
+                )))
+
+        updates = {}
+        for checkout_request_id, (response, _) in responses.items():
+            update = services.query_result_update(checkout_request_id, response)
+            if update is not None:
+                metrics.RESULT_CODES.inc(source='query', code=update['result_code'])
+                updates[checkout_request_id] = update
+        services.apply_status_updates(list(updates.values()))
+        for checkout_request_id, (response, _) in responses.items():
+            services.status_cache.remember(checkout_request_id, response)
+
+        return [
+            self._result(checkout_request_id, stored.get(checkout_request_id),
+                         responses.get(checkout_request_id, (None, None))[1],
+                         updates.get(checkout_request_id))
+            for checkout_request_id in checkout_request_ids
+        ]
+
+    @staticmethod
+    def _result(checkout_request_id, transaction, error, update):
+        """Report the sync of one checkout request."""
+        result = {'checkout_request_id': checkout_request_id, 'updated': False}
+        if transaction is None:
+            result['status'] = 'unknown'
+        elif error is not None:
+            result.update(status='error', error=error)
+        elif update is not None:
+            result.update(
+                status=update['status'], updated=True,
+                result_code=update['result_code'], result_desc=update['result_desc']
+            )
+        else:
+            result.update(
+                status=transaction.status, result_code=transaction.result_code,
+                result_desc=transaction.result_desc
+            )
+        return result
@@ -0,0 +1,66 @@
+"""
+Module providing the long-lived objects of an application, created on first use.
+
+Modules expose the objects they share across requests, like the pooled
+Daraja client or the access token cache, as context-local proxies made with
+``proxy``. The first use inside an app builds the object for that app and
+later uses reuse it, so processes that never call Daraja never build them
+and two apps in one process never share them.
+"""
+
+import threading
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+# Key of the Clients object in app.extensions
+EXTENSION = 'clients'
+
+
+class Clients:
+    """
+    Objects of one application, by name.
+
+    Attributes:
+        app (Flask): The application the objects belong to.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._objects = {}
+        # Reentrant, as creating an object may use another one
+        self._lock = threading.RLock()
+
+    def get(self, name, factory):
+        """Return the object called ``name``, created with ``factory(app)`` on first use."""
+        try:
+            return self._objects[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._objects:
+                self._objects[name] = factory(self.app)
+            return self._objects[name]
+
+    def peek(self, name):
+        """Return the object called ``name`` if it has been created, else None."""
+        return self._objects.get(name)
+
+
+def init_app(app):
+    """Attach an empty set of objects to ``app``."""
+    app.extensions[EXTENSION] = Clients(app)
+
+
+def of(app):
+    """Objects of ``app``."""
+    return app.extensions[EXTENSION]
+
+
+def proxy(name, factory):
+    """Proxy to the object called ``name`` of the current app.
+
+    Args:
+        name (str): Name of the object, unique within the app.
+        factory (callable): Builds the object from the app on first use.
+    """
+    return LocalProxy(lambda: current_app.extensions[EXTENSION].get(name, factory))
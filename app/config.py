@@ -19,6 +19,178 @@ MPESA_SHORTCODE = os.environ.get('SHORTCODE')
 MPESA_PASSKEY = os.environ.get('PASSKEY')
 MPESA_CONFIRMATION_URL = os.environ.get('CONFIRMATION_URL')
 
+# Further paybills served by the same process: a JSON array, or the path of a JSON
+# file holding one, of objects with the name, shortcode, passkey, consumer_key and
+# consumer_secret of each paybill, and optionally its confirmation_url, rate,
+# concurrency, queue_timeout and pool_size. Requests pick a paybill with a "tenant"
+# field holding its name or shortcode; the one above is the "default" tenant.
+MPESA_TENANTS = os.environ.get('MPESA_TENANTS', '')
+
+# Limits of every tenant that doesn't set its own: Daraja calls per second and in
+# flight (0 for no limit), and seconds a call waits to get under them before the
+# request is turned away with a 429
+MPESA_TENANT_RATE = float(os.environ.get('MPESA_TENANT_RATE', '0'))
+MPESA_TENANT_CONCURRENCY = int(os.environ.get('MPESA_TENANT_CONCURRENCY', '0'))
+MPESA_TENANT_QUEUE_TIMEOUT = float(os.environ.get('MPESA_TENANT_QUEUE_TIMEOUT', '1.0'))
+
+# Base URL of the Daraja API
+MPESA_API_BASE_URL = os.environ.get('MPESA_API_BASE_URL', 'https://sandbox.safaricom.co.ke')
+
+# Access token caching: stop serving a token this many seconds before it expires,
+# and start refreshing it in the background this many seconds before it expires
+MPESA_TOKEN_EXPIRY_MARGIN = int(os.environ.get('MPESA_TOKEN_EXPIRY_MARGIN', '60'))
+MPESA_TOKEN_REFRESH_AHEAD = int(os.environ.get('MPESA_TOKEN_REFRESH_AHEAD', '300'))
+
+def _timeouts(endpoint, connect, read):
+    """Read the (connect, read) timeout of a Daraja endpoint from the environment."""
+    return (
+        float(os.environ.get(f'MPESA_{endpoint}_CONNECT_TIMEOUT', connect)),
+        float(os.environ.get(f'MPESA_{endpoint}_READ_TIMEOUT', read))
+    )
+
+# Daraja HTTP client: kept-alive connections per worker, (connect, read) timeouts
+# per endpoint, and retries with exponential backoff for idempotent calls
+MPESA_HTTP_POOL_SIZE = int(os.environ.get('MPESA_HTTP_POOL_SIZE', '10'))
+MPESA_HTTP_TIMEOUTS = {
+    'oauth': _timeouts('OAUTH', 3.05, 10),
+    'stk_push': _timeouts('STK_PUSH', 3.05, 10),
+    'stk_query': _timeouts('STK_QUERY', 3.05, 10),
+}
+MPESA_HTTP_RETRIES = int(os.environ.get('MPESA_HTTP_RETRIES', '2'))
+MPESA_HTTP_BACKOFF = float(os.environ.get('MPESA_HTTP_BACKOFF', '0.5'))
+
+# Client-side rate limit of each Daraja endpoint, in calls per second per worker
+# process (0 for no limit), and the seconds a call waits for it before the request
+# is turned away with a 429
+MPESA_RATE_LIMITS = {
+    'oauth': float(os.environ.get('MPESA_OAUTH_RATE', '0')),
+    'stk_push': float(os.environ.get('MPESA_STK_PUSH_RATE', '0')),
+    'stk_query': float(os.environ.get('MPESA_STK_QUERY_RATE', '0')),
+}
+MPESA_RATE_LIMIT_TIMEOUT = float(os.environ.get('MPESA_RATE_LIMIT_TIMEOUT', '1.0'))
+
+# Circuit breaker of each Daraja endpoint: once MPESA_CIRCUIT_BREAKER_MIN_CALLS of its
+# last MPESA_CIRCUIT_BREAKER_WINDOW calls have been made and at least the
+# MPESA_CIRCUIT_BREAKER_FAILURE_THRESHOLD share of them failed or took
+# MPESA_CIRCUIT_BREAKER_SLOW_CALL seconds or longer, its calls fail fast with a 503 for
+# MPESA_CIRCUIT_BREAKER_RESET_TIMEOUT seconds. Then MPESA_CIRCUIT_BREAKER_HALF_OPEN_CALLS
+# probe calls decide whether it recovered.
+MPESA_CIRCUIT_BREAKER_ENABLED = os.environ.get(
+    'MPESA_CIRCUIT_BREAKER_ENABLED', 'true'
+).lower() in ('1', 'true', 'yes')
+MPESA_CIRCUIT_BREAKER_WINDOW = int(os.environ.get('MPESA_CIRCUIT_BREAKER_WINDOW', '20'))
+MPESA_CIRCUIT_BREAKER_MIN_CALLS = int(os.environ.get('MPESA_CIRCUIT_BREAKER_MIN_CALLS', '10'))
+MPESA_CIRCUIT_BREAKER_FAILURE_THRESHOLD = float(
+    os.environ.get('MPESA_CIRCUIT_BREAKER_FAILURE_THRESHOLD', '0.5')
+)
+MPESA_CIRCUIT_BREAKER_SLOW_CALL = float(os.environ.get('MPESA_CIRCUIT_BREAKER_SLOW_CALL', '5'))
+MPESA_CIRCUIT_BREAKER_RESET_TIMEOUT = float(
+    os.environ.get('MPESA_CIRCUIT_BREAKER_RESET_TIMEOUT', '30')
+)
+MPESA_CIRCUIT_BREAKER_HALF_OPEN_CALLS = int(
+    os.environ.get('MPESA_CIRCUIT_BREAKER_HALF_OPEN_CALLS', '1')
+)
+
+# Async engine: kept-alive connections on its event loop, and threads for database work
+MPESA_ASYNC_POOL_SIZE = int(os.environ.get('MPESA_ASYNC_POOL_SIZE', '100'))
+ASYNC_DB_WORKERS = int(os.environ.get('ASYNC_DB_WORKERS', '4'))
+
+# STK push callbacks are written to the database in batches of this size,
+# or after this many seconds, whichever comes first
+CALLBACK_BATCH_SIZE = int(os.environ.get('CALLBACK_BATCH_SIZE', '100'))
+CALLBACK_FLUSH_INTERVAL = float(os.environ.get('CALLBACK_FLUSH_INTERVAL', '1.0'))
+
+# Reconciliation poller: pending transactions older than RECONCILE_MIN_AGE seconds
+# are queried every RECONCILE_INTERVAL seconds, up to RECONCILE_BATCH_SIZE per run,
+# with RECONCILE_CONCURRENCY queries in flight and at most RECONCILE_RATE per second.
+# A transaction that is still pending is retried after RECONCILE_BACKOFF seconds,
+# doubling up to RECONCILE_MAX_BACKOFF.
+RECONCILE_MIN_AGE = int(os.environ.get('RECONCILE_MIN_AGE', '60'))
+RECONCILE_INTERVAL = float(os.environ.get('RECONCILE_INTERVAL', '30'))
+RECONCILE_BATCH_SIZE = int(os.environ.get('RECONCILE_BATCH_SIZE', '100'))
+RECONCILE_CONCURRENCY = int(os.environ.get('RECONCILE_CONCURRENCY', '4'))
+RECONCILE_RATE = float(os.environ.get('RECONCILE_RATE', '5'))
+RECONCILE_BACKOFF = float(os.environ.get('RECONCILE_BACKOFF', '30'))
+RECONCILE_MAX_BACKOFF = float(os.environ.get('RECONCILE_MAX_BACKOFF', '900'))
+
+# STK push mode: 'sync' calls Daraja inside the request, 'accepted' queues the push
+# and answers 202 at once. Clients can also ask for a queued push per request with
+# a 'Prefer: respond-async' header. STK_QUEUE_WORKERS workers of STK_QUEUE_WORKER_TYPE
+# ('thread' or 'process') each claim up to STK_QUEUE_BATCH_SIZE queued pushes at a
+# time and poll every STK_QUEUE_POLL_INTERVAL seconds when the queue is empty.
+STK_PUSH_MODE = os.environ.get('STK_PUSH_MODE', 'sync')
+STK_QUEUE_WORKERS = int(os.environ.get('STK_QUEUE_WORKERS', '4'))
+STK_QUEUE_WORKER_TYPE = os.environ.get('STK_QUEUE_WORKER_TYPE', 'thread')
+STK_QUEUE_BATCH_SIZE = int(os.environ.get('STK_QUEUE_BATCH_SIZE', '10'))
+STK_QUEUE_POLL_INTERVAL = float(os.environ.get('STK_QUEUE_POLL_INTERVAL', '0.5'))
+
+# Amounts an STK push may ask for, in shillings; others are rejected before any Daraja call
+STK_PUSH_MIN_AMOUNT = int(os.environ.get('STK_PUSH_MIN_AMOUNT', '1'))
+STK_PUSH_MAX_AMOUNT = int(os.environ.get('STK_PUSH_MAX_AMOUNT', '250000'))
+
+# JSON encoder and decoder of request and response bodies: 'default' (the standard
+# library), 'orjson' (needs the orjson package) or a 'module:Class' JSON provider
+JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'default')
+
+# Idempotency-Key support: stored responses are replayed for IDEMPOTENCY_TTL seconds,
+# and the IDEMPOTENCY_CACHE_SIZE most recently used keys are also cached in memory
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '10000'))
+
+# Transaction listings return TRANSACTIONS_PAGE_SIZE transactions per page unless
+# asked for up to TRANSACTIONS_MAX_PAGE_SIZE; exports fetch EXPORT_CHUNK_SIZE rows at a time
+TRANSACTIONS_PAGE_SIZE = int(os.environ.get('TRANSACTIONS_PAGE_SIZE', '50'))
+TRANSACTIONS_MAX_PAGE_SIZE = int(os.environ.get('TRANSACTIONS_MAX_PAGE_SIZE', '500'))
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '1000'))
+
+# Bulk STK pushes: at most BULK_MAX_ITEMS items per request, sent BULK_CONCURRENCY at a
+# time and BULK_RATE per second per worker process, and inserted BULK_INSERT_BATCH_SIZE
+# transactions at a time
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', '1000'))
+BULK_CONCURRENCY = int(os.environ.get('BULK_CONCURRENCY', '8'))
+BULK_RATE = float(os.environ.get('BULK_RATE', '20'))
+BULK_INSERT_BATCH_SIZE = int(os.environ.get('BULK_INSERT_BATCH_SIZE', '100'))
+
+# Status query responses are cached per checkout request: STATUS_CACHE_FINAL_TTL
+# seconds once they carry a result, STATUS_CACHE_PENDING_TTL seconds while Daraja
+# still reports the payment as being processed
+STATUS_CACHE_SIZE = int(os.environ.get('STATUS_CACHE_SIZE', '10000'))
+STATUS_CACHE_PENDING_TTL = float(os.environ.get('STATUS_CACHE_PENDING_TTL', '2'))
+STATUS_CACHE_FINAL_TTL = float(os.environ.get('STATUS_CACHE_FINAL_TTL', '3600'))
+
+# State shared by the worker processes: with SHARED_STATE_URL set, the access token
+# and status query responses are also kept in a store every worker reads, so one
+# token fetch or status query serves them all. 'sqlite:///<path>' shares a SQLite
+# file between the workers of one host, 'redis://host:port/db' a Redis server
+# between hosts (needs the redis package) and 'memory://' keeps them in-process.
+SHARED_STATE_URL = os.environ.get('SHARED_STATE_URL', '')
+
+# Write-behind: with TRANSACTION_WRITE_BEHIND, accepted STK pushes are inserted in
+# batches of TRANSACTION_BATCH_SIZE, or after TRANSACTION_FLUSH_INTERVAL seconds,
+# instead of one commit per request
+TRANSACTION_WRITE_BEHIND = os.environ.get(
+    'TRANSACTION_WRITE_BEHIND', 'false'
+).lower() in ('1', 'true', 'yes')
+TRANSACTION_BATCH_SIZE = int(os.environ.get('TRANSACTION_BATCH_SIZE', '100'))
+TRANSACTION_FLUSH_INTERVAL = float(os.environ.get('TRANSACTION_FLUSH_INTERVAL', '0.5'))
+
+# Daily counts and amounts by status and shortcode in the transaction_summary table,
+# updated with every transaction written; rebuild it with `flask summary rebuild`
+TRANSACTION_SUMMARY_ENABLED = os.environ.get(
+    'TRANSACTION_SUMMARY_ENABLED', 'true'
+).lower() in ('1', 'true', 'yes')
+
+# Archival: `flask archive run` moves transactions with a final status created more
+# than ARCHIVE_AFTER_DAYS days ago to the archived_transaction table, ARCHIVE_BATCH_SIZE
+# at a time with ARCHIVE_BATCH_PAUSE seconds between batches. Lookups by checkout
+# request ID fall back to the archive.
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '1000'))
+ARCHIVE_BATCH_PAUSE = float(os.environ.get('ARCHIVE_BATCH_PAUSE', '0.1'))
+
+# Request, Daraja and database timings served on /metrics
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
 # SQLite database URI
 if os.environ.get('FLASK_ENV') == 'testing':
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
@@ -27,3 +199,21 @@ else:
 
 # Disable Flask-SQLAlchemy modification tracking
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Database connection pool of each process: DB_POOL_SIZE kept-open connections plus up
+# to DB_MAX_OVERFLOW more under load, waiting DB_POOL_TIMEOUT seconds for a free one.
+# Connections are replaced after DB_POOL_RECYCLE seconds and, with DB_POOL_PRE_PING,
+# tested before use. DB_STATEMENT_TIMEOUT (milliseconds, 0 for none) applies on
+# PostgreSQL and MySQL.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', '30000'))
+
+# SQLite files: journal mode and synchronous pragmas (empty to keep SQLite's defaults)
+# and the milliseconds a write waits for another connection's lock
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'))
@@ -0,0 +1,174 @@
+"""
+Module providing a pooled, keep-alive HTTP client for the Daraja API.
+"""
+
+import logging
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# Daraja endpoints by name: HTTP method, path and whether the call is safe to retry
+ENDPOINTS = {
+    'oauth': ('GET', '/oauth/v1/generate', True),
+    'stk_push': ('POST', '/mpesa/stkpush/v1/processrequest', False),
+    'stk_query': ('POST', '/mpesa/stkpushquery/v1/query', True),
+}
+
+# (connect, read) timeout in seconds for endpoints without a configured one
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Upstream responses worth retrying for idempotent calls, and counted as failures
+# by the circuit breakers. 500 is left out on purpose: Daraja answers a status
+# query for a payment that is still being processed with a 500 (errorCode
+# 500.001.1001), and asking again at once won't change that.
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+# Longest Retry-After in seconds honoured before retrying
+MAX_RETRY_AFTER = 30.0
+
+
+def retry_after(headers):
+    """Seconds to wait asked for by a ``Retry-After`` header, or 0 if there is none.
+
+    Only the delay-seconds form is understood; HTTP dates are ignored.
+    """
+    try:
+        return min(max(float(headers.get('Retry-After')), 0.0), MAX_RETRY_AFTER)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class DarajaClient:
+    """
+    HTTP client that sends every Daraja call through one pooled session per process.
+
+    Attributes:
+        base_url (str): Base URL of the Daraja API.
+        pool_size (int): Maximum number of kept-alive connections to the Daraja host.
+        timeouts (dict): ``(connect, read)`` timeout per endpoint name.
+        retries (int): Extra attempts for idempotent calls on connection errors,
+            timeouts and retryable statuses.
+        backoff (float): Base delay in seconds, doubled after every retry.
+        guards (dict): ``guards.EndpointGuard`` by endpoint name, applied to
+            every attempt of a call.
+    """
+
+    def __init__(self, base_url, pool_size=10, timeouts=None, retries=2, backoff=0.5,
+                 guards=None):
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeouts = dict(timeouts or {})
+        self.retries = retries
+        self.backoff = backoff
+        self.guards = guards or {}
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    @classmethod
+    def from_config(cls, config, pool_size=None, guards=None):
+        """Create a client from the application configuration.
+
+        Args:
+            config (dict): The application configuration.
+            pool_size (int): Overrides ``MPESA_HTTP_POOL_SIZE``.
+            guards (dict): Rate limits and circuit breakers of the endpoints.
+        """
+        return cls(
+            config['MPESA_API_BASE_URL'],
+            pool_size=pool_size or config['MPESA_HTTP_POOL_SIZE'],
+            timeouts=config['MPESA_HTTP_TIMEOUTS'],
+            retries=config['MPESA_HTTP_RETRIES'],
+            backoff=config['MPESA_HTTP_BACKOFF'],
+            guards=guards
+        )
+
+    @property
+    def session(self):
+        """Pooled session for the current process, recreated after a fork."""
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._create_session()
+                    self._pid = pid
+        return self._session
+
+    def _create_session(self):
+        """Build a session whose adapter keeps up to ``pool_size`` connections alive."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def request(self, endpoint, retries=None, **kwargs):
+        """Call a Daraja endpoint.
+
+        Args:
+            endpoint (str): Name of the endpoint in ``ENDPOINTS``.
+            retries (int): Overrides ``self.retries`` for this call.
+            **kwargs: Passed through to ``requests.Session.request``.
+
+        Returns:
+            requests.Response: The upstream response.
+
+        Raises:
+            guards.CallRejectedError: If the endpoint's circuit breaker or rate
+                limit turns an attempt away.
+        """
+        method, path, idempotent = ENDPOINTS[endpoint]
+        timeout = self.timeouts.get(endpoint, DEFAULT_TIMEOUT)
+        retries = self.retries if retries is None else retries
+        attempts = 1 + (retries if idempotent else 0)
+        guard = self.guards.get(endpoint)
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            delay = self.backoff * 2 ** attempt
+            if guard is not None:
+                guard.admit()
+            started = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method, f"{self.base_url}{path}", timeout=timeout, **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout) as error:
+                elapsed = time.perf_counter() - started
+                metrics.DARAJA_REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, status='error')
+                if guard is not None:
+                    guard.record(True, elapsed)
+                if last_attempt:
+                    raise
+                logger.warning("Daraja %s call failed, retrying: %s", endpoint, error)
+            except BaseException:
+                if guard is not None:
+                    guard.cancel()
+                raise
+            else:
+                elapsed = time.perf_counter() - started
+                metrics.DARAJA_REQUEST_SECONDS.observe(
+                    elapsed, endpoint=endpoint, status=response.status_code
+                )
+                if guard is not None:
+                    guard.record(response.status_code in RETRY_STATUSES, elapsed)
+                if last_attempt or response.status_code not in RETRY_STATUSES:
+                    return response
+                logger.warning(
+                    "Daraja %s call returned %s, retrying", endpoint, response.status_code
+                )
+                delay = max(delay, retry_after(response.headers))
+            time.sleep(delay)
+        return None
+
+    def close(self):
+        """Close the pooled connections of the current session."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
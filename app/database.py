@@ -0,0 +1,75 @@
+"""
+Module providing the database engine configuration.
+
+``engine_options`` turns the ``DB_*`` settings into the engine arguments
+Flask-SQLAlchemy passes to ``create_engine``, keeping only the ones the pool
+of the configured database accepts. ``init_app`` sets the ``SQLITE_*``
+pragmas on every new SQLite connection: write-ahead logging lets readers
+carry on while one connection writes, and ``synchronous=NORMAL`` only syncs
+the log at checkpoints instead of on every commit.
+"""
+
+import functools
+import sqlalchemy as sa
+from app import db
+
+
+def _is_memory(url):
+    """Whether ``url`` is an in-memory SQLite database."""
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config):
+    """Engine arguments for the database of ``config``.
+
+    Returns:
+        dict: Options for ``SQLALCHEMY_ENGINE_OPTIONS``.
+    """
+    url = sa.engine.make_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+    if _is_memory(url):
+        # One shared connection (StaticPool): there is nothing to size
+        return options
+    options.update(
+        pool_size=config['DB_POOL_SIZE'],
+        max_overflow=config['DB_MAX_OVERFLOW'],
+        pool_timeout=config['DB_POOL_TIMEOUT'],
+        pool_recycle=config['DB_POOL_RECYCLE'],
+    )
+    timeout = config['DB_STATEMENT_TIMEOUT']
+    backend = url.get_backend_name()
+    if backend == 'postgresql' and timeout:
+        options['connect_args'] = {'options': f'-c statement_timeout={timeout}'}
+    elif backend == 'mysql' and timeout:
+        options['connect_args'] = {'init_command': f'SET SESSION max_execution_time={timeout}'}
+    elif backend == 'sqlite':
+        # SQLite has no statement timeout; this is how long a write waits for the lock
+        options['connect_args'] = {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000}
+    return options
+
+
+def _set_sqlite_pragmas(journal_mode, synchronous, busy_timeout, dbapi_connection, _record):
+    """Configure a new SQLite connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        if journal_mode:
+            cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+        if synchronous:
+            cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+    finally:
+        cursor.close()
+
+
+def init_app(app):
+    """Set the SQLite pragmas on the connections of ``app``'s file databases."""
+    config = app.config
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name != 'sqlite' or _is_memory(engine.url):
+            continue
+        sa.event.listen(engine, 'connect', functools.partial(
+            _set_sqlite_pragmas, config['SQLITE_JOURNAL_MODE'],
+            config['SQLITE_SYNCHRONOUS'], config['SQLITE_BUSY_TIMEOUT']
+        ))
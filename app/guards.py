@@ -0,0 +1,264 @@
+"""
+Module providing the rate limits and circuit breakers guarding each Daraja endpoint.
+
+When Daraja degrades, calls that wait out their timeouts tie up every worker
+and take the whole service down with it. A circuit breaker watches the
+outcome of the recent calls of an endpoint and, once too many of them failed
+or were slow, turns further calls away at once instead of sending them. After
+a cool-down it lets a few probe calls through; if they succeed the circuit
+closes again, otherwise it stays open for another cool-down.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+import requests
+from app import metrics
+from app.ratelimit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Circuit breaker states, and the value of each on the state gauge
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CallRejectedError(requests.RequestException):
+    """A Daraja call was turned away without being sent.
+
+    Attributes:
+        endpoint (str): Name of the endpoint.
+        retry_after (float): Seconds after which the call may get through.
+        status_code (int): HTTP status of the response telling the client so.
+    """
+
+    status_code = 503
+
+    def __init__(self, message, endpoint, retry_after):
+        super().__init__(message)
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(CallRejectedError):
+    """The circuit breaker of the endpoint is open."""
+
+    status_code = 503
+
+
+class EndpointRateLimitedError(CallRejectedError):
+    """The endpoint's rate limit did not let the call through in time."""
+
+    status_code = 429
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one endpoint, judging it by its last ``window`` calls.
+
+    A call is bad if it failed or took ``slow_call_seconds`` or longer. Once
+    at least ``min_calls`` calls are in the window and ``failure_threshold``
+    or more of them were bad, the circuit opens for ``reset_timeout`` seconds.
+    It then half-opens, letting ``half_open_calls`` probe calls through:
+    the circuit closes if they are all good, and opens again on a bad one.
+    """
+
+    def __init__(self, name, window=20, min_calls=10, failure_threshold=0.5,
+                 slow_call_seconds=5.0, reset_timeout=30.0, half_open_calls=1,
+                 clock=time.monotonic):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (failed, slow) of the last calls
+        self._calls = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = None
+        self._probes = 0
+        self._probe_successes = 0
+        metrics.CIRCUIT_BREAKER_STATE.set(STATE_VALUES[CLOSED], endpoint=name)
+
+    @property
+    def state(self):
+        """Current state: ``closed``, ``open`` or ``half_open``."""
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        """Half-open the circuit once its cool-down is over. Called with the lock held."""
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, state):
+        """Move to ``state``. Called with the lock held."""
+        self._state = state
+        self._probes = 0
+        self._probe_successes = 0
+        if state == OPEN:
+            self._opened_at = self._clock()
+        elif state == CLOSED:
+            self._calls.clear()
+        metrics.CIRCUIT_BREAKER_STATE.set(STATE_VALUES[state], endpoint=self.name)
+        log = logger.warning if state == OPEN else logger.info
+        log("Circuit breaker of Daraja %s is now %s", self.name, state)
+
+    def admit(self):
+        """Let a call through, or turn it away.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with its
+                probe calls already in flight.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return
+            # While half-open, the probes in flight will soon decide the state
+            retry_after = (
+                self._opened_at + self.reset_timeout - self._clock() if state == OPEN else 1.0
+            )
+        metrics.DARAJA_REJECTED_CALLS.inc(endpoint=self.name, reason='circuit_open')
+        raise CircuitOpenError(
+            f"Daraja {self.name} calls are failing, try again later.",
+            self.name, max(retry_after, 0.0)
+        )
+
+    def cancel(self):
+        """Give back the admission of a call that was not made after all."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def record(self, failed, duration):
+        """Record the outcome of an admitted call.
+
+        Args:
+            failed (bool): Whether the call failed.
+            duration (float): Seconds the call took.
+        """
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            state = self._current_state()
+            if state == HALF_OPEN:
+                if failed or slow:
+                    self._transition(OPEN)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self._transition(CLOSED)
+            elif state == CLOSED:
+                self._calls.append((failed, slow))
+                bad = sum(1 for call in self._calls if call[0] or call[1])
+                if len(self._calls) >= self.min_calls and \
+                        bad >= self.failure_threshold * len(self._calls):
+                    self._transition(OPEN)
+
+    def snapshot(self):
+        """State and recent outcomes of the breaker, as served on ``/circuit_breakers``."""
+        with self._lock:
+            state = self._current_state()
+            snapshot = {
+                'state': state,
+                'calls': len(self._calls),
+                'failed_calls': sum(1 for failed, _ in self._calls if failed),
+                'slow_calls': sum(1 for _, slow in self._calls if slow),
+                'retry_after': None,
+            }
+            if state == OPEN:
+                snapshot['retry_after'] = round(
+                    self._opened_at + self.reset_timeout - self._clock(), 3
+                )
+        return snapshot
+
+    def reset(self):
+        """Close the circuit and forget the recent calls."""
+        with self._lock:
+            self._transition(CLOSED)
+
+
+class EndpointGuard:
+    """
+    Rate limit and circuit breaker of one Daraja endpoint.
+
+    Attributes:
+        endpoint (str): Name of the endpoint.
+        limiter (RateLimiter): Calls per second let through.
+        breaker (CircuitBreaker): Circuit breaker of the endpoint; None for none.
+        queue_timeout (float): Seconds a call waits for the rate limit.
+    """
+
+    def __init__(self, endpoint, limiter=None, breaker=None, queue_timeout=1.0):
+        self.endpoint = endpoint
+        self.limiter = limiter or RateLimiter(0)
+        self.breaker = breaker
+        self.queue_timeout = queue_timeout
+
+    @property
+    def limited(self):
+        """Whether ``admit`` may wait for the rate limit."""
+        return self.limiter.rate > 0
+
+    def admit(self):
+        """Let a call through once the circuit and the rate limit allow it.
+
+        Raises:
+            CircuitOpenError: If the circuit breaker turns the call away.
+            EndpointRateLimitedError: If the rate limit doesn't let it through
+                within ``queue_timeout``.
+        """
+        if self.breaker is not None:
+            self.breaker.admit()
+        if not self.limiter.acquire(timeout=self.queue_timeout):
+            if self.breaker is not None:
+                self.breaker.cancel()
+            metrics.DARAJA_REJECTED_CALLS.inc(endpoint=self.endpoint, reason='rate_limited')
+            raise EndpointRateLimitedError(
+                f"Too many Daraja {self.endpoint} calls, try again later.",
+                self.endpoint, 1 / self.limiter.rate
+            )
+
+    def cancel(self):
+        """Give back the admission of a call that was not made after all."""
+        if self.breaker is not None:
+            self.breaker.cancel()
+
+    def record(self, failed, duration):
+        """Record the outcome of an admitted call."""
+        if self.breaker is not None:
+            self.breaker.record(failed, duration)
+
+
+def from_config(config):
+    """Create the guard of every endpoint with a rate limit or circuit breaker.
+
+    Returns:
+        dict: ``EndpointGuard`` by endpoint name.
+    """
+    guards = {}
+    for endpoint, rate in config['MPESA_RATE_LIMITS'].items():
+        breaker = None
+        if config['MPESA_CIRCUIT_BREAKER_ENABLED']:
+            breaker = CircuitBreaker(
+                endpoint,
+                window=config['MPESA_CIRCUIT_BREAKER_WINDOW'],
+                min_calls=config['MPESA_CIRCUIT_BREAKER_MIN_CALLS'],
+                failure_threshold=config['MPESA_CIRCUIT_BREAKER_FAILURE_THRESHOLD'],
+                slow_call_seconds=config['MPESA_CIRCUIT_BREAKER_SLOW_CALL'],
+                reset_timeout=config['MPESA_CIRCUIT_BREAKER_RESET_TIMEOUT'],
+                half_open_calls=config['MPESA_CIRCUIT_BREAKER_HALF_OPEN_CALLS'],
+            )
+        guards[endpoint] = EndpointGuard(
+            endpoint, RateLimiter(rate), breaker, config['MPESA_RATE_LIMIT_TIMEOUT']
+        )
+    return guards
@@ -0,0 +1,163 @@
+"""
+Module providing Idempotency-Key support for STK push requests.
+
+A client that retries an STK push after a timeout sends the same
+``Idempotency-Key`` header. The first request with a key runs normally and its
+accepted response is stored; every later request with the key gets the stored
+response back without calling Daraja or writing to the database.
+"""
+
+import hashlib
+import json
+from datetime import timedelta
+from sqlalchemy.exc import IntegrityError
+from app import db, models
+from app.cache import SingleFlight, TTLCache
+
+
+class IdempotencyError(Exception):
+    """A request cannot be served under its idempotency key."""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def fingerprint(body):
+    """SHA-256 of a JSON request body, independent of key order."""
+    canonical = json.dumps(body, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Runs a function at most once per idempotency key.
+
+    Stored responses live in the ``idempotency_key`` table and, for the most
+    recently used keys, in an in-process LRU cache, so replays usually don't
+    reach the database at all. Concurrent requests with the same key in one
+    process wait for the first; a request with a key that another process is
+    still running gets a 409.
+
+    Must be used inside an application context.
+
+    Attributes:
+        ttl (int): Seconds a stored response is replayed.
+        cache (TTLCache): Recently used stored responses.
+    """
+
+    def __init__(self, ttl=86400, cache_size=10000):
+        self.ttl = ttl
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self._flights = SingleFlight()
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a store from the application configuration."""
+        return cls(ttl=config['IDEMPOTENCY_TTL'], cache_size=config['IDEMPOTENCY_CACHE_SIZE'])
+
+    def execute(self, key, request_hash, func):
+        """Return the stored response for ``key``, or call ``func`` to produce it.
+
+        Args:
+            key (str): Idempotency key sent by the client.
+            request_hash (str): Fingerprint of the request body.
+            func (callable): Returns a ``(response, status_code)`` tuple. Only
+                successful responses are stored, so a failed request can be retried.
+
+        Returns:
+            tuple: The response, its status code and whether it was replayed.
+
+        Raises:
+            IdempotencyError: If the key was used with a different request body,
+                or the first request with it is still running in another process.
+        """
+        record = self.cache.get(key)
+        replayed = record is not None
+        if not replayed:
+            flight = self._flights.do(key, lambda: self._execute(key, request_hash, func))
+            record, replayed = flight
+        stored_hash, response, status_code = record
+        if stored_hash != request_hash:
+            raise IdempotencyError(
+                'Idempotency-Key was already used with a different request.', 422
+            )
+        return response, status_code, replayed
+
+    def _execute(self, key, request_hash, func):
+        """Load the stored response of ``key`` or run ``func`` under a reservation."""
+        stored = self._load(key)
+        if stored is not None:
+            return stored, True
+
+        if not self._reserve(key, request_hash):
+            # Another process claimed the key first
+            stored = self._load(key)
+            if stored is None:
+                raise IdempotencyError(
+                    'A request with this Idempotency-Key is still being processed.', 409
+                )
+            return stored, True
+        try:
+            response, status_code = func()
+        except Exception:
+            self._release(key)
+            raise
+        record = (request_hash, response, status_code)
+        if status_code < 300:
+            self._complete(key, response, status_code)
+            self.cache.set(key, record)
+        else:
+            self._release(key)
+        return record, False
+
+    def _cutoff(self):
+        """Creation time before which stored responses have expired."""
+        return models.utcnow() - timedelta(seconds=self.ttl)
+
+    def _load(self, key):
+        """Read an unexpired stored response from the database into the cache."""
+        row = db.session.get(models.IdempotencyKey, key)
+        if row is None or row.created_at < self._cutoff():
+            return None
+        if row.status_code is None:
+            raise IdempotencyError(
+                'A request with this Idempotency-Key is still being processed.', 409
+            )
+        record = (row.request_hash, row.response, row.status_code)
+        age = (models.utcnow() - row.created_at).total_seconds()
+        self.cache.set(key, record, ttl=self.ttl - age)
+        return record
+
+    def _reserve(self, key, request_hash):
+        """Claim ``key`` with an in-progress row, replacing an expired one.
+
+        Returns:
+            bool: Whether the key was claimed.
+        """
+        table = models.IdempotencyKey.__table__
+        db.session.execute(table.delete().where(
+            table.c.key == key, table.c.created_at < self._cutoff()
+        ))
+        db.session.add(models.IdempotencyKey(key=key, request_hash=request_hash))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return False
+        return True
+
+    def _complete(self, key, response, status_code):
+        """Store the response of ``key``."""
+        row = db.session.get(models.IdempotencyKey, key)
+        row.status_code = status_code
+        row.response = response
+        db.session.commit()
+
+    def _release(self, key):
+        """Drop the reservation of ``key`` so that the request can be retried."""
+        db.session.rollback()
+        db.session.execute(models.IdempotencyKey.__table__.delete().where(
+            models.IdempotencyKey.key == key
+        ))
+        db.session.commit()
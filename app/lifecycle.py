@@ -0,0 +1,53 @@
+"""
+Module providing the per-worker setup and teardown of the production server.
+
+Gunicorn imports the application once in its master process and forks the
+workers from it (``preload_app``). Each worker therefore starts its own
+database and Daraja connection pools instead of sharing the master's sockets,
+and finishes its in-flight Daraja calls and buffered writes before it exits.
+"""
+
+import logging
+from app import clients, db, services
+
+logger = logging.getLogger(__name__)
+
+
+def init_worker(app):
+    """Give a freshly forked worker its own database and Daraja connection pools."""
+    with app.app_context():
+        # Forget the inherited connections without closing them under the master
+        db.engine.dispose(close=False)
+        # Each client builds a new pooled session when it sees the worker's PID
+        for tenant in services.tenant_registry:
+            tenant.client.session  # pylint: disable=pointless-statement
+    logger.info("Worker initialized")
+
+
+def shutdown_worker(app, timeout=30.0):
+    """Drain in-flight work before a worker exits.
+
+    Requests being served are drained by the server itself; this waits up to
+    ``timeout`` seconds for the calls on the async engine and writes out the
+    buffered transactions, then the buffered callbacks. Objects the worker
+    never used are left alone.
+    """
+    objects = clients.of(app)
+    engine = objects.peek('async_engine')
+    if engine is not None:
+        engine.stop(timeout)
+    transaction_buffer = objects.peek('transaction_buffer')
+    if transaction_buffer is not None:
+        transaction_buffer.close()
+    callback_buffer = objects.peek('callback_buffer')
+    if callback_buffer is not None:
+        callback_buffer.close()
+    registry = objects.peek('tenants')
+    daraja_clients = {objects.peek('daraja_client')} - {None}
+    if registry is not None:
+        daraja_clients.update(tenant.client for tenant in registry)
+    for client in daraja_clients:
+        client.close()
+    with app.app_context():
+        db.engine.dispose()
+    logger.info("Worker drained")
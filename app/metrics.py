@@ -0,0 +1,331 @@
+"""
+Module providing in-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms live in memory, per process, and are rendered
+by the ``/metrics`` endpoint. An update is one lock and one dictionary lookup,
+cheap enough to leave on in production.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import ContextDecorator
+from flask import g, request
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Latency buckets in seconds, from sub-millisecond database writes to slow Daraja calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    """Escape a label value for the exposition format."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    """Render a label set, e.g. ``{endpoint="stk_push"}``."""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    """Render a sample value."""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """
+    Collection of metrics rendered together.
+
+    Attributes:
+        enabled (bool): Whether metric updates are recorded; turning it off makes
+            every update a no-op, e.g. to measure the cost of instrumentation.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self._metrics = []
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add a metric to the registry and return it."""
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_cache(self, name, cache):
+        """Report the ``hits`` and ``misses`` counters of a cache under ``name``."""
+        with self._lock:
+            self._caches[name] = cache
+
+    def render(self):
+        """Render every metric in the text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics)
+            caches = dict(self._caches)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for field, documentation in (('hits', 'Lookups answered from the cache.'),
+                                     ('misses', 'Lookups the cache could not answer.')):
+            lines.append(f'# HELP cache_{field}_total {documentation}')
+            lines.append(f'# TYPE cache_{field}_total counter')
+            for name, cache in sorted(caches.items()):
+                lines.append(
+                    f'cache_{field}_total{_format_labels([("cache", name)])} '
+                    f'{getattr(cache, field)}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+# Metrics of this process
+REGISTRY = Registry()
+
+
+class Metric:
+    """Base class of labelled metrics."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._registry = registry
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        """Label values in the order of ``labelnames``.
+
+        Raises:
+            ValueError: If the labels don't match ``labelnames``.
+        """
+        if len(labels) != len(self.labelnames):
+            raise ValueError(
+                f'{self.name} takes the labels {self.labelnames}, got {tuple(labels)}.'
+            )
+        try:
+            return tuple(str(labels[name]) for name in self.labelnames)
+        except KeyError as error:
+            raise ValueError(f'{self.name} takes the labels {self.labelnames}.') from error
+
+    def samples(self):
+        """Yield ``(suffix, labels, value)`` for every sample of the metric."""
+        raise NotImplementedError
+
+    def render(self):
+        """Render the metric in the text exposition format."""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, labels, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+    def _labelled(self, key):
+        """Pair label names with the values of ``key``."""
+        return list(zip(self.labelnames, key))
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Add ``amount`` to the counter of ``labels``."""
+        if not self._registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Current value of the counter of ``labels``."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield '', self._labelled(key), value
+
+
+class Gauge(Counter):
+    """Value that goes up and down."""
+
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        """Subtract ``amount`` from the gauge of ``labels``."""
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        """Set the gauge of ``labels`` to ``value``."""
+        if not self._registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class _Timer(ContextDecorator):
+    """Observes the seconds spent in a block or function on a histogram."""
+
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+        self._started = threading.local()
+
+    def __enter__(self):
+        self._started.value = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._started.value, **self._labels)
+        return False
+
+
+class Histogram(Metric):
+    """Distribution of observed values over cumulative buckets."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS,
+                 registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """Record one observation for ``labels``."""
+        if not self._registry.enabled:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), count and sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    def time(self, **labels):
+        """Context manager and decorator observing the seconds spent in it."""
+        self._key(labels)
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        """Number of observations for ``labels``."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[1] if state else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted(
+                (key, (list(counts), count, total))
+                for key, (counts, count, total) in self._values.items()
+            )
+        for key, (counts, count, total) in values:
+            labels = self._labelled(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield '_bucket', labels + [('le', _format_value(float(bound)))], cumulative
+            yield '_count', labels, count
+            yield '_sum', labels, total
+
+
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests being handled by this process.'
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request, by route.',
+    ('endpoint', 'method', 'status')
+)
+TOKEN_FETCH_SECONDS = Histogram(
+    'mpesa_token_fetch_seconds', 'Time spent fetching an access token from the OAuth endpoint.'
+)
+DARAJA_REQUEST_SECONDS = Histogram(
+    'mpesa_daraja_request_seconds', 'Time spent on one Daraja HTTP call, by endpoint and status.',
+    ('endpoint', 'status')
+)
+DARAJA_DECODE_SECONDS = Histogram(
+    'mpesa_daraja_decode_seconds', 'Time spent parsing the JSON body of a Daraja response.',
+    ('endpoint',)
+)
+DB_OPERATION_SECONDS = Histogram(
+    'mpesa_db_operation_seconds', 'Time spent on a database operation, commit included.',
+    ('operation',)
+)
+RESPONSE_CODES = Counter(
+    'mpesa_response_codes_total',
+    'Daraja responses by endpoint and ResponseCode, or errorCode for rejected calls.',
+    ('endpoint', 'code')
+)
+RESULT_CODES = Counter(
+    'mpesa_result_codes_total', 'Transaction results by source and ResultCode.',
+    ('source', 'code')
+)
+
+CIRCUIT_BREAKER_STATE = Gauge(
+    'mpesa_circuit_breaker_state',
+    'State of the circuit breaker of a Daraja endpoint: 0 closed, 1 half-open, 2 open.',
+    ('endpoint',)
+)
+DARAJA_REJECTED_CALLS = Counter(
+    'mpesa_daraja_rejected_calls_total',
+    'Daraja calls turned away without being sent, by endpoint and reason.',
+    ('endpoint', 'reason')
+)
+
+
+def count_response(endpoint, response_data):
+    """Count a Daraja response by its ResponseCode, or errorCode if it was rejected."""
+    if isinstance(response_data, dict):
+        code = response_data.get('ResponseCode', response_data.get('errorCode', 'none'))
+    else:
+        code = 'none'
+    RESPONSE_CODES.inc(endpoint=endpoint, code=code)
+
+
+def _before_request():
+    """Start timing a request."""
+    g.metrics_started = time.perf_counter()
+    HTTP_REQUESTS_IN_FLIGHT.inc()
+
+
+def _after_request(response):
+    """Remember the status of the response for the teardown."""
+    g.metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(_error=None):
+    """Observe the time spent on a request, failed ones included."""
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    HTTP_REQUESTS_IN_FLIGHT.dec()
+    HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        endpoint=request.endpoint or 'unmatched',
+        method=request.method,
+        status=g.pop('metrics_status', 500)
+    )
+
+
+def init_app(app):
+    """Time every request handled by ``app`` and honour ``METRICS_ENABLED``."""
+    REGISTRY.enabled = app.config.get('METRICS_ENABLED', True)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
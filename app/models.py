@@ -1,9 +1,67 @@
 """
 Module: Transactions
 """
+from datetime import datetime, timedelta, timezone
 from app import db
 
-class MpesaTransaction(db.Model):
+# Transaction statuses; every status other than PENDING is final
+PENDING = 'Pending'
+COMPLETED = 'Completed'
+CANCELLED = 'Cancelled'
+TIMEOUT = 'Timeout'
+INSUFFICIENT_FUNDS = 'Insufficient Funds'
+FAILED = 'Failed'
+TERMINAL_STATUSES = frozenset({COMPLETED, CANCELLED, TIMEOUT, INSUFFICIENT_FUNDS, FAILED})
+
+# Statuses of a queued STK push request
+QUEUED = 'Queued'
+PROCESSING = 'Processing'
+SENT = 'Sent'
+
+# M-Pesa reports times in East Africa Time, which has no daylight saving
+MPESA_UTC_OFFSET = timedelta(hours=3)
+
+def utcnow():
+    """Current UTC time as a naive datetime, the way it is stored in the database."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def parse_mpesa_time(value):
+    """Convert an M-Pesa ``YYYYMMDDHHMMSS`` time to a naive UTC datetime.
+
+    Returns:
+        datetime: The time in UTC, or None if ``value`` is empty or malformed.
+    """
+    try:
+        return datetime.strptime(str(value), '%Y%m%d%H%M%S') - MPESA_UTC_OFFSET
+    except ValueError:
+        return None
+
+class TransactionColumns:
+    """Columns of a transaction, shared by the live and the archived transaction tables."""
+    id = db.Column(db.Integer, primary_key=True)
+    full_name = db.Column(db.String(50), nullable=True)
+    phone_number = db.Column(db.String(13), nullable=False)
+    amount = db.Column(db.Integer, nullable=False)
+    checkout_request_id = db.Column(db.String(100), nullable=False, unique=True)
+    shortcode = db.Column(db.String(20), nullable=True)
+    mpesa_receipt_number = db.Column(db.String(20), nullable=True)
+    transaction_date = db.Column(db.String(100), nullable=True)
+    transaction_time = db.Column(db.DateTime, nullable=True)
+    status = db.Column(db.String(20), default=PENDING)
+    result_code = db.Column(db.String(10), nullable=True)
+    result_desc = db.Column(db.String(255), nullable=True)
+    # Set by the application in UTC; a server default would use the database's time zone
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    def __repr__(self):
+        """
+        String representation of the transaction.
+        """
+        return f"{type(self).__name__}(id={self.id}, full_name='{self.full_name}', "\
+               f"phone_number='{self.phone_number}', amount={self.amount})"
+
+class MpesaTransaction(TransactionColumns, db.Model):
     """
     Represents a transaction made through the M-Pesa service.
 
@@ -14,24 +72,136 @@ class MpesaTransaction(db.Model):
             Format: "<country_code><phone_number>" (e.g., "254700000000")
         amount (int): Amount of money involved in the transaction.
         checkout_request_id (str): Unique identifier for the checkout request.
+        shortcode (str): Shortcode of the tenant paid; None for the default tenant.
         mpesa_receipt_number (str): Receipt number provided by M-Pesa.
-        transaction_date (str): Date and time of the transaction.
+        transaction_date (str): Date and time of the transaction as reported by M-Pesa.
+        transaction_time (datetime): ``transaction_date`` converted to UTC.
         status (str): Status of the transaction (e.g., 'Pending', 'Completed').
+        result_code (str): ResultCode reported by M-Pesa for the transaction.
         result_desc (str): Description of the result of the transaction.
-        timestamp (datetime): Timestamp of when the transaction was created.
+        created_at (datetime): When the transaction was created, in UTC.
+        updated_at (datetime): When the transaction last changed, in UTC.
+    """
+    __table_args__ = (
+        # Finds stale pending transactions for reconciliation and lists by status
+        db.Index('ix_mpesa_transaction_status_created_at', 'status', 'created_at'),
+        # Lists the transactions of a customer
+        db.Index('ix_mpesa_transaction_phone_number_created_at', 'phone_number', 'created_at'),
+        # Date range reports on when payments were made
+        db.Index('ix_mpesa_transaction_transaction_time', 'transaction_time'),
+        # Unfiltered listings and exports page through (created_at, id)
+        db.Index('ix_mpesa_transaction_created_at_id', 'created_at', 'id'),
+    )
+
+class ArchivedTransaction(TransactionColumns, db.Model):
+    """
+    A transaction with a final status moved out of ``mpesa_transaction`` by the archiver.
+
+    Has the columns of ``MpesaTransaction``, keeping its ``id``, and when it was archived.
+
+    Attributes:
+        archived_at (datetime): When the transaction was archived, in UTC.
+    """
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    __table_args__ = (
+        # Listings and exports of the archive page through (created_at, id)
+        db.Index('ix_archived_transaction_created_at_id', 'created_at', 'id'),
+        # Lists the archived transactions of a customer
+        db.Index('ix_archived_transaction_phone_number_created_at', 'phone_number', 'created_at'),
+    )
+
+class TransactionSummary(db.Model):
+    """
+    Number and total amount of the transactions created on one day with one status.
+
+    Kept up to date as transactions are recorded and change status (see ``app.summary``).
+
+    Attributes:
+        day (date): Day the transactions were created, in UTC.
+        status (str): Status of the transactions.
+        shortcode (str): Shortcode of their tenant; '' for transactions stored without one.
+        count (int): Number of transactions.
+        amount (int): Sum of their amounts.
+    """
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    shortcode = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"TransactionSummary(day={self.day}, status='{self.status}', count={self.count})"
+
+class StkPushRequest(db.Model):
+    """
+    An STK push accepted by the API and waiting to be sent to M-Pesa by a queue worker.
+
+    Attributes:
+        id (int): Unique identifier returned to the client.
+        full_name (str): Full name of the customer.
+        phone_number (str): Phone number of the customer.
+        amount (int): Amount to be paid.
+        shortcode (str): Shortcode of the tenant to pay; None for the default tenant.
+        status (str): 'Queued', 'Processing', 'Sent' or 'Failed'.
+        claimed_by (str): Token of the worker batch that claimed the request.
+        checkout_request_id (str): Checkout request ID returned by M-Pesa once sent.
+        response (dict): Response of the STK push request.
+        error (str): Why the request could not be sent.
+        created_at (datetime): When the request was accepted, in UTC.
+        updated_at (datetime): When the request last changed status, in UTC.
     """
     id = db.Column(db.Integer, primary_key=True)
     full_name = db.Column(db.String(50), nullable=True)
     phone_number = db.Column(db.String(13), nullable=False)
     amount = db.Column(db.Integer, nullable=False)
-    checkout_request_id = db.Column(db.String(100), nullable=False, unique=True)
-    transaction_date = db.Column(db.String(100), nullable=True)
-    status = db.Column(db.String(20), default='Pending')
-    result_desc = db.Column(db.String(255), nullable=True)
+    shortcode = db.Column(db.String(20), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default=QUEUED)
+    claimed_by = db.Column(db.String(32), nullable=True)
+    checkout_request_id = db.Column(db.String(100), nullable=True)
+    response = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        # Workers claim the oldest queued requests first
+        db.Index('ix_stk_push_request_status_id', 'status', 'id'),
+    )
+
+    def to_dict(self):
+        """Public representation returned by the status endpoint."""
+        return {
+            'request_id': self.id,
+            'status': self.status,
+            'checkout_request_id': self.checkout_request_id,
+            'response': self.response,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+        }
 
     def __repr__(self):
-        """
-        String representation of the MpesaTransaction object.
-        """
-        return f"MpesaTransaction(id={self.id}, full_name='{self.full_name}', "\
-               f"phone_number='{self.phone_number}', amount={self.amount})"
+        return f"StkPushRequest(id={self.id}, status='{self.status}')"
+
+class IdempotencyKey(db.Model):
+    """
+    Response of an STK push stored under the client's ``Idempotency-Key``.
+
+    Attributes:
+        key (str): Idempotency key sent by the client.
+        request_hash (str): SHA-256 of the request body the key was first used with.
+        status_code (int): HTTP status of the stored response; None while the
+            first request with the key is still running.
+        response (dict): Stored response body.
+        created_at (datetime): When the key was first used, in UTC.
+    """
+    key = db.Column(db.String(255), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)
+    response = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    def __repr__(self):
+        return f"IdempotencyKey(key='{self.key}', status_code={self.status_code})"
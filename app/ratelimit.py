@@ -0,0 +1,104 @@
+"""
+Module providing a thread-safe token bucket rate limiter.
+"""
+
+import threading
+import time
+
+
+# Shortest wait in seconds, so float rounding never leaves acquire spinning on
+# waits too small to move the clock forward
+MIN_WAIT = 0.001
+
+# Tolerance when comparing token counts, which accumulate rounding errors
+EPSILON = 1e-9
+
+
+class RateLimiter:
+    """
+    Token bucket allowing ``rate`` calls per second with bursts of up to ``burst``.
+
+    A rate of zero or less disables limiting.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        Args:
+            rate (float): Tokens added per second.
+            burst (float): Bucket capacity; defaults to one second worth of tokens.
+            clock (callable): Monotonic clock returning seconds.
+            sleep (callable): Function used to wait for tokens.
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = clock()
+
+    def _refill(self):
+        """Add the tokens earned since the last call. Called with the lock held."""
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self, tokens):
+        """Take tokens if enough have accrued. Called with the lock held.
+
+        Returns:
+            float: Zero if the tokens were taken, otherwise the seconds until they will be.
+        """
+        self._refill()
+        missing = tokens - self._tokens
+        if missing <= EPSILON:
+            self._tokens = max(0.0, self._tokens - tokens)
+            return 0.0
+        return missing / self.rate
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if they are available right now.
+
+        Returns:
+            bool: Whether the tokens were taken.
+
+        Raises:
+            ValueError: If more tokens are asked for than the bucket holds.
+        """
+        if self.rate <= 0:
+            return True
+        self._check(tokens)
+        with self._lock:
+            return self._take(tokens) == 0.0
+
+    def acquire(self, tokens=1, timeout=None):
+        """Wait until tokens are available and take them.
+
+        Args:
+            tokens (int): Tokens to take.
+            timeout (float): Longest wait in seconds; None waits as long as needed.
+
+        Returns:
+            bool: Whether the tokens were taken; False only if they would not
+                have been available within ``timeout``.
+
+        Raises:
+            ValueError: If more tokens are asked for than the bucket holds.
+        """
+        if self.rate <= 0:
+            return True
+        self._check(tokens)
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            with self._lock:
+                wait = self._take(tokens)
+            if wait == 0.0:
+                return True
+            if deadline is not None and self._clock() + wait > deadline + EPSILON:
+                return False
+            self._sleep(max(wait, MIN_WAIT))
+
+    def _check(self, tokens):
+        """Reject requests that the bucket could never satisfy."""
+        if tokens > self.burst:
+            raise ValueError(f'Cannot take {tokens} tokens from a bucket of {self.burst}.')
@@ -0,0 +1,176 @@
+"""
+Module providing the reconciliation poller for pending transactions.
+
+Transactions stay pending until M-Pesa calls back or a client queries their
+status. The poller finds pending transactions that have waited longer than a
+minimum age, queries Daraja for them and writes the results in bulk.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import requests
+from flask import current_app
+from app import db, models, services
+from app.ratelimit import RateLimiter
+from app.tenants import TenantBusyError
+
+logger = logging.getLogger(__name__)
+
+
+class Reconciler:
+    """
+    Polls Daraja for stale pending transactions.
+
+    Must be used inside an application context.
+
+    Attributes:
+        min_age (int): Seconds a transaction must have been pending before it is queried.
+        batch_size (int): Maximum number of transactions queried per run.
+        concurrency (int): Maximum number of queries in flight.
+        backoff (float): Seconds before a still-pending transaction is queried again.
+        max_backoff (float): Upper bound of the per-transaction backoff.
+        checked (int): Number of status queries sent.
+        resolved (int): Number of transactions that reached a final status.
+        errors (int): Number of status queries that failed.
+    """
+
+    def __init__(self, min_age=60, batch_size=100, concurrency=4, rate=5.0,
+                 backoff=30.0, max_backoff=900.0, clock=time.monotonic):
+        self.min_age = min_age
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._clock = clock
+        # Checkout request ID -> (attempts, monotonic time of the next query)
+        self._retry_at = {}
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.resolved = 0
+        self.errors = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a reconciler from the application configuration."""
+        return cls(
+            min_age=config['RECONCILE_MIN_AGE'],
+            batch_size=config['RECONCILE_BATCH_SIZE'],
+            concurrency=config['RECONCILE_CONCURRENCY'],
+            rate=config['RECONCILE_RATE'],
+            backoff=config['RECONCILE_BACKOFF'],
+            max_backoff=config['RECONCILE_MAX_BACKOFF']
+        )
+
+    def _stale_query(self):
+        """Query of pending transactions older than the minimum age."""
+        cutoff = models.utcnow() - timedelta(seconds=self.min_age)
+        transaction = models.MpesaTransaction
+        return db.session.query(transaction).filter(
+            transaction.status == models.PENDING,
+            transaction.created_at <= cutoff
+        )
+
+    def due_transactions(self):
+        """Checkout request IDs of stale pending transactions whose backoff has elapsed."""
+        now = self._clock()
+        transaction = models.MpesaTransaction
+        limit = self.batch_size + len(self._retry_at)
+        rows = self._stale_query().with_entities(transaction.checkout_request_id).order_by(
+            transaction.created_at
+        ).limit(limit).all()
+        if len(rows) < limit:
+            # Every stale transaction was listed, so forget the ones resolved elsewhere
+            listed = {checkout_request_id for (checkout_request_id,) in rows}
+            self._retry_at = {
+                key: value for key, value in self._retry_at.items() if key in listed
+            }
+        due = [
+            checkout_request_id for (checkout_request_id,) in rows
+            if self._retry_at.get(checkout_request_id, (0, now))[1] <= now
+        ]
+        return due[:self.batch_size]
+
+    def backlog(self):
+        """Report the number of stale pending transactions and the age of the oldest.
+
+        Returns:
+            dict: ``backlog`` count and ``lag_seconds`` of the oldest stale transaction.
+        """
+        transaction = models.MpesaTransaction
+        count, oldest = self._stale_query().with_entities(
+            db.func.count(transaction.id), db.func.min(transaction.created_at)
+        ).one()
+        lag = (models.utcnow() - oldest).total_seconds() if oldest else 0.0
+        return {'backlog': count, 'lag_seconds': round(lag, 3)}
+
+    def check(self, checkout_request_id):
+        """Query the status of one transaction.
+
+        Returns:
+            dict: Update for ``services.apply_status_updates``, or None if the
+                transaction is still being processed or the query failed.
+        """
+        self.limiter.acquire()
+        try:
+            # One upstream call per check; the per-transaction backoff does the retrying
+            response = services.request_transaction_status(checkout_request_id, retries=0)
+        except (requests.RequestException, ValueError, TenantBusyError) as error:
+            logger.warning("Status query for %s failed: %s", checkout_request_id, error)
+            with self._lock:
+                self.errors += 1
+            return None
+        return services.query_result_update(checkout_request_id, response)
+
+    def run_once(self):
+        """Query every due transaction and write the results in one transaction.
+
+        Returns:
+            int: Number of transactions that reached a final status.
+        """
+        due = self.due_transactions()
+        if not due:
+            return 0
+        app = current_app._get_current_object()  # pylint: disable=protected-access
+
+        def check(checkout_request_id):
+            with app.app_context():
+                return self.check(checkout_request_id)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = list(executor.map(check, due))
+        self.checked += len(due)
+
+        updates = [update for update in results if update is not None]
+        services.apply_status_updates(updates)
+        self.resolved += len(updates)
+
+        now = self._clock()
+        resolved = {update['checkout_request_id'] for update in updates}
+        for checkout_request_id in due:
+            if checkout_request_id in resolved:
+                self._retry_at.pop(checkout_request_id, None)
+            else:
+                attempts = self._retry_at.get(checkout_request_id, (0, now))[0] + 1
+                delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+                self._retry_at[checkout_request_id] = (attempts, now + delay)
+        return len(updates)
+
+    def run_forever(self, interval=30.0, stop=None):
+        """Reconcile every ``interval`` seconds until ``stop`` is set."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                resolved = self.run_once()
+                logger.info(
+                    "Reconciled %d transactions; %s", resolved, self.backlog()
+                )
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Reconciliation run failed")
+            finally:
+                # End the read transaction so the next run sees fresh data
+                db.session.remove()
+            stop.wait(interval)
@@ -0,0 +1,162 @@
+"""
+Module providing read access to transactions for listings and exports.
+
+Listings use keyset pagination on ``(created_at, id)``, so every page costs
+the same however deep the client goes. Exports stream rows from a
+server-side cursor, so memory use stays flat and the first rows go out
+before the query has finished.
+"""
+
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_, select
+from app import db, models
+
+# Columns returned by listings and exports, in export order
+COLUMNS = (
+    'id', 'full_name', 'phone_number', 'amount', 'checkout_request_id', 'shortcode',
+    'mpesa_receipt_number', 'transaction_date', 'transaction_time', 'status',
+    'result_code', 'result_desc', 'created_at', 'updated_at',
+)
+
+
+def parse_filters(args):
+    """Read the transaction filters of a request's query string.
+
+    Args:
+        args (dict): Query string arguments.
+
+    Returns:
+        dict: ``status``, ``phone_number``, ``start`` and ``end`` filters, and
+            ``archived`` to read the archived transactions.
+
+    Raises:
+        ValueError: If ``start`` or ``end`` is not an ISO 8601 date or datetime.
+    """
+    filters = {
+        'status': args.get('status'),
+        'phone_number': args.get('phone_number'),
+        'archived': args.get('archived', '').lower() in ('1', 'true', 'yes'),
+    }
+    for name in ('start', 'end'):
+        value = args.get(name)
+        try:
+            filters[name] = datetime.fromisoformat(value) if value else None
+        except ValueError as error:
+            raise ValueError(f'Invalid {name}; use an ISO 8601 date or datetime.') from error
+    return filters
+
+
+def source(archived=False):
+    """Table of the archived transactions, or of the live ones."""
+    return (models.ArchivedTransaction if archived else models.MpesaTransaction).__table__
+
+
+def filtered_query(status=None, phone_number=None, start=None, end=None, archived=False):
+    """Select the listed columns of the transactions matching the filters.
+
+    ``start`` is inclusive and ``end`` exclusive; both compare with ``created_at``.
+    With ``archived`` the archived transactions are selected instead of the live ones.
+    """
+    table = source(archived)
+    query = select(*(table.c[name] for name in COLUMNS))
+    if status:
+        query = query.where(table.c.status == status)
+    if phone_number:
+        query = query.where(table.c.phone_number == phone_number)
+    if start:
+        query = query.where(table.c.created_at >= start)
+    if end:
+        query = query.where(table.c.created_at < end)
+    return query
+
+
+def encode_cursor(row):
+    """Opaque cursor pointing just after ``row``."""
+    key = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Read the ``(created_at, id)`` key of a cursor.
+
+    Raises:
+        ValueError: If the cursor was not produced by ``encode_cursor``.
+    """
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError) as error:
+        raise ValueError('Invalid cursor.') from error
+
+
+def serialize(row):
+    """JSON-friendly dictionary of a transaction row."""
+    return {
+        name: value.isoformat() if isinstance(value, datetime) else value
+        for name, value in row.items()
+    }
+
+
+def list_transactions(filters, limit=50, cursor=None):
+    """List one page of transactions, newest first.
+
+    Args:
+        filters (dict): As returned by ``parse_filters``.
+        limit (int): Maximum number of transactions on the page.
+        cursor (str): ``next_cursor`` of the previous page.
+
+    Returns:
+        tuple: The serialized transactions and the cursor of the next page,
+            or None if this is the last page.
+    """
+    table = source(filters.get('archived'))
+    query = filtered_query(**filters)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.where(or_(
+            table.c.created_at < created_at,
+            and_(table.c.created_at == created_at, table.c.id < row_id)
+        ))
+    query = query.order_by(table.c.created_at.desc(), table.c.id.desc()).limit(limit + 1)
+    rows = db.session.execute(query).mappings().all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [serialize(row) for row in rows[:limit]], next_cursor
+
+
+def stream_rows(filters, chunk_size=1000):
+    """Yield matching transaction rows, oldest first, from a server-side cursor."""
+    table = source(filters.get('archived'))
+    query = filtered_query(**filters).order_by(table.c.created_at, table.c.id)
+    result = db.session.execute(query.execution_options(yield_per=chunk_size))
+    try:
+        yield from result.mappings()
+    finally:
+        result.close()
+
+
+def export_ndjson(rows, dumps=json.dumps):
+    """Yield transaction rows as newline-delimited JSON, encoded with ``dumps``."""
+    for row in rows:
+        yield dumps(serialize(row)) + '\n'
+
+
+def export_csv(rows, chunk_size=1000):
+    """Yield transaction rows as CSV with a header line, a chunk of rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    # The header goes out before the first chunk of rows has been fetched
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for number, row in enumerate(rows, 1):
+        writer.writerow(serialize(row).values())
+        if number % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -1,73 +1,456 @@
 """Endpoints for initiating payments."""
-from flask import request, jsonify
-from app import app, services
+from functools import partial
+from math import ceil
+from flask import (
+    Blueprint, Response, current_app, request, jsonify, stream_with_context, url_for
+)
+from app import (
+    clients, db, metrics, models, reports, services, async_services, stk_queue, summary,
+    validation
+)
+from app.bulk import BulkStatusSync, BulkStkPush
+from app.guards import CallRejectedError
+from app.idempotency import IdempotencyError, IdempotencyStore, fingerprint
+from app.reconciler import Reconciler
+from app.tenants import TenantBusyError, UnknownTenantError
 
-@app.route('/initiate_mpesa_stk_push', methods=['POST'])
+bp = Blueprint('payments', __name__)
+
+def _create_idempotency_store(app):
+    """Create the Idempotency-Key store of an app."""
+    store = IdempotencyStore.from_config(app.config)
+    metrics.REGISTRY.register_cache('idempotency', store.cache)
+    return store
+
+# Stored STK push responses by Idempotency-Key
+idempotency_store = clients.proxy('idempotency_store', _create_idempotency_store)
+
+# Compiled request body schemas of the endpoints
+schemas = clients.proxy('schemas', lambda app: validation.compile_schemas(app.config))
+
+def validate_stk_push(body):
+    """Validate the fields of one STK push.
+
+    Returns:
+        tuple: The ``(full_name, phone_number, amount)`` arguments and an error
+            message, exactly one of which is None.
+    """
+    try:
+        return schemas['stk_push'].validate(body), None
+    except validation.ValidationError as error:
+        return None, str(error)
+
+def parse_body(schema):
+    """Read and validate the fields of the request body with the schema ``schema``.
+
+    Returns:
+        tuple: The field values and an error response, exactly one of which is None.
+    """
+    try:
+        return schemas[schema].validate(request.get_json(silent=True)), None
+    except validation.ValidationError as error:
+        return None, (jsonify({'error': str(error)}), 400)
+
+def parse_tenant(body):
+    """Find the tenant named by the optional ``tenant`` field of a request body.
+
+    Returns:
+        tuple: The tenant and an error response, exactly one of which is None.
+    """
+    key = body.get('tenant') if isinstance(body, dict) else None
+    try:
+        return services.get_tenant(key), None
+    except UnknownTenantError as error:
+        return None, (jsonify({'error': str(error)}), 400)
+
+def parse_stk_push_request():
+    """Read and validate the body of an STK push request.
+
+    Returns:
+        tuple: The ``(full_name, phone_number, amount)`` arguments, the tenant
+            to pay and an error response; either the error or the others are None.
+    """
+    args, error = parse_body('stk_push')
+    if error:
+        return None, None, error
+    tenant, error = parse_tenant(request.json)
+    return args, tenant, error
+
+def stk_push_result(response):
+    """Build the body and status code of the route response for an STK push result."""
+    # Check if STK push initiation was successful
+    if 'ResponseCode' in response and response['ResponseCode'] == '0':
+        return response, 200
+
+    # Handle error response
+    error_message = response.get('ResponseDescription', 'Unknown error occurred.')
+    return {'error': error_message}, 500
+
+def stk_push_response(response):
+    """Build the route response for an STK push result."""
+    body, status_code = stk_push_result(response)
+    return jsonify(body), status_code
+
+def transaction_status_response(response):
+    """Build the route response for a transaction status result."""
+    # Check if the response contains transaction status information
+    if 'ResponseCode' in response:
+        return jsonify(response), 200
+
+    return jsonify(response), 500
+
+def wants_accepted_mode():
+    """Whether an STK push should be queued instead of sent within the request."""
+    if current_app.config['STK_PUSH_MODE'] == 'accepted':
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+@bp.errorhandler(TenantBusyError)
+def tenant_busy(error):
+    """Turn away a request whose tenant is over its Daraja limits."""
+    return jsonify({'error': str(error)}), 429, {'Retry-After': str(ceil(error.retry_after))}
+
+@bp.errorhandler(CallRejectedError)
+def daraja_call_rejected(error):
+    """Fail fast when a Daraja endpoint's circuit is open or its rate limit is reached."""
+    return jsonify({'error': str(error)}), error.status_code, {
+        'Retry-After': str(max(1, ceil(error.retry_after)))
+    }
+
+@bp.route('/initiate_mpesa_stk_push', methods=['POST'])
 def initiate_mpesa_stk_push():
     """Initiate STK push for M-Pesa payment.
 
+    In accepted mode the push is queued for the queue workers and the
+    response is a 202 with the ID of the queued request. Requests repeating
+    the ``Idempotency-Key`` header of an accepted push get its response back
+    without sending another push.
+
     Args:
         full_name (str): Full name of the customer.
         phone_number (str): Phone number of the customer.
         amount (float): Amount to be paid.
+        tenant (str): Name or shortcode of the paybill to pay; optional.
 
     Returns:
         dict: Response from the STK push request.
     """
-    full_name = request.json.get('full_name')
-    phone_number = request.json.get('phone_number')
-    amount = request.json.get('amount')
+    args, tenant, error = parse_stk_push_request()
+    if error:
+        return error
 
-    # Check if required fields are provided
-    if not all([full_name, phone_number, amount]):
-        return jsonify({'error': 'Full name, phone number, and amount are required.'}), 400
+    def send():
+        if wants_accepted_mode():
+            return stk_queue.enqueue(*args, shortcode=tenant.shortcode).to_dict(), 202
+        # Initiate STK push
+        return stk_push_result(services.initiate_stk_push(*args, tenant=tenant))
 
-    # Convert phone number to int
-    try:
-        phone_number = int(phone_number)
-    except ValueError:
-        return jsonify({'error': 'Invalid phone number.'}), 400
+    headers = {}
+    key = request.headers.get('Idempotency-Key')
+    if key:
+        try:
+            body, status_code, replayed = idempotency_store.execute(
+                key, fingerprint(request.json), send
+            )
+        except IdempotencyError as conflict:
+            return jsonify({'error': str(conflict)}), conflict.status_code
+        if replayed:
+            headers['Idempotent-Replayed'] = 'true'
+    else:
+        body, status_code = send()
 
-    # Convert amount to integer
-    try:
-        amount = int(amount)
-    except ValueError:
-        return jsonify({'error': 'Invalid amount.'}), 400
+    if status_code == 202:
+        headers['Location'] = url_for('.stk_push_request_status', request_id=body['request_id'])
+    return jsonify(body), status_code, headers
 
-    # Initiate STK push
-    response = services.initiate_stk_push(full_name, phone_number, amount)
+@bp.route('/bulk_stk_push', methods=['POST'])
+def bulk_stk_push():
+    """Initiate many STK pushes at once.
 
-    # Check if STK push initiation was successful
-    if 'ResponseCode' in response and response['ResponseCode'] == '0':
-        return jsonify(response), 200
+    Every item is validated before any push is sent. Pushes are then sent
+    concurrently and their results streamed as newline-delimited JSON in the
+    order they complete.
 
-    # Handle error response
-    error_message = response.get('ResponseDescription', 'Unknown error occurred.')
-    return jsonify({'error': error_message}), 500
+    Args:
+        items (list): Objects with the ``full_name``, ``phone_number`` and
+            ``amount`` of ``/initiate_mpesa_stk_push``.
+        tenant (str): Name or shortcode of the paybill every item pays; optional.
+
+    Returns:
+        One JSON object per item with its ``index``, ``status`` and the M-Pesa
+        ``response`` or the ``error``.
+    """
+    items = request.json.get('items') if isinstance(request.json, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'A non-empty list of items is required.'}), 400
+    if len(items) > current_app.config['BULK_MAX_ITEMS']:
+        return jsonify({
+            'error': f"At most {current_app.config['BULK_MAX_ITEMS']} items are allowed."
+        }), 400
+
+    validated = [validate_stk_push(item) for item in items]
+    errors = [
+        {'index': index, 'error': message}
+        for index, (_, message) in enumerate(validated) if message
+    ]
+    if errors:
+        return jsonify({'errors': errors}), 400
+    tenant, error = parse_tenant(request.json)
+    if error:
+        return error
+
+    results = BulkStkPush.from_config(current_app.config).run(
+        [args for args, _ in validated], tenant
+    )
+    dumps = partial(current_app.json.dumps, sort_keys=False)
+    lines = (dumps(result) + '\n' for result in results)
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+@bp.route('/stk_push_requests/<int:request_id>', methods=['GET'])
+def stk_push_request_status(request_id):
+    """
+    Look up a queued STK push request.
+
+    Returns:
+        dict: Status of the request and, once sent, the response of M-Pesa.
+    """
+    push_request = db.session.get(models.StkPushRequest, request_id)
+    if push_request is None:
+        return jsonify({'error': 'Unknown STK push request.'}), 404
+    return jsonify(push_request.to_dict()), 200
+
+@bp.route('/stk_push_queue', methods=['GET'])
+def stk_push_queue():
+    """
+    Report the depth of the STK push queue.
+
+    Returns:
+        dict: Number of queued and in-flight requests and the age in seconds of the oldest.
+    """
+    return jsonify(stk_queue.queue_depth()), 200
 
-@app.route('/query_transaction_status', methods=['POST'])
+@bp.route('/query_transaction_status', methods=['POST'])
 def query_transaction_status():
     """
     Query transaction status for M-Pesa payment.
 
     Args:
         checkout_request_id (str): ID of the checkout request.
+        tenant (str): Name or shortcode of the paybill, for transactions not
+            recorded by this service; optional.
 
     Returns:
         dict: Response from the transaction status query.
     """
     # Get checkout request ID from request
-    checkout_request_id = request.json.get('checkout_request_id')
-
-    # Check if checkout request ID is provided
-    if not checkout_request_id:
-        return jsonify({'error': 'Checkout request ID is required.'}), 400
+    fields, error = parse_body('status_query')
+    if error:
+        return error
+    checkout_request_id, = fields
+    tenant, error = parse_tenant(request.json)
+    if error:
+        return error
 
     # Query transaction status
-    response = services.query_transaction_status(checkout_request_id)
+    response = services.query_transaction_status(checkout_request_id, tenant)
+    return transaction_status_response(response)
 
-    # Check if the response contains transaction status information
-    if 'ResponseCode' in response:
-        return jsonify(response), 200
+@bp.route('/sync_transaction_statuses', methods=['POST'])
+def sync_transaction_statuses():
+    """
+    Query the status of many pending transactions and store the results.
 
-    return jsonify(response), 500
+    Transactions that already have a final status are not queried again, and
+    every result is written in one database transaction.
+
+    Args:
+        checkout_request_ids (list): IDs of the checkout requests.
+
+    Returns:
+        dict: One result per checkout request and the number of transactions updated.
+    """
+    fields, error = parse_body('status_sync')
+    if error:
+        return error
+    checkout_request_ids, = fields
+
+    results = BulkStatusSync.from_config(current_app.config).run(checkout_request_ids)
+    return jsonify({
+        'results': results,
+        'updated': sum(result['updated'] for result in results),
+    }), 200
+
+@bp.route('/mpesa_callback', methods=['POST'])
+def mpesa_callback():
+    """
+    Receive the result of an STK push from M-Pesa.
+
+    The update is queued and written to the database in a later batch, so the
+    callback is acknowledged without waiting on the database.
+
+    Returns:
+        dict: Acknowledgement in the format expected by M-Pesa.
+    """
+    try:
+        update = services.parse_stk_callback(request.json)
+    except ValueError as error:
+        return jsonify({'ResultCode': 1, 'ResultDesc': str(error)}), 400
+
+    services.callback_buffer.add(update['checkout_request_id'], update)
+    return jsonify({'ResultCode': 0, 'ResultDesc': 'Accepted'}), 200
+
+@bp.route('/reconciliation_backlog', methods=['GET'])
+def reconciliation_backlog():
+    """
+    Report the pending transactions waiting for reconciliation.
+
+    Returns:
+        dict: Number of stale pending transactions and the age in seconds of the oldest.
+    """
+    return jsonify(Reconciler.from_config(current_app.config).backlog()), 200
+
+@bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Serve the metrics of this process in the Prometheus text format.
+
+    Returns:
+        Response: Stage latency histograms, Daraja response and result code
+            counters, cache hits and misses and requests in flight.
+    """
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
+@bp.route('/circuit_breakers', methods=['GET'])
+def circuit_breakers():
+    """
+    Report the circuit breaker of every Daraja endpoint in this process.
+
+    Returns:
+        dict: By endpoint, the ``state`` of its breaker ('closed', 'open' or
+            'half_open'), its recent ``calls``, ``failed_calls`` and
+            ``slow_calls``, and the seconds until an open one half-opens.
+    """
+    return jsonify({
+        endpoint: guard.breaker.snapshot()
+        for endpoint, guard in services.endpoint_guards(current_app).items()
+        if guard.breaker is not None
+    }), 200
+
+@bp.route('/transactions', methods=['GET'])
+def list_transactions():
+    """
+    List transactions, newest first, one page at a time.
+
+    Args:
+        status (str): Only transactions with this status.
+        phone_number (str): Only transactions of this phone number.
+        start (str): Only transactions created at or after this ISO 8601 time.
+        end (str): Only transactions created before this ISO 8601 time.
+        limit (int): Maximum number of transactions on the page.
+        cursor (str): ``next_cursor`` of the previous page.
+
+    Returns:
+        dict: The transactions and the cursor of the next page, or None on the last page.
+    """
+    try:
+        filters = reports.parse_filters(request.args)
+        limit = int(request.args.get('limit', current_app.config['TRANSACTIONS_PAGE_SIZE']))
+        if not 1 <= limit <= current_app.config['TRANSACTIONS_MAX_PAGE_SIZE']:
+            raise ValueError(
+                f"Limit must be between 1 and {current_app.config['TRANSACTIONS_MAX_PAGE_SIZE']}."
+            )
+        transactions, next_cursor = reports.list_transactions(
+            filters, limit, request.args.get('cursor')
+        )
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    return jsonify({'transactions': transactions, 'next_cursor': next_cursor}), 200
+
+@bp.route('/transactions/summary', methods=['GET'])
+def transaction_summary():
+    """
+    Report the number and total amount of transactions per day, status and shortcode.
+
+    Served from the daily summary table, so the cost grows with the number of
+    days asked for, not of transactions.
+
+    Args:
+        start (str): First day, as an ISO 8601 date.
+        end (str): Day after the last one, as an ISO 8601 date.
+        status (str): Only transactions with this status.
+        shortcode (str): Only transactions of this shortcode.
+
+    Returns:
+        dict: The ``days`` rows, oldest first, and the ``totals`` of each status.
+    """
+    try:
+        start = summary.parse_day(request.args.get('start'), 'start')
+        end = summary.parse_day(request.args.get('end'), 'end')
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    return jsonify(summary.aggregate(
+        start, end, request.args.get('status'), request.args.get('shortcode')
+    )), 200
+
+@bp.route('/transactions/export', methods=['GET'])
+def export_transactions():
+    """
+    Stream every matching transaction, oldest first, as CSV or NDJSON.
+
+    Takes the filters of ``/transactions`` and a ``format`` of 'csv' (default) or 'ndjson'.
+    """
+    export_format = request.args.get('format', 'csv')
+    try:
+        filters = reports.parse_filters(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    if export_format == 'csv':
+        encode, mimetype = reports.export_csv, 'text/csv'
+    elif export_format == 'ndjson':
+        encode = partial(
+            reports.export_ndjson, dumps=partial(current_app.json.dumps, sort_keys=False)
+        )
+        mimetype = 'application/x-ndjson'
+    else:
+        return jsonify({'error': "Format must be 'csv' or 'ndjson'."}), 400
+
+    rows = reports.stream_rows(filters, current_app.config['EXPORT_CHUNK_SIZE'])
+    return Response(stream_with_context(encode(rows)), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=transactions.{export_format}'
+    })
+
+@bp.route('/async/initiate_mpesa_stk_push', methods=['POST'])
+async def async_initiate_mpesa_stk_push():
+    """Initiate STK push for M-Pesa payment on the async engine.
+
+    Takes the same arguments and returns the same response as
+    ``/initiate_mpesa_stk_push``.
+    """
+    args, tenant, error = parse_stk_push_request()
+    if error:
+        return error
+
+    engine = async_services.engine
+    response = await engine.wrap(async_services.initiate_stk_push(*args, tenant=tenant))
+    return stk_push_response(response)
+
+@bp.route('/async/query_transaction_status', methods=['POST'])
+async def async_query_transaction_status():
+    """Query transaction status for M-Pesa payment on the async engine.
+
+    Takes the same arguments and returns the same response as
+    ``/query_transaction_status``.
+    """
+    fields, error = parse_body('status_query')
+    if error:
+        return error
+    checkout_request_id, = fields
+    tenant, error = parse_tenant(request.json)
+    if error:
+        return error
+
+    engine = async_services.engine
+    response = await engine.wrap(
+        async_services.query_transaction_status(checkout_request_id, tenant)
+    )
+    return transaction_status_response(response)
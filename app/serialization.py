@@ -0,0 +1,86 @@
+"""
+Module providing the JSON encoding and decoding of request and response bodies.
+
+Flask encodes and decodes JSON through ``app.json``. ``init_app`` sets it to
+the provider named by ``JSON_PROVIDER``: Flask's own, ``OrjsonProvider`` for
+the faster orjson package, or any ``module:Class`` provider. Streamed NDJSON
+lines are encoded with ``app.json.dumps`` too.
+"""
+
+import importlib
+from flask.json.provider import DefaultJSONProvider
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON provider encoding and decoding with orjson.
+
+    Output matches the default provider except that datetimes are written in
+    ISO 8601 and responses are always compact. Calls passing options orjson
+    lacks, such as ``cls``, fall back to the standard library.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        try:
+            self._orjson = importlib.import_module('orjson')
+        except ImportError as error:
+            raise RuntimeError("JSON_PROVIDER 'orjson' needs the orjson package.") from error
+
+    def _option(self, sort_keys=None, indent=None):
+        """Return the orjson option flags for the given keyword arguments."""
+        option = self._orjson.OPT_NON_STR_KEYS
+        if self.sort_keys if sort_keys is None else sort_keys:
+            option |= self._orjson.OPT_SORT_KEYS
+        if indent:
+            option |= self._orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        """Serialize data as JSON with orjson."""
+        if set(kwargs) - {'sort_keys', 'indent', 'separators'}:
+            return super().dumps(obj, **kwargs)
+        option = self._option(kwargs.get('sort_keys'), kwargs.get('indent'))
+        return self._orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        """Deserialize data as JSON with orjson."""
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return self._orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """Serialize the arguments as JSON and return a response with it."""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            self._orjson.dumps(obj, default=self.default, option=self._option()),
+            mimetype=self.mimetype
+        )
+
+
+# Providers of JSON_PROVIDER by name
+PROVIDERS = {
+    'default': DefaultJSONProvider,
+    'orjson': OrjsonProvider,
+}
+
+
+def provider_class(name):
+    """Return the JSON provider class ``name``: a key of ``PROVIDERS`` or a 'module:Class' path.
+
+    Raises:
+        ValueError: If the name is neither.
+    """
+    if name in PROVIDERS:
+        return PROVIDERS[name]
+    module, _, attribute = name.partition(':')
+    if not module or not attribute:
+        raise ValueError(
+            f"JSON_PROVIDER must be one of {sorted(PROVIDERS)} or 'module:Class', not '{name}'."
+        )
+    return getattr(importlib.import_module(module), attribute)
+
+
+def init_app(app):
+    """Set the JSON provider of ``JSON_PROVIDER``, so a bad one fails at startup."""
+    app.json = provider_class(app.config['JSON_PROVIDER'])(app)
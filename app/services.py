@@ -3,14 +3,53 @@ Module providing functions for interacting with the M-Pesa API.
 """
 
 import base64
-from datetime import datetime
-import requests
-from app import app, db, models
+import functools
+import hashlib
+import logging
+from flask import current_app
+from sqlalchemy import and_, bindparam, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from app import archive, clients, db, guards, metrics, models, shared_state, summary
+from app.batching import BatchBuffer
+from app.daraja import DarajaClient
+from app.status_cache import StatusCache
+from app.tenants import TenantRegistry
+from app.tokens import TokenManager
 
-def generate_access_token():
-    """Generate access token for M-Pesa API authentication."""
-    consumer_key = app.config['MPESA_CONSUMER_KEY']
-    consumer_secret = app.config['MPESA_CONSUMER_SECRET']
+logger = logging.getLogger(__name__)
+
+def endpoint_guards(app):
+    """Rate limits and circuit breakers of an app's Daraja endpoints, shared by its clients."""
+    return clients.of(app).get('daraja_guards', lambda app: guards.from_config(app.config))
+
+def shared_store(app):
+    """Store sharing an app's access tokens and status responses across processes, or None."""
+    return clients.of(app).get(
+        'shared_store', lambda app: shared_state.from_url(app.config['SHARED_STATE_URL'])
+    )
+
+def _create_client(app, pool_size=None):
+    """Create a pooled Daraja client of an app, guarded by its endpoint guards."""
+    return DarajaClient.from_config(app.config, pool_size=pool_size, guards=endpoint_guards(app))
+
+# Shared, pooled HTTP client for the Daraja calls of the default tenant
+client = clients.proxy('daraja_client', _create_client)
+
+# Daraja errorCode for an expired or revoked access token
+INVALID_TOKEN_ERROR = '404.001.03'
+
+def fetch_access_token(tenant=None):
+    """Request a new access token from the M-Pesa OAuth endpoint.
+
+    Args:
+        tenant: Tenant, or its name or shortcode; defaults to the default tenant.
+
+    Returns:
+        tuple: The access token and its lifetime in seconds.
+    """
+    tenant = get_tenant(tenant)
+    consumer_key = tenant.consumer_key
+    consumer_secret = tenant.consumer_secret
 
     # Concatenate consumer key and consumer secret
     auth_string = f"{consumer_key}:{consumer_secret}"
@@ -18,98 +57,521 @@ def generate_access_token():
     encoded_auth_string = base64.b64encode(auth_string.encode()).decode('utf-8')
     headers = {'Authorization': f'Basic {encoded_auth_string}'}
 
-    response = requests.get(
-        'https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials',
-        headers=headers,
-        timeout=10
+    with metrics.TOKEN_FETCH_SECONDS.time():
+        response = tenant.client.request(
+            'oauth',
+            params={'grant_type': 'client_credentials'},
+            headers=headers
+        )
+        response_data = response.json()
+    return response_data['access_token'], int(response_data.get('expires_in', 3599))
+
+def _create_token_manager(app, tenant=None):
+    """Create the access token cache of an app's default tenant, or of ``tenant``."""
+    def fetch():
+        # Refreshes run on a background thread, outside any app context
+        with app.app_context():
+            return fetch_access_token(tenant)
+
+    consumer_key = (tenant.consumer_key if tenant else app.config['MPESA_CONSUMER_KEY']) or ''
+    manager = TokenManager(
+        fetch,
+        expiry_margin=app.config['MPESA_TOKEN_EXPIRY_MARGIN'],
+        refresh_ahead=app.config['MPESA_TOKEN_REFRESH_AHEAD'],
+        store=shared_store(app),
+        # Tokens belong to a Daraja app, so processes with the same credentials share one
+        key='access_token:' + hashlib.sha256(consumer_key.encode()).hexdigest()[:16]
     )
-    access_token = response.json()['access_token']
-    return access_token
+    name = 'access_token' if tenant is None else f'access_token_{tenant.name}'
+    metrics.REGISTRY.register_cache(name, manager)
+    return manager
 
-def generate_password():
-    """Generate password for M-Pesa transactions."""
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    # Concatenate Shortcode, Passkey, and Timestamp
-    concat_string = f"{app.config['MPESA_SHORTCODE']}{app.config['MPESA_PASSKEY']}{timestamp}"
-    # Encode the concatenated string to base64
-    return base64.b64encode(concat_string.encode()).decode()
+# Shared access token cache for the M-Pesa API calls of the default tenant
+token_manager = clients.proxy('token_manager', _create_token_manager)
 
-# Initiate STK push for M-Pesa payment
-def initiate_stk_push(full_name, phone_number, amount):
-    """Initiate STK push for M-Pesa payment."""
-    access_token = generate_access_token()
-    headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {access_token}'}
-    password = generate_password()
-
-    payload = {
-        "BusinessShortCode": int(app.config['MPESA_SHORTCODE']),
-        "Password": password,
-        "Timestamp": datetime.now().strftime('%Y%m%d%H%M%S'),
-        "TransactionType": "CustomerPayBillOnline",
-        "Amount": amount,
-        "PartyA": phone_number,
-        "PartyB": int(app.config['MPESA_SHORTCODE']),
-        "PhoneNumber": phone_number,
-        "CallBackURL": app.config['MPESA_CONFIRMATION_URL'],
-        "AccountReference": "CompanyXLTD",
-        "TransactionDesc": "Payment of X"
-    }
+def _create_tenant_registry(app):
+    """Create the tenants of an app, each with its own Daraja client and token cache."""
+    registry = TenantRegistry.from_config(app.config)
+    objects = clients.of(app)
+    for tenant in registry:
+        if tenant is registry.default:
+            tenant.client = objects.get('daraja_client', _create_client)
+            tenant.token_manager = objects.get('token_manager', _create_token_manager)
+        else:
+            tenant.client = _create_client(app, pool_size=tenant.pool_size)
+            tenant.token_manager = _create_token_manager(app, tenant)
+    return registry
 
-    response = requests.post(
-        'https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest',
-        headers=headers,
-        json=payload,
-        timeout=10
-    )
+# Paybills served by the app (see ``app.tenants``)
+tenant_registry = clients.proxy('tenants', _create_tenant_registry)
+
+def get_tenant(tenant=None):
+    """Return a tenant given itself, its name or shortcode, or None for the default one.
+
+    Raises:
+        tenants.UnknownTenantError: If no tenant has that name or shortcode.
+    """
+    return tenant_registry.get(tenant)
+
+def transaction_tenant(checkout_request_id, default=None):
+    """Return the tenant a transaction was made for, or ``default`` if it is unknown.
+
+    Raises:
+        tenants.UnknownTenantError: If the transaction's shortcode is no longer
+            served, or ``default`` is unknown.
+    """
+    if len(tenant_registry) == 1:
+        # Every transaction is the default tenant's; no need to look it up
+        return get_tenant(default)
+    transaction = find_transaction(checkout_request_id)
+    if transaction is None:
+        return get_tenant(default)
+    return tenant_registry.for_shortcode(transaction.shortcode)
+
+def generate_access_token(tenant=None):
+    """Return a cached access token for M-Pesa API authentication."""
+    return get_tenant(tenant).token_manager.get_token()
+
+def token_rejected(status_code, response_data):
+    """Whether Daraja rejected the access token of a call."""
+    if status_code == 401:
+        return True
+    return isinstance(response_data, dict) and response_data.get('errorCode') == INVALID_TOKEN_ERROR
 
-    response_data = response.json()
+def call_daraja(endpoint, payload, retries=None, tenant=None):
+    """Make an authenticated Daraja call.
 
-    # Save transaction details to database if the request was accepted for processing
+    The call is made with the tenant's client and access token, within its
+    rate limit and concurrency budget. If Daraja rejects the cached access
+    token, e.g. after the credentials were rotated, the token is dropped and
+    the call is retried once with a new one.
+
+    Args:
+        endpoint (str): Name of the endpoint in ``daraja.ENDPOINTS``.
+        payload (dict): JSON request body.
+        retries (int): Overrides the client's retries for this call.
+        tenant: Tenant, or its name or shortcode; defaults to the default tenant.
+
+    Returns:
+        dict: The parsed response body.
+
+    Raises:
+        tenants.TenantBusyError: If the tenant's limits don't let the call through in time.
+        guards.CallRejectedError: If the endpoint's circuit breaker is open or
+            its rate limit doesn't let the call through in time.
+    """
+    tenant = get_tenant(tenant)
+    with tenant.budget():
+        for attempt in range(2):
+            access_token = generate_access_token(tenant)
+            response = tenant.client.request(
+                endpoint, retries=retries, json=payload, headers=auth_headers(access_token)
+            )
+            with metrics.DARAJA_DECODE_SECONDS.time(endpoint=endpoint):
+                response_data = response.json()
+            metrics.count_response(endpoint, response_data)
+            if attempt or not token_rejected(response.status_code, response_data):
+                return response_data
+            logger.warning("Daraja rejected the access token, fetching a new one")
+            tenant.token_manager.invalidate(access_token)
+    return response_data
+
+def generate_password(tenant=None):
+    """Generate password for M-Pesa transactions, cached for the current second."""
+    return get_tenant(tenant).signer.password()
+
+def auth_headers(access_token):
+    """Build the headers for an authenticated M-Pesa API call."""
+    return {'Content-Type': 'application/json', 'Authorization': f'Bearer {access_token}'}
+
+def stk_push_payload(phone_number, amount, tenant=None):
+    """Build the request body of an STK push from the tenant's prebuilt one."""
+    return get_tenant(tenant).signer.stk_push_payload(phone_number, amount)
+
+def stk_query_payload(checkout_request_id, tenant=None):
+    """Build the request body of an STK push status query from the tenant's prebuilt one."""
+    return get_tenant(tenant).signer.stk_query_payload(checkout_request_id)
+
+def transaction_row(full_name, phone_number, amount, response_data, shortcode=None):
+    """Column values of the transaction of an STK push.
+
+    Returns:
+        dict: The values, or None if the request was not accepted for processing.
+    """
     if 'ResponseCode' in response_data and response_data['ResponseCode'] == '0':
-        checkout_request_id = response_data.get('CheckoutRequestID')
-        transaction = models.MpesaTransaction(
-            full_name=full_name,
-            phone_number=phone_number,
-            amount=amount,
-            checkout_request_id=checkout_request_id,
-            status='Pending'
-        )
-        db.session.add(transaction)
+        return {
+            'full_name': full_name,
+            'phone_number': str(phone_number),
+            'amount': amount,
+            'checkout_request_id': response_data.get('CheckoutRequestID'),
+            'shortcode': shortcode,
+            'status': models.PENDING,
+        }
+    return None
+
+@metrics.DB_OPERATION_SECONDS.time(operation='record_transaction')
+def record_transaction(full_name, phone_number, amount, response_data, shortcode=None):
+    """Save transaction details to database if the request was accepted for processing.
+
+    With ``TRANSACTION_WRITE_BEHIND`` the transaction is queued and inserted
+    with others in a later batch instead.
+    """
+    row = transaction_row(full_name, phone_number, amount, response_data, shortcode)
+    if row is None:
+        return
+    # Stamped now, so its age doesn't depend on when a write-behind batch is written
+    row['created_at'] = models.utcnow()
+    if current_app.config['TRANSACTION_WRITE_BEHIND']:
+        transaction_buffer.add(row['checkout_request_id'], row)
+        return
+    db.session.add(models.MpesaTransaction(**row))
+    if summary.enabled():
+        summary.apply(summary.inserted([row]))
+    db.session.commit()
+
+@metrics.DB_OPERATION_SECONDS.time(operation='record_transactions')
+def record_transactions(rows):
+    """Insert the transactions of many STK pushes with one bulk insert."""
+    if rows:
+        now = models.utcnow()
+        rows = [row if row.get('created_at') else dict(row, created_at=now) for row in rows]
+        db.session.execute(insert(models.MpesaTransaction), rows)
+        if summary.enabled():
+            summary.apply(summary.inserted(rows))
         db.session.commit()
 
+def pending_transaction(checkout_request_id):
+    """Row of a transaction recorded but not yet written by the write-behind buffer, or None."""
+    buffer = clients.of(current_app).peek('transaction_buffer')
+    return buffer.get(checkout_request_id) if buffer is not None else None
+
+def find_transaction(checkout_request_id):
+    """Look up the transaction of a checkout request, including one not yet written.
+
+    Returns:
+        MpesaTransaction: The stored transaction, an unsaved one built from
+            the write-behind buffer, the ``ArchivedTransaction`` if it was
+            archived, or None.
+    """
+    row = pending_transaction(checkout_request_id)
+    if row is not None:
+        return models.MpesaTransaction(**row)
+    transaction = models.MpesaTransaction.query.filter_by(
+        checkout_request_id=checkout_request_id
+    ).first()
+    if transaction is None:
+        return archive.find([checkout_request_id]).get(checkout_request_id)
+    return transaction
+
+# Initiate STK push for M-Pesa payment
+def send_stk_push(phone_number, amount, tenant=None):
+    """Send an STK push to M-Pesa without touching the database."""
+    tenant = get_tenant(tenant)
+    return call_daraja('stk_push', stk_push_payload(phone_number, amount, tenant), tenant=tenant)
+
+def initiate_stk_push(full_name, phone_number, amount, tenant=None):
+    """Initiate STK push for M-Pesa payment.
+
+    Args:
+        tenant: Tenant to pay, or its name or shortcode; defaults to the default tenant.
+    """
+    tenant = get_tenant(tenant)
+    response_data = send_stk_push(phone_number, amount, tenant)
+    record_transaction(full_name, phone_number, amount, response_data, tenant.shortcode)
     return response_data
 
-def query_transaction_status(checkout_request_id):
-    """Query transaction status."""
-    access_token = generate_access_token()
-    headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {access_token}'}
-    password = generate_password()
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    business_short_code = int(app.config['MPESA_SHORTCODE'])
-
-    query_data = {
-        "BusinessShortCode": business_short_code,
-        "Password": password,
-        "Timestamp": timestamp,
-        "CheckoutRequestID": checkout_request_id
+def request_transaction_status(checkout_request_id, retries=None, tenant=None):
+    """Ask M-Pesa for the status of a checkout request without touching the database.
+
+    Args:
+        checkout_request_id (str): Checkout request ID of the STK push.
+        retries (int): Overrides the client's retries, e.g. 0 for callers with
+            their own retry schedule.
+        tenant: Tenant of the STK push; defaults to the one it was stored with.
+    """
+    tenant = get_tenant(tenant) if tenant is not None else transaction_tenant(checkout_request_id)
+    return call_daraja(
+        'stk_query', stk_query_payload(checkout_request_id, tenant),
+        retries=retries, tenant=tenant
+    )
+
+def query_result_update(checkout_request_id, response_data):
+    """Build the transaction update carried by a status query response.
+
+    Returns:
+        dict: Update for ``apply_status_updates``, or None if the response
+            carries no result yet (the payment is still being processed, or
+            the query failed).
+    """
+    if not isinstance(response_data, dict) or 'ResultCode' not in response_data:
+        return None
+    return {
+        'checkout_request_id': checkout_request_id,
+        'status': status_for_result_code(response_data['ResultCode']),
+        'result_code': str(response_data['ResultCode']),
+        'result_desc': response_data.get('ResultDesc'),
+    }
+
+def record_query_result(checkout_request_id, response_data):
+    """Persist the result carried by a status query response, whatever it is.
+
+    Returns:
+        dict: The update applied, or None if the response carries no result.
+    """
+    result = query_result_update(checkout_request_id, response_data)
+    if result is None:
+        return None
+    metrics.RESULT_CODES.inc(source='query', code=result['result_code'])
+    if pending_transaction(checkout_request_id) is not None:
+        # Write it out first so the update finds it
+        transaction_buffer.flush()
+    apply_status_updates([result])
+    return result
+
+def query_transaction_status(checkout_request_id, tenant=None):
+    """Query transaction status.
+
+    A final status already stored is answered from the database, and answers
+    are cached (see ``status_cache``), so clients polling a payment cost few
+    Daraja calls. Daraja is asked with the credentials of the tenant the
+    transaction was made for, or of ``tenant`` if it is unknown.
+    """
+    def load():
+        response_data = stored_status_response(checkout_request_id)
+        if response_data is None:
+            response_data = request_transaction_status(
+                checkout_request_id, tenant=transaction_tenant(checkout_request_id, tenant)
+            )
+            record_query_result(checkout_request_id, response_data)
+        return response_data
+
+    return status_cache.lookup(checkout_request_id, load)
+
+def _create_status_cache(app):
+    """Create the status query cache of an app."""
+    cache = StatusCache.from_config(app.config, store=shared_store(app))
+    metrics.REGISTRY.register_cache('transaction_status', cache.cache)
+    return cache
+
+# Status query responses by checkout request ID
+status_cache = clients.proxy('status_cache', _create_status_cache)
+
+# Status recorded for each Daraja ResultCode; any other non-zero code is a failure
+STATUS_BY_RESULT_CODE = {
+    '0': models.COMPLETED,
+    '1': models.INSUFFICIENT_FUNDS,
+    '1032': models.CANCELLED,
+    '1037': models.TIMEOUT,
+}
+
+# ResultCode of the statuses that have a single one, for rows stored without theirs
+RESULT_CODE_BY_STATUS = {status: code for code, status in STATUS_BY_RESULT_CODE.items()}
+
+def status_for_result_code(result_code):
+    """Map a Daraja ResultCode to the status recorded for the transaction."""
+    return STATUS_BY_RESULT_CODE.get(str(result_code), models.FAILED)
+
+def stored_status_response(checkout_request_id):
+    """Build a status query response from a stored final status.
+
+    Returns:
+        dict: The response in Daraja's format, or None if the transaction is
+            unknown, still pending, or failed before its ResultCode was stored.
+    """
+    transaction = find_transaction(checkout_request_id)
+    if transaction is None or transaction.status == models.PENDING:
+        return None
+    result_code = transaction.result_code or RESULT_CODE_BY_STATUS.get(transaction.status)
+    if result_code is None:
+        return None
+    return {
+        'ResponseCode': '0',
+        'ResponseDescription': 'The service request has been accepted successsfully',
+        'CheckoutRequestID': checkout_request_id,
+        'ResultCode': result_code,
+        'ResultDesc': transaction.result_desc or transaction.status,
+    }
+
+def parse_stk_callback(body):
+    """Extract the transaction update carried by an STK push callback.
+
+    Args:
+        body (dict): JSON body posted by M-Pesa to the callback URL.
+
+    Returns:
+        dict: Checkout request ID, status, result code and description, receipt
+            number, transaction date and its UTC ``transaction_time`` of the
+            transaction.
+
+    Raises:
+        ValueError: If the body is not an STK push callback.
+    """
+    try:
+        callback = body['Body']['stkCallback']
+        checkout_request_id = callback['CheckoutRequestID']
+        result_code = callback['ResultCode']
+        items = callback.get('CallbackMetadata', {}).get('Item', [])
+        metadata = {item['Name']: item.get('Value') for item in items}
+    except (KeyError, TypeError, AttributeError) as error:
+        raise ValueError('Invalid STK push callback.') from error
+
+    metrics.RESULT_CODES.inc(source='callback', code=result_code)
+    transaction_date = metadata.get('TransactionDate')
+    return {
+        'checkout_request_id': checkout_request_id,
+        'status': status_for_result_code(result_code),
+        'result_code': str(result_code),
+        'result_desc': callback.get('ResultDesc'),
+        'mpesa_receipt_number': metadata.get('MpesaReceiptNumber'),
+        'transaction_date': str(transaction_date) if transaction_date is not None else None,
+        'transaction_time': models.parse_mpesa_time(transaction_date),
     }
 
-    response = requests.post(
-        'https://sandbox.safaricom.co.ke/mpesa/stkpushquery/v1/query',
-        json=query_data,
-        headers=headers,
-        timeout=10
+@metrics.DB_OPERATION_SECONDS.time(operation='apply_status_updates')
+def apply_status_updates(updates):
+    """Apply transaction updates in one database transaction.
+
+    Only pending transactions are updated, so replaying an update, or
+    receiving one for a transaction that is already final, changes nothing.
+    The daily summary is moved along in the same database transaction.
+
+    Args:
+        updates (list): Dictionaries as returned by ``parse_stk_callback`` or
+            ``query_result_update``.
+
+    Returns:
+        list: Updates whose checkout request ID matched no transaction, live or archived.
+    """
+    if not updates:
+        return []
+    table = models.MpesaTransaction.__table__
+    checkout_request_ids = {item['checkout_request_id'] for item in updates}
+    pending = {}
+    if summary.enabled():
+        # Locked, so a concurrent update can't move the same transactions in the summary
+        pending = {
+            row.checkout_request_id: row for row in db.session.execute(
+                select(
+                    table.c.checkout_request_id, table.c.created_at, table.c.shortcode,
+                    table.c.amount
+                ).where(and_(
+                    table.c.checkout_request_id.in_(checkout_request_ids),
+                    table.c.status == models.PENDING
+                )).with_for_update()
+            )
+        }
+    statement = update(table).where(and_(
+        table.c.checkout_request_id == bindparam('b_checkout_request_id'),
+        table.c.status == models.PENDING
+    )).values(
+        status=bindparam('b_status'),
+        result_code=bindparam('b_result_code'),
+        result_desc=bindparam('b_result_desc'),
+        mpesa_receipt_number=bindparam('b_mpesa_receipt_number'),
+        transaction_date=bindparam('b_transaction_date'),
+        transaction_time=bindparam('b_transaction_time'),
+        updated_at=models.utcnow()
     )
+    db.session.execute(statement, [
+        {
+            'b_checkout_request_id': item['checkout_request_id'],
+            'b_status': item['status'],
+            'b_result_code': item.get('result_code'),
+            'b_result_desc': item.get('result_desc'),
+            'b_mpesa_receipt_number': item.get('mpesa_receipt_number'),
+            'b_transaction_date': item.get('transaction_date'),
+            'b_transaction_time': item.get('transaction_time'),
+        }
+        for item in updates
+    ])
+    summary.apply(summary.moved(pending, updates))
+    known = {
+        checkout_request_id for (checkout_request_id,) in db.session.execute(
+            select(table.c.checkout_request_id).where(
+                table.c.checkout_request_id.in_(checkout_request_ids)
+            )
+        )
+    }
+    # Archived transactions are final, so their updates are known but change nothing
+    known.update(archive.find(checkout_request_ids - known))
+    db.session.commit()
+    return [item for item in updates if item['checkout_request_id'] not in known]
 
-    # Save transaction details to database if the request was accepted for processing
-    if 'ResultCode' in response and response['ResultCode'] == '0':
-        transaction = models.MpesaTransaction.query.filter_by(
-            checkout_request_id=checkout_request_id
-        ).first()
-        if transaction:
-            transaction.status = 'Completed'
-            db.session.commit()
-        return response.json()
-
-    response_data = response.json()
-    return response_data
+def flush_callbacks(updates, app=None):
+    """Write a batch of buffered callback updates to the database.
+
+    A callback can arrive before the transaction it belongs to is committed,
+    so an update that matches no transaction is kept for one more flush
+    before it is dropped.
+
+    Args:
+        updates (list): Dictionaries as returned by ``parse_stk_callback``.
+        app (Flask): App to write with; defaults to the current one.
+    """
+    with (app or current_app).app_context():
+        # Transactions still in the write-behind buffer are written first
+        pending = clients.of(current_app).peek('transaction_buffer')
+        if pending is not None:
+            pending.flush()
+        unmatched = apply_status_updates(updates)
+        for item in unmatched:
+            if item.get('deferred'):
+                logger.warning(
+                    "Dropping callback for unknown checkout request %s",
+                    item['checkout_request_id']
+                )
+            else:
+                logger.info(
+                    "Callback for unknown checkout request %s kept for the next flush",
+                    item['checkout_request_id']
+                )
+                callback_buffer.add(item['checkout_request_id'], dict(item, deferred=True))
+
+def _create_callback_buffer(app):
+    """Create the callback buffer of an app; flushes run outside any app context."""
+    return BatchBuffer(
+        functools.partial(flush_callbacks, app=app),
+        batch_size=app.config['CALLBACK_BATCH_SIZE'],
+        interval=app.config['CALLBACK_FLUSH_INTERVAL']
+    )
+
+# Callback updates waiting to be written to the database in batches
+callback_buffer = clients.proxy('callback_buffer', _create_callback_buffer)
+
+def flush_transactions(rows, app):
+    """Insert a batch of buffered transactions.
+
+    If the batch is rejected by a constraint, the rows are inserted one by
+    one and only the rejected ones are dropped, so one bad row can't hold
+    back the others forever.
+
+    Args:
+        rows (list): Rows as returned by ``transaction_row``.
+        app (Flask): App to write with.
+    """
+    with app.app_context():
+        try:
+            record_transactions(rows)
+            return
+        except IntegrityError:
+            db.session.rollback()
+        for row in rows:
+            try:
+                record_transactions([row])
+            except IntegrityError:
+                db.session.rollback()
+                logger.error(
+                    "Dropping buffered transaction %s rejected by the database",
+                    row['checkout_request_id']
+                )
+
+def _create_transaction_buffer(app):
+    """Create the write-behind buffer of an app; flushes run outside any app context."""
+    return BatchBuffer(
+        functools.partial(flush_transactions, app=app),
+        batch_size=app.config['TRANSACTION_BATCH_SIZE'],
+        interval=app.config['TRANSACTION_FLUSH_INTERVAL']
+    )
+
+# Transactions waiting to be inserted in batches, with TRANSACTION_WRITE_BEHIND
+transaction_buffer = clients.proxy('transaction_buffer', _create_transaction_buffer)
@@ -0,0 +1,319 @@
+"""
+Module providing state shared by the worker processes of one deployment.
+
+Each worker process keeps its own access token and status caches, so N
+workers fetch N tokens and query Daraja for the same payment up to N times.
+With ``SHARED_STATE_URL`` set, the token managers and status caches also
+keep their entries in a store every worker reads:
+
+- ``memory://``: ``MemoryStore``, in this process only, e.g. for tests.
+- ``sqlite:///<path>``: ``SQLiteStore``, a SQLite file shared by the
+  workers of one host.
+- ``redis://...``: ``RedisStore``, a Redis server shared by every host;
+  needs the redis package.
+
+Values are JSON documents with a time to live. ``SharedStore.lock`` is a
+lock across processes, so one worker refreshes the token for all of them.
+"""
+
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from app.cache import TTLCache
+
+# Prefix of the keys of the locks taken with SharedStore.lock
+LOCK_PREFIX = 'lock:'
+
+
+class SharedStore:
+    """
+    Key-value store with expiring entries, shared by the processes using it.
+
+    Subclasses store JSON text with ``_read``, ``_write``, ``_add``,
+    ``_delete`` and ``_delete_prefix``; keys are strings.
+    """
+
+    def get(self, key):
+        """Return the value stored under ``key``, or None if it is missing or expired."""
+        text = self._read(key)
+        return None if text is None else json.loads(text)
+
+    def set(self, key, value, ttl):
+        """Store ``value`` under ``key`` for ``ttl`` seconds."""
+        if ttl > 0:
+            self._write(key, json.dumps(value), ttl)
+
+    def delete(self, key):
+        """Remove the value stored under ``key``."""
+        self._delete(key)
+
+    def delete_prefix(self, prefix):
+        """Remove every value stored under a key starting with ``prefix``."""
+        self._delete_prefix(prefix)
+
+    @contextmanager
+    def lock(self, key, ttl=30.0, timeout=10.0, poll=0.05):
+        """Hold the lock called ``key`` across processes while the block runs.
+
+        The lock expires after ``ttl`` seconds, so a process that dies
+        holding it doesn't block the others for good.
+
+        Yields:
+            bool: Whether the lock was acquired; False once ``timeout`` seconds
+                passed, so callers can go ahead unlocked rather than fail.
+        """
+        key = LOCK_PREFIX + key
+        owner = json.dumps(uuid.uuid4().hex)
+        deadline = time.monotonic() + timeout
+        acquired = self._add(key, owner, ttl)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(poll)
+            acquired = self._add(key, owner, ttl)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._delete(key, owner)
+
+    def _read(self, key):
+        """Return the text stored under ``key``, or None."""
+        raise NotImplementedError
+
+    def _write(self, key, text, ttl):
+        """Store ``text`` under ``key`` for ``ttl`` seconds."""
+        raise NotImplementedError
+
+    def _add(self, key, text, ttl):
+        """Store ``text`` under ``key`` unless a value is stored there; return whether it was."""
+        raise NotImplementedError
+
+    def _delete(self, key, text=None):
+        """Remove the value under ``key``, only if it is ``text`` when given."""
+        raise NotImplementedError
+
+    def _delete_prefix(self, prefix):
+        """Remove every value under a key starting with ``prefix``."""
+        raise NotImplementedError
+
+
+class MemoryStore(SharedStore):
+    """Store kept in this process, bounded to ``maxsize`` entries."""
+
+    def __init__(self, maxsize=100000, clock=time.monotonic):
+        self._entries = TTLCache(maxsize=maxsize, clock=clock)
+        self._lock = threading.Lock()
+
+    def _read(self, key):
+        return self._entries.get(key)
+
+    def _write(self, key, text, ttl):
+        self._entries.set(key, text, ttl)
+
+    def _add(self, key, text, ttl):
+        with self._lock:
+            if self._entries.get(key) is not None:
+                return False
+            self._entries.set(key, text, ttl)
+            return True
+
+    def _delete(self, key, text=None):
+        with self._lock:
+            if text is None or self._entries.get(key) == text:
+                self._entries.pop(key)
+
+    def _delete_prefix(self, prefix):
+        with self._lock:
+            for key in self._entries.keys():
+                if key.startswith(prefix):
+                    self._entries.pop(key)
+
+
+class SQLiteStore(SharedStore):
+    """
+    Store in a SQLite file, shared by the processes of one host.
+
+    Each thread of each process uses its own connection. Expiry times are
+    wall-clock times, as processes don't share a monotonic clock.
+    """
+
+    # Expired entries are purged every this many writes
+    PURGE_EVERY = 1000
+
+    def __init__(self, path, timeout=5.0, clock=time.time):
+        self.path = path
+        self.timeout = timeout
+        self._clock = clock
+        self._local = threading.local()
+        self._writes = 0
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS shared_state ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        """Return the connection of this thread, opening one in a forked child."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _read(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM shared_state WHERE key = ? AND expires_at > ?',
+            (key, self._clock())
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _write(self, key, text, ttl):
+        now = self._clock()
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, text, now + ttl)
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            connection.execute('DELETE FROM shared_state WHERE expires_at <= ?', (now,))
+
+    def _add(self, key, text, ttl):
+        now = self._clock()
+        # Takes the place of an expired entry, and of no live one
+        cursor = self._connection().execute(
+            'INSERT INTO shared_state (key, value, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'expires_at = excluded.expires_at WHERE shared_state.expires_at <= ?',
+            (key, text, now + ttl, now)
+        )
+        return cursor.rowcount == 1
+
+    def _delete(self, key, text=None):
+        if text is None:
+            self._connection().execute('DELETE FROM shared_state WHERE key = ?', (key,))
+        else:
+            self._connection().execute(
+                'DELETE FROM shared_state WHERE key = ? AND value = ?', (key, text)
+            )
+
+    def _delete_prefix(self, prefix):
+        self._connection().execute(
+            'DELETE FROM shared_state WHERE substr(key, 1, ?) = ?', (len(prefix), prefix)
+        )
+
+
+class RedisStore(SharedStore):
+    """
+    Store in a Redis server, or any server speaking its protocol.
+
+    Uses only GET, SET with NX and PX, DEL and SCAN, so a redis-py client or
+    a stand-in implementing ``get``, ``set``, ``delete`` and ``scan_iter``
+    works.
+    """
+
+    def __init__(self, client, prefix='mpesa:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url):
+        """Create a store on a new redis-py client of the server at ``url``."""
+        try:
+            redis = importlib.import_module('redis')
+        except ImportError as error:
+            raise RuntimeError("SHARED_STATE_URL 'redis://' needs the redis package.") from error
+        return cls(redis.Redis.from_url(url))
+
+    @staticmethod
+    def _milliseconds(ttl):
+        return max(1, int(ttl * 1000))
+
+    def _read(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def _write(self, key, text, ttl):
+        self.client.set(self.prefix + key, text, px=self._milliseconds(ttl))
+
+    def _add(self, key, text, ttl):
+        return bool(self.client.set(self.prefix + key, text, px=self._milliseconds(ttl), nx=True))
+
+    def _delete(self, key, text=None):
+        # A value compared before deleting may have expired and been replaced in
+        # between; the lock's time to live bounds how long that can go unnoticed
+        if text is None or self._read(key) == text:
+            self.client.delete(self.prefix + key)
+
+    def _delete_prefix(self, prefix):
+        keys = list(self.client.scan_iter(match=self.prefix + prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class SharedCache:
+    """
+    ``TTLCache``-like view of the entries of a store under a key prefix.
+
+    Attributes:
+        store (SharedStore): The store holding the entries.
+        prefix (str): Prefix of the keys of the entries.
+        ttl (float): Default seconds an entry stays valid.
+        hits (int): Number of lookups served from the store by this process.
+        misses (int): Number of lookups that found nothing valid.
+    """
+
+    def __init__(self, store, prefix, ttl=60.0):
+        self.store = store
+        self.prefix = prefix
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Return the value stored under ``key`` if it has not expired."""
+        value = self.store.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Store ``value`` under ``key`` for ``ttl`` seconds, or the default time to live."""
+        self.store.set(self.prefix + key, value, self.ttl if ttl is None else ttl)
+
+    def pop(self, key, default=None):
+        """Remove and return the value stored under ``key``."""
+        value = self.store.get(self.prefix + key)
+        self.store.delete(self.prefix + key)
+        return default if value is None else value
+
+    def clear(self):
+        """Remove every entry under the prefix."""
+        self.store.delete_prefix(self.prefix)
+
+
+def from_url(url):
+    """Create the store of a ``SHARED_STATE_URL``, or None if it is empty.
+
+    Raises:
+        ValueError: If the URL has an unknown scheme.
+    """
+    if not url:
+        return None
+    if url == 'memory://':
+        return MemoryStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStore.from_url(url)
+    raise ValueError(f"Unknown SHARED_STATE_URL scheme: {url.split(':', 1)[0]!r}.")
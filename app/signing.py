@@ -0,0 +1,101 @@
+"""
+Module providing the signing of STK push and status query requests.
+
+Every STK push and query carries a ``Timestamp`` and a ``Password``, the
+base64 of the shortcode, passkey and that timestamp. A ``Signer`` encodes the
+shortcode and passkey once, computes the pair once per second, and copies
+prebuilt request bodies, so signing a request costs a clock read and a dict
+copy.
+"""
+
+import base64
+import time
+
+# Format of the Timestamp field, in local time
+TIMESTAMP_FORMAT = '%Y%m%d%H%M%S'
+
+
+class Signer:
+    """
+    Signs and builds the STK push and query requests of one shortcode.
+
+    Attributes:
+        shortcode (str): Business shortcode of the paybill.
+        confirmation_url (str): Callback URL of its STK pushes.
+    """
+
+    def __init__(self, shortcode, passkey, confirmation_url=None, clock=time.time):
+        """
+        Args:
+            shortcode (str): Business shortcode of the paybill.
+            passkey (str): Passkey of the shortcode.
+            confirmation_url (str): Callback URL of its STK pushes.
+            clock (callable): Wall clock returning seconds since the epoch.
+        """
+        self.shortcode = shortcode
+        self.confirmation_url = confirmation_url
+        self._clock = clock
+        self._prefix = f"{shortcode}{passkey}".encode()
+        # (second, (password, timestamp)) of the last signed second, replaced as a whole
+        self._current = (None, None)
+        business_shortcode = int(shortcode)
+        self._push_template = {
+            "BusinessShortCode": business_shortcode,
+            "Password": None,
+            "Timestamp": None,
+            "TransactionType": "CustomerPayBillOnline",
+            "Amount": None,
+            "PartyA": None,
+            "PartyB": business_shortcode,
+            "PhoneNumber": None,
+            "CallBackURL": confirmation_url,
+            "AccountReference": "CompanyXLTD",
+            "TransactionDesc": "Payment of X"
+        }
+        self._query_template = {
+            "BusinessShortCode": business_shortcode,
+            "Password": None,
+            "Timestamp": None,
+            "CheckoutRequestID": None
+        }
+
+    def credentials(self):
+        """Return the password and timestamp of the current second.
+
+        Both come from one clock reading, so they always match.
+
+        Returns:
+            tuple: ``(password, timestamp)``.
+        """
+        second = int(self._clock())
+        current_second, credentials = self._current
+        if second != current_second:
+            timestamp = time.strftime(TIMESTAMP_FORMAT, time.localtime(second))
+            password = base64.b64encode(self._prefix + timestamp.encode()).decode()
+            credentials = (password, timestamp)
+            self._current = (second, credentials)
+        return credentials
+
+    def password(self):
+        """Return the password of the current second."""
+        return self.credentials()[0]
+
+    def stk_push_payload(self, phone_number, amount):
+        """Build the request body of an STK push."""
+        password, timestamp = self.credentials()
+        payload = self._push_template.copy()
+        payload['Password'] = password
+        payload['Timestamp'] = timestamp
+        payload['Amount'] = amount
+        payload['PartyA'] = phone_number
+        payload['PhoneNumber'] = phone_number
+        return payload
+
+    def stk_query_payload(self, checkout_request_id):
+        """Build the request body of an STK push status query."""
+        password, timestamp = self.credentials()
+        payload = self._query_template.copy()
+        payload['Password'] = password
+        payload['Timestamp'] = timestamp
+        payload['CheckoutRequestID'] = checkout_request_id
+        return payload
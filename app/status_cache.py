@@ -0,0 +1,102 @@
+"""
+Module providing a cache of transaction status query responses.
+
+Clients poll the status of a payment every second or so while the customer
+enters their PIN. Responses carrying the result of the payment can't change
+any more and are kept for a long time; responses saying the payment is still
+being processed are kept for a few seconds, and concurrent queries for one
+checkout request share a single upstream call. Other errors are not cached.
+Given a shared store (see ``app.shared_state``), responses are kept there
+instead and a load holds the store's lock on its checkout request, so one
+worker process queries Daraja and its response serves them all.
+"""
+
+from app.cache import SingleFlight, TTLCache
+from app.shared_state import SharedCache
+
+# Prefix of the keys of the responses in a shared store
+SHARED_PREFIX = 'transaction_status:'
+
+# Daraja errorCode of a status query for a payment that is still being processed
+PROCESSING_ERROR = '500.001.1001'
+
+
+def is_final(response):
+    """Whether a status query response carries the result of the payment."""
+    return isinstance(response, dict) and 'ResultCode' in response
+
+
+def is_processing(response):
+    """Whether a status query response says the payment is still being processed."""
+    return isinstance(response, dict) and response.get('errorCode') == PROCESSING_ERROR
+
+
+class StatusCache:
+    """
+    Status query responses by checkout request ID.
+
+    Attributes:
+        pending_ttl (float): Seconds a "still being processed" response is served.
+        final_ttl (float): Seconds a response with a result is served.
+        cache (TTLCache): The cached responses, or a ``SharedCache`` of them in a store.
+    """
+
+    def __init__(self, pending_ttl=2.0, final_ttl=3600.0, cache_size=10000, store=None):
+        self.pending_ttl = pending_ttl
+        self.final_ttl = final_ttl
+        if store is None:
+            self.cache = TTLCache(maxsize=cache_size, ttl=final_ttl)
+        else:
+            self.cache = SharedCache(store, SHARED_PREFIX, ttl=final_ttl)
+        self._store = store
+        self._flights = SingleFlight()
+
+    @classmethod
+    def from_config(cls, config, store=None):
+        """Create a cache from the application configuration, in ``store`` if given."""
+        return cls(
+            pending_ttl=config['STATUS_CACHE_PENDING_TTL'],
+            final_ttl=config['STATUS_CACHE_FINAL_TTL'],
+            cache_size=config['STATUS_CACHE_SIZE'],
+            store=store
+        )
+
+    def get(self, checkout_request_id):
+        """Return the cached response for ``checkout_request_id``, or None."""
+        return self.cache.get(checkout_request_id)
+
+    def remember(self, checkout_request_id, response):
+        """Cache ``response`` for as long as its kind stays valid."""
+        if is_final(response):
+            self.cache.set(checkout_request_id, response, self.final_ttl)
+        elif is_processing(response):
+            self.cache.set(checkout_request_id, response, self.pending_ttl)
+
+    def invalidate(self, checkout_request_id):
+        """Drop the cached response for ``checkout_request_id``."""
+        self.cache.pop(checkout_request_id)
+
+    def lookup(self, checkout_request_id, load):
+        """Return the cached response, or the one ``load()`` produces.
+
+        Concurrent lookups of an uncached ID wait for a single ``load`` call,
+        in every process sharing the store if there is one.
+        """
+        response = self.cache.get(checkout_request_id)
+        if response is not None:
+            return response
+
+        def load_and_remember():
+            response = load()
+            self.remember(checkout_request_id, response)
+            return response
+
+        def load_once_across_processes():
+            with self._store.lock(SHARED_PREFIX + checkout_request_id):
+                # Another process may have loaded it while this one waited
+                response = self.cache.get(checkout_request_id)
+                return load_and_remember() if response is None else response
+
+        if self._store is not None:
+            return self._flights.do(checkout_request_id, load_once_across_processes)
+        return self._flights.do(checkout_request_id, load_and_remember)
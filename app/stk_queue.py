@@ -0,0 +1,227 @@
+"""
+Module providing a durable, database-backed queue of STK push requests.
+
+In 'accepted' mode the API only stores the request and answers 202. Queue
+workers, started with ``python worker.py``, claim queued requests, send them
+with ``services.initiate_stk_push`` and record the outcome, so a slow or
+failing Daraja no longer holds up or fails the API request itself.
+"""
+
+import logging
+import multiprocessing
+import threading
+import uuid
+from sqlalchemy import select, update
+from app import create_app, db, metrics, models, services
+from app.guards import CallRejectedError
+from app.tenants import TenantBusyError
+
+logger = logging.getLogger(__name__)
+
+
+@metrics.DB_OPERATION_SECONDS.time(operation='enqueue_stk_push')
+def enqueue(full_name, phone_number, amount, shortcode=None):
+    """Store an STK push request for the queue workers.
+
+    Args:
+        shortcode (str): Shortcode of the tenant to pay; None for the default tenant.
+
+    Returns:
+        StkPushRequest: The queued request.
+    """
+    push_request = models.StkPushRequest(
+        full_name=full_name,
+        phone_number=str(phone_number),
+        amount=amount,
+        shortcode=shortcode,
+        status=models.QUEUED
+    )
+    db.session.add(push_request)
+    db.session.commit()
+    return push_request
+
+
+def queue_depth():
+    """Report the number of queued and in-flight requests and the age of the oldest queued one.
+
+    Returns:
+        dict: ``queued`` and ``processing`` counts and ``lag_seconds``.
+    """
+    push_request = models.StkPushRequest
+    counts = dict(db.session.query(push_request.status, db.func.count(push_request.id)).filter(
+        push_request.status.in_((models.QUEUED, models.PROCESSING))
+    ).group_by(push_request.status).all())
+    oldest = db.session.query(db.func.min(push_request.created_at)).filter(
+        push_request.status == models.QUEUED
+    ).scalar()
+    lag = (models.utcnow() - oldest).total_seconds() if oldest else 0.0
+    return {
+        'queued': counts.get(models.QUEUED, 0),
+        'processing': counts.get(models.PROCESSING, 0),
+        'lag_seconds': round(lag, 3),
+    }
+
+
+class StkPushWorker:
+    """
+    Drains the STK push queue.
+
+    Requests are claimed with a single conditional UPDATE, so any number of
+    workers, in any number of processes, can share the queue without sending
+    a push twice. A request whose worker died while sending it stays
+    'Processing' rather than being retried, since M-Pesa may already have
+    prompted the customer.
+
+    Must be used inside an application context.
+
+    Attributes:
+        batch_size (int): Maximum number of requests claimed at a time.
+        poll_interval (float): Seconds to wait when the queue is empty.
+        sent (int): Number of requests sent and accepted by M-Pesa.
+        failed (int): Number of requests that failed.
+    """
+
+    def __init__(self, batch_size=10, poll_interval=0.5):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.sent = 0
+        self.failed = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a worker from the application configuration."""
+        return cls(
+            batch_size=config['STK_QUEUE_BATCH_SIZE'],
+            poll_interval=config['STK_QUEUE_POLL_INTERVAL']
+        )
+
+    @metrics.DB_OPERATION_SECONDS.time(operation='claim_stk_pushes')
+    def claim(self):
+        """Mark the oldest queued requests as processing by this worker.
+
+        Returns:
+            list: The claimed ``StkPushRequest`` rows.
+        """
+        table = models.StkPushRequest.__table__
+        token = uuid.uuid4().hex
+        oldest = select(table.c.id).where(
+            table.c.status == models.QUEUED
+        ).order_by(table.c.id).limit(self.batch_size).scalar_subquery()
+        db.session.execute(update(table).where(
+            table.c.id.in_(oldest),
+            # Re-checked against the current row, so a concurrent claim wins only once
+            table.c.status == models.QUEUED
+        ).values(status=models.PROCESSING, claimed_by=token, updated_at=models.utcnow()))
+        db.session.commit()
+        return models.StkPushRequest.query.filter_by(
+            claimed_by=token, status=models.PROCESSING
+        ).order_by(models.StkPushRequest.id).all()
+
+    def process(self, push_request):
+        """Send one claimed request and record its outcome.
+
+        A request whose tenant is over its limits, or that Daraja's circuit
+        breaker or rate limit turns away, goes back to the queue.
+
+        Returns:
+            bool: False if the request went back to the queue.
+        """
+        try:
+            response = services.initiate_stk_push(
+                push_request.full_name, int(push_request.phone_number), push_request.amount,
+                tenant=services.tenant_registry.for_shortcode(push_request.shortcode)
+            )
+        except (TenantBusyError, CallRejectedError) as error:
+            logger.info("Queued STK push %s put back: %s", push_request.id, error)
+            db.session.rollback()
+            push_request.status = models.QUEUED
+            push_request.claimed_by = None
+            db.session.commit()
+            return False
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            logger.warning("Queued STK push %s failed: %s", push_request.id, error)
+            db.session.rollback()
+            push_request.status = models.FAILED
+            push_request.error = str(error)[:255]
+        else:
+            push_request.response = response
+            push_request.checkout_request_id = response.get('CheckoutRequestID')
+            if response.get('ResponseCode') == '0':
+                push_request.status = models.SENT
+            else:
+                push_request.status = models.FAILED
+                push_request.error = str(
+                    response.get('ResponseDescription') or response.get('errorMessage')
+                )[:255]
+        db.session.commit()
+        if push_request.status == models.SENT:
+            self.sent += 1
+        else:
+            self.failed += 1
+        return True
+
+    def run_once(self):
+        """Claim and send one batch of requests.
+
+        Returns:
+            int: Number of requests processed; those put back in the queue
+                don't count, so a worker whose pushes are all turned away waits
+                before claiming them again.
+        """
+        return sum(self.process(push_request) for push_request in self.claim())
+
+    def run_forever(self, stop=None):
+        """Drain the queue until ``stop`` is set, polling while it is empty."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                processed = self.run_once()
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("STK push queue run failed")
+                processed = 0
+            finally:
+                db.session.remove()
+            if not processed:
+                stop.wait(self.poll_interval)
+
+
+def run_worker(app, stop=None):
+    """Run one queue worker in its own application context of ``app``."""
+    with app.app_context():
+        StkPushWorker.from_config(app.config).run_forever(stop)
+
+
+def _run_worker_process(stop=None):
+    """Run one queue worker in a child process, with an app of its own."""
+    run_worker(create_app(), stop)
+
+
+def start_workers(app, count, worker_type='thread', stop=None):
+    """Start ``count`` queue workers as daemon threads or processes.
+
+    Thread workers use ``app``; process workers create their own app from
+    the environment, as an app can't be handed to another process.
+
+    Args:
+        app (Flask): Application of thread workers.
+        count (int): Number of workers.
+        worker_type (str): 'thread' or 'process'.
+        stop: Event that stops the workers once set; a ``multiprocessing.Event``
+            for process workers.
+
+    Returns:
+        list: The started ``threading.Thread`` or ``multiprocessing.Process`` objects.
+    """
+    if worker_type == 'process':
+        factory, target, args = multiprocessing.Process, _run_worker_process, (stop,)
+    elif worker_type == 'thread':
+        factory, target, args = threading.Thread, run_worker, (app, stop)
+    else:
+        raise ValueError(f"Unknown worker type '{worker_type}'.")
+    workers = [
+        factory(target=target, args=args, name=f'stk-queue-{number}', daemon=True)
+        for number in range(count)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers
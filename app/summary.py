@@ -0,0 +1,243 @@
+"""
+Module providing the daily transaction summary.
+
+The ``transaction_summary`` table holds the number and total amount of the
+transactions created each day, by status and shortcode. It is changed in the
+database transaction that records or updates the transactions (see
+``services.record_transactions`` and ``services.apply_status_updates``), so
+reports read a few rows per day instead of scanning ``mpesa_transaction``.
+``rebuild``, also run by ``flask summary rebuild``, recomputes it from the
+transactions, e.g. after a backfill.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, time
+import click
+from flask import current_app
+from sqlalchemy import and_, delete, func, insert, select, union_all, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from app import db, models
+
+# Stored in place of a missing shortcode, as the shortcode is part of the primary key
+NO_SHORTCODE = ''
+
+
+def enabled():
+    """Whether the summary is kept up to date by the current app."""
+    return current_app.config['TRANSACTION_SUMMARY_ENABLED']
+
+
+def _key(created_at, status, shortcode):
+    """Summary row of a transaction."""
+    return (created_at.date(), status or models.PENDING, shortcode or NO_SHORTCODE)
+
+
+def inserted(rows):
+    """Changes to the summary of inserting transactions.
+
+    Args:
+        rows (list): Rows of the transactions, with their ``created_at``.
+
+    Returns:
+        dict: ``[count, amount]`` to add by ``(day, status, shortcode)``.
+    """
+    changes = defaultdict(lambda: [0, 0])
+    for row in rows:
+        change = changes[_key(row['created_at'], row.get('status'), row.get('shortcode'))]
+        change[0] += 1
+        change[1] += row['amount']
+    return changes
+
+
+def moved(transactions, updates):
+    """Changes to the summary of updating pending transactions.
+
+    Args:
+        transactions (dict): ``created_at``, ``shortcode`` and ``amount`` of
+            the pending transactions updated, by checkout request ID.
+        updates (list): The updates, in the order they were applied; only the
+            first one of a transaction changes it.
+
+    Returns:
+        dict: ``[count, amount]`` to add by ``(day, status, shortcode)``.
+    """
+    changes = defaultdict(lambda: [0, 0])
+    transactions = dict(transactions)
+    for item in updates:
+        transaction = transactions.pop(item['checkout_request_id'], None)
+        if transaction is None or item['status'] == models.PENDING:
+            continue
+        before = changes[_key(transaction.created_at, models.PENDING, transaction.shortcode)]
+        after = changes[_key(transaction.created_at, item['status'], transaction.shortcode)]
+        before[0] -= 1
+        before[1] -= transaction.amount
+        after[0] += 1
+        after[1] += transaction.amount
+    return changes
+
+
+def _upsert(table):
+    """Statement adding counts and amounts to the rows of ``table``, or None if unsupported."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        module = sqlite if dialect == 'sqlite' else postgresql
+        statement = module.insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c.day, table.c.status, table.c.shortcode],
+            set_={
+                'count': table.c.count + statement.excluded['count'],
+                'amount': table.c.amount + statement.excluded.amount,
+            }
+        )
+    if dialect in ('mysql', 'mariadb'):
+        statement = mysql.insert(table)
+        return statement.on_duplicate_key_update(
+            count=table.c.count + statement.inserted['count'],
+            amount=table.c.amount + statement.inserted.amount
+        )
+    return None
+
+
+def apply(changes):
+    """Add changes to the summary in the current database transaction, without committing.
+
+    Args:
+        changes (dict): ``[count, amount]`` to add by ``(day, status, shortcode)``,
+            as returned by ``inserted`` or ``moved``.
+    """
+    # Sorted, so concurrent writers lock the summary rows in the same order
+    rows = [
+        {'day': day, 'status': status, 'shortcode': shortcode, 'count': count, 'amount': amount}
+        for (day, status, shortcode), (count, amount) in sorted(changes.items())
+        if count or amount
+    ]
+    if not rows:
+        return
+    table = models.TransactionSummary.__table__
+    statement = _upsert(table)
+    if statement is not None:
+        db.session.execute(statement, rows)
+        return
+    for row in rows:
+        result = db.session.execute(update(table).where(and_(
+            table.c.day == row['day'],
+            table.c.status == row['status'],
+            table.c.shortcode == row['shortcode']
+        )).values(count=table.c.count + row['count'], amount=table.c.amount + row['amount']))
+        if result.rowcount == 0:
+            db.session.execute(insert(table), [row])
+
+
+def rebuild(start=None, end=None):
+    """Recompute the summary of the days from ``start`` up to, not including, ``end``.
+
+    Live and archived transactions are both counted. Transactions written
+    while it runs may be missed, so rebuild past days or pause writers.
+
+    Args:
+        start (date): First day to rebuild; None for the first transaction's.
+        end (date): Day after the last one to rebuild; None for no limit.
+
+    Returns:
+        int: Number of summary rows written.
+    """
+    table = models.TransactionSummary.__table__
+    clear = delete(table)
+    sources = []
+    for source in (models.MpesaTransaction.__table__, models.ArchivedTransaction.__table__):
+        query = select(source.c.created_at, source.c.status, source.c.shortcode, source.c.amount)
+        if start is not None:
+            query = query.where(source.c.created_at >= datetime.combine(start, time()))
+        if end is not None:
+            query = query.where(source.c.created_at < datetime.combine(end, time()))
+        sources.append(query)
+    if start is not None:
+        clear = clear.where(table.c.day >= start)
+    if end is not None:
+        clear = clear.where(table.c.day < end)
+
+    transaction = union_all(*sources).subquery()
+    day = func.date(transaction.c.created_at).label('day')
+    status = func.coalesce(transaction.c.status, models.PENDING).label('status')
+    shortcode = func.coalesce(transaction.c.shortcode, NO_SHORTCODE).label('shortcode')
+    query = select(
+        day, status, shortcode, func.count(), func.coalesce(func.sum(transaction.c.amount), 0)
+    ).group_by(day, status, shortcode)
+    db.session.execute(clear)
+    result = db.session.execute(insert(table).from_select(
+        ['day', 'status', 'shortcode', 'count', 'amount'], query
+    ))
+    db.session.commit()
+    return result.rowcount
+
+
+def aggregate(start=None, end=None, status=None, shortcode=None):
+    """Read the summary of the days from ``start`` up to, not including, ``end``.
+
+    Returns:
+        dict: ``days``, the ``day``, ``status``, ``shortcode``, ``count`` and
+            ``amount`` of every summary row, oldest first, and ``totals``, the
+            ``count`` and ``amount`` of every status over all of them.
+    """
+    summary = models.TransactionSummary
+    query = select(
+        summary.day, summary.status, summary.shortcode, summary.count, summary.amount
+    ).where(summary.count != 0).order_by(summary.day, summary.status, summary.shortcode)
+    if start is not None:
+        query = query.where(summary.day >= start)
+    if end is not None:
+        query = query.where(summary.day < end)
+    if status is not None:
+        query = query.where(summary.status == status)
+    if shortcode is not None:
+        query = query.where(summary.shortcode == shortcode)
+
+    days = []
+    totals = defaultdict(lambda: {'count': 0, 'amount': 0})
+    for day, row_status, row_shortcode, count, amount in db.session.execute(query):
+        days.append({
+            'day': day.isoformat(),
+            'status': row_status,
+            'shortcode': row_shortcode or None,
+            'count': count,
+            'amount': amount,
+        })
+        totals[row_status]['count'] += count
+        totals[row_status]['amount'] += amount
+    return {'days': days, 'totals': dict(totals)}
+
+
+def parse_day(value, name):
+    """Read an ISO 8601 date argument, or None if it is empty.
+
+    Raises:
+        ValueError: If it is not an ISO 8601 date.
+    """
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name.capitalize()} must be an ISO 8601 date.") from None
+
+
+@click.group('summary')
+def cli():
+    """Manage the daily transaction summary."""
+
+
+@cli.command('rebuild')
+@click.option('--start', help='First day to rebuild, as YYYY-MM-DD; default the first.')
+@click.option('--end', help='Day after the last one to rebuild, as YYYY-MM-DD; default none.')
+def rebuild_command(start, end):
+    """Recompute the daily transaction summary from the transactions."""
+    try:
+        start, end = parse_day(start, 'start'), parse_day(end, 'end')
+    except ValueError as error:
+        raise click.BadParameter(str(error)) from None
+    click.echo(f"Wrote {rebuild(start, end)} summary rows.")
+
+
+def init_app(app):
+    """Register the ``flask summary`` commands."""
+    app.cli.add_command(cli)
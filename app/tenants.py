@@ -0,0 +1,233 @@
+"""
+Module providing the registry of the M-Pesa paybills (tenants) served by the app.
+
+Every tenant has its own shortcode, passkey and Daraja credentials, and its
+own access token cache, pooled Daraja client, rate limit and budget of
+concurrent Daraja calls, so one process can serve many paybills without a
+busy one using up the connections or Daraja quota of the others. The paybill
+of the ``MPESA_*`` settings is always registered, as ``default``; others are
+listed in ``MPESA_TENANTS``.
+"""
+
+import json
+import threading
+from contextlib import contextmanager
+from app.ratelimit import RateLimiter
+from app.signing import Signer
+
+# Name of the tenant of the MPESA_* settings
+DEFAULT = 'default'
+
+# Settings every tenant of MPESA_TENANTS must have, and the ones it may have
+REQUIRED_SETTINGS = ('name', 'shortcode', 'passkey', 'consumer_key', 'consumer_secret')
+OPTIONAL_SETTINGS = ('confirmation_url', 'rate', 'concurrency', 'queue_timeout', 'pool_size')
+
+
+class UnknownTenantError(ValueError):
+    """No tenant has the requested name or shortcode."""
+
+
+class TenantBusyError(RuntimeError):
+    """A tenant's Daraja calls did not get under its limits in time."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Too many M-Pesa requests for tenant '{name}', try again later.")
+        self.retry_after = retry_after
+
+
+def load_tenants(value):
+    """Read the tenants of ``MPESA_TENANTS``.
+
+    Args:
+        value: A list of tenant settings, a JSON array of them, the path of a
+            JSON file holding one, or empty for none.
+
+    Returns:
+        list: The settings of each tenant.
+
+    Raises:
+        ValueError: If the value isn't a list of objects, or a tenant lacks a
+            required setting or has an unknown one.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        if value.lstrip().startswith(('[', '{')):
+            value = json.loads(value)
+        else:
+            with open(value, encoding='utf-8') as file:
+                value = json.load(file)
+    if not isinstance(value, list) or not all(isinstance(item, dict) for item in value):
+        raise ValueError('MPESA_TENANTS must be a list of objects.')
+    for item in value:
+        missing = [key for key in REQUIRED_SETTINGS if not item.get(key)]
+        unknown = set(item) - set(REQUIRED_SETTINGS) - set(OPTIONAL_SETTINGS)
+        if missing or unknown:
+            raise ValueError(
+                f"Tenant '{item.get('name', '')}' lacks {sorted(missing)} "
+                f"or has unknown settings {sorted(unknown)}."
+            )
+    return value
+
+
+class Tenant:
+    """
+    One paybill and the limits on its Daraja calls.
+
+    ``client`` and ``token_manager`` are given to the tenant by the registry's
+    owner (see ``services.tenant_registry``).
+
+    Attributes:
+        name (str): Name requests use to pick the tenant.
+        shortcode (str): Business shortcode of the paybill.
+        passkey (str): Passkey of the shortcode.
+        consumer_key (str): Consumer key of its Daraja app.
+        consumer_secret (str): Consumer secret of its Daraja app.
+        confirmation_url (str): Callback URL of its STK pushes.
+        concurrency (int): Maximum number of its Daraja calls in flight; 0 for no limit.
+        queue_timeout (float): Seconds a call waits to get under the limits.
+        pool_size (int): Kept-alive connections of its client; None for the default.
+        limiter (RateLimiter): Its Daraja calls per second.
+        client (DarajaClient): Pooled HTTP client of its Daraja calls.
+        token_manager (TokenManager): Cache of its access token.
+        signer (Signer): Signer and prebuilt bodies of its STK push and query requests.
+    """
+
+    def __init__(self, name, shortcode, passkey, consumer_key, consumer_secret,
+                 confirmation_url=None, rate=0.0, concurrency=0, queue_timeout=1.0,
+                 pool_size=None):
+        self.name = name
+        self.shortcode = str(shortcode) if shortcode is not None else None
+        self.passkey = passkey
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.confirmation_url = confirmation_url
+        self.concurrency = concurrency
+        self.queue_timeout = queue_timeout
+        self.pool_size = pool_size
+        self.limiter = RateLimiter(rate)
+        self._slots = threading.BoundedSemaphore(concurrency) if concurrency > 0 else None
+        self.client = None
+        self.token_manager = None
+        self._signer = None
+
+    @property
+    def signer(self):
+        """Signer of the tenant's requests, created on first use."""
+        if self._signer is None:
+            self._signer = Signer(self.shortcode, self.passkey, self.confirmation_url)
+        return self._signer
+
+    @property
+    def limited(self):
+        """Whether the tenant's calls have a rate limit or a concurrency budget."""
+        return self._slots is not None or self.limiter.rate > 0
+
+    def acquire(self):
+        """Take a slot of the concurrency budget and a token of the rate limit.
+
+        Raises:
+            TenantBusyError: If they don't free up within ``queue_timeout``.
+        """
+        if self._slots is not None and not self._slots.acquire(timeout=self.queue_timeout):
+            raise TenantBusyError(self.name, self.queue_timeout)
+        if not self.limiter.acquire(timeout=self.queue_timeout):
+            self.release()
+            raise TenantBusyError(self.name, 1 / self.limiter.rate)
+
+    def release(self):
+        """Give back the slot taken by ``acquire``."""
+        if self._slots is not None:
+            self._slots.release()
+
+    @contextmanager
+    def budget(self):
+        """Hold a slot of the concurrency budget, and a rate limit token, for one call."""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def __repr__(self):
+        return f"Tenant(name='{self.name}', shortcode='{self.shortcode}')"
+
+
+class TenantRegistry:
+    """
+    The tenants of an app, by name and by shortcode.
+
+    Attributes:
+        default (Tenant): The tenant of the ``MPESA_*`` settings.
+    """
+
+    def __init__(self, tenants):
+        self._by_name = {}
+        self._by_shortcode = {}
+        for tenant in tenants:
+            if tenant.name in self._by_name or tenant.shortcode in self._by_shortcode:
+                raise ValueError(f"Tenant '{tenant.name}' repeats a name or shortcode.")
+            self._by_name[tenant.name] = tenant
+            self._by_shortcode[tenant.shortcode] = tenant
+        self.default = self._by_name[DEFAULT]
+
+    @classmethod
+    def from_config(cls, config):
+        """Create the registry of the default tenant and those of ``MPESA_TENANTS``."""
+        defaults = {
+            'confirmation_url': config['MPESA_CONFIRMATION_URL'],
+            'rate': config['MPESA_TENANT_RATE'],
+            'concurrency': config['MPESA_TENANT_CONCURRENCY'],
+            'queue_timeout': config['MPESA_TENANT_QUEUE_TIMEOUT'],
+        }
+        default = Tenant(
+            DEFAULT, config['MPESA_SHORTCODE'], config['MPESA_PASSKEY'],
+            config['MPESA_CONSUMER_KEY'], config['MPESA_CONSUMER_SECRET'], **defaults
+        )
+        return cls([default] + [
+            Tenant(**dict(defaults, **settings))
+            for settings in load_tenants(config['MPESA_TENANTS'])
+        ])
+
+    def get(self, key=None):
+        """Return the tenant with the name or shortcode ``key``.
+
+        Args:
+            key: A name or shortcode, a ``Tenant``, or None for the default tenant.
+
+        Raises:
+            UnknownTenantError: If no tenant has that name or shortcode.
+        """
+        if key is None:
+            return self.default
+        if isinstance(key, Tenant):
+            return key
+        tenant = self._by_name.get(str(key)) or self._by_shortcode.get(str(key))
+        if tenant is None:
+            raise UnknownTenantError(f"Unknown tenant '{key}'.")
+        return tenant
+
+    def for_shortcode(self, shortcode):
+        """Return the tenant of a stored shortcode; rows stored without one are the default's.
+
+        Raises:
+            UnknownTenantError: If no tenant has that shortcode any more.
+        """
+        if shortcode is None:
+            return self.default
+        try:
+            return self._by_shortcode[str(shortcode)]
+        except KeyError:
+            raise UnknownTenantError(f"No tenant has the shortcode '{shortcode}'.") from None
+
+    def __iter__(self):
+        return iter(self._by_name.values())
+
+    def __len__(self):
+        return len(self._by_name)
+
+
+def init_app(app):
+    """Read ``MPESA_TENANTS`` once and check the tenants, so bad settings fail at startup."""
+    app.config['MPESA_TENANTS'] = load_tenants(app.config['MPESA_TENANTS'])
+    TenantRegistry.from_config(app.config)
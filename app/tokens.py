@@ -0,0 +1,191 @@
+"""
+Module providing a cached, thread-safe access token manager for the M-Pesa API.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """A token fetch that concurrent callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.token = None
+        self.error = None
+
+
+class TokenManager:
+    """
+    Caches an OAuth access token and refreshes it before it expires.
+
+    Callers that find the cache empty or expired share a single in-flight
+    fetch instead of each requesting a new token. Once a cached token enters
+    the refresh-ahead window, a background fetch replaces it while callers
+    keep being served the current one.
+
+    With a shared ``store`` (see ``app.shared_state``), the token is kept
+    there too under ``key``: a manager needing a token first takes the one
+    another process stored, and only fetches one while holding the store's
+    lock on ``key``, so one fetch serves every process.
+
+    Attributes:
+        expiry_margin (int): Seconds before expiry at which a token is no longer served.
+        refresh_ahead (int): Seconds before expiry at which a background refresh starts.
+        hits (int): Number of calls served from the cache.
+        misses (int): Number of calls that had to wait for a fetch.
+        refreshes (int): Number of successful fetches from the OAuth endpoint.
+        failures (int): Number of failed fetches.
+        shared (int): Number of tokens taken from the shared store instead of fetched.
+    """
+
+    # pylint: disable-next=too-many-arguments
+    def __init__(self, fetch_token, expiry_margin=60, refresh_ahead=300, clock=time.monotonic,
+                 *, store=None, key='access_token', wall_clock=time.time):
+        """
+        Args:
+            fetch_token (callable): Returns an ``(access_token, expires_in)`` tuple.
+            expiry_margin (int): Seconds before expiry at which a token is no longer served.
+            refresh_ahead (int): Seconds before expiry at which a background refresh starts.
+            clock (callable): Monotonic clock returning seconds.
+            store (SharedStore): Store sharing the token with other processes, or None.
+            key (str): Key of the token in ``store``.
+            wall_clock (callable): Clock returning seconds since the epoch, for
+                the expiry times kept in ``store``.
+        """
+        self._fetch_token = fetch_token
+        self.expiry_margin = expiry_margin
+        self.refresh_ahead = refresh_ahead
+        self._clock = clock
+        self._store = store
+        self.key = key
+        self._wall_clock = wall_clock
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+        self._flight = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.shared = 0
+
+    def get_token(self):
+        """Return a valid access token, fetching one only if the cache cannot serve it."""
+        with self._lock:
+            now = self._clock()
+            if self._token is not None and now < self._expires_at - self.expiry_margin:
+                self.hits += 1
+                if now >= self._expires_at - self.refresh_ahead and self._flight is None:
+                    flight = self._flight = _Flight()
+                    threading.Thread(
+                        target=self._run, args=(flight, self.refresh_ahead), daemon=True
+                    ).start()
+                return self._token
+
+            self.misses += 1
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight()
+
+        if leader:
+            self._run(flight, self.expiry_margin)
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.token
+
+    def invalidate(self, token=None):
+        """Drop the cached token so that the next call fetches a new one.
+
+        Args:
+            token (str): Only drop the cached token if it is this one, so that
+                callers rejected with an old token don't discard a fresh one.
+        """
+        with self._lock:
+            if token is not None and token != self._token:
+                return
+            self._token = None
+            self._expires_at = 0.0
+        if self._store is not None:
+            shared = self._store.get(self.key)
+            if shared is not None and (token is None or shared['token'] == token):
+                self._store.delete(self.key)
+
+    def stats(self):
+        """Return the cache counters as a dictionary."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'failures': self.failures,
+                'shared': self.shared,
+            }
+
+    def _shared_token(self, min_ttl):
+        """Return the shared token and its seconds to live if it has more than ``min_ttl``."""
+        entry = self._store.get(self.key)
+        if entry is None:
+            return None
+        expires_in = entry['expires_at'] - self._wall_clock()
+        if expires_in <= min_ttl:
+            return None
+        with self._lock:
+            self.shared += 1
+        return entry['token'], expires_in
+
+    def _load(self, min_ttl):
+        """Return a token with more than ``min_ttl`` seconds to live and its lifetime.
+
+        Without a store, or with a stale one, fetches it; in the store, only
+        the process holding the lock fetches and the others take its token.
+        """
+        if self._store is None:
+            return self._fetch()
+        shared = self._shared_token(min_ttl)
+        if shared is not None:
+            return shared
+        with self._store.lock(self.key):
+            # Another process may have stored one while this one waited
+            shared = self._shared_token(min_ttl)
+            if shared is not None:
+                return shared
+            token, expires_in = self._fetch()
+            self._store.set(
+                self.key, {'token': token, 'expires_at': self._wall_clock() + expires_in},
+                expires_in
+            )
+            return token, expires_in
+
+    def _fetch(self):
+        """Fetch a token from the OAuth endpoint."""
+        token, expires_in = self._fetch_token()
+        with self._lock:
+            self.refreshes += 1
+        return token, expires_in
+
+    def _run(self, flight, min_ttl):
+        """Load a token on behalf of every caller waiting on ``flight``."""
+        try:
+            token, expires_in = self._load(min_ttl)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            logger.warning("Access token fetch failed: %s", error)
+            with self._lock:
+                self.failures += 1
+                self._flight = None
+            flight.error = error
+        else:
+            with self._lock:
+                self._token = token
+                self._expires_at = self._clock() + expires_in
+                self._flight = None
+            flight.token = token
+        finally:
+            flight.done.set()
@@ -0,0 +1,165 @@
+"""
+Module providing the validation of request bodies.
+
+A ``Schema`` is compiled once per app from the field converters of an
+endpoint: each converter checks and normalizes one field and raises
+``ValidationError`` with the message returned to the client. Validating a
+body is then one pass over a tuple of converters, with no Daraja call or
+token fetch made for a malformed request.
+"""
+
+import re
+
+# Longest full name, as stored in the String(50) column
+FULL_NAME_LENGTH = 50
+
+# Longest checkout request ID, as stored in the String(100) column
+CHECKOUT_REQUEST_ID_LENGTH = 100
+
+# Kenyan mobile numbers (07XX and 01XX ranges) written in the local, national or
+# international format, with the subscriber part captured
+PHONE_NUMBER = re.compile(r'(?:\+?254|0)?([17]\d{8})')
+
+# Spaces and dashes people put between the digits of phone numbers
+PHONE_SEPARATOR = re.compile(r'(?<=\d)[ -](?=\d)')
+
+
+class ValidationError(ValueError):
+    """A field of a request body is missing or invalid."""
+
+
+class Schema:
+    """
+    Validator of a JSON object with the given fields.
+
+    Attributes:
+        fields (tuple): ``(name, convert, required)`` of each field, in order.
+        missing_message (str): Error when the body isn't an object or lacks a
+            required field.
+    """
+
+    def __init__(self, fields, missing_message):
+        self.fields = tuple(fields)
+        self.missing_message = missing_message
+        self._required = tuple(name for name, _, required in self.fields if required)
+
+    def validate(self, body):
+        """Check and normalize the fields of ``body``.
+
+        Returns:
+            tuple: The normalized value of each field, in order; None for
+                optional fields that are missing.
+
+        Raises:
+            ValidationError: If the body isn't an object, lacks a required
+                field or has an invalid one.
+        """
+        if not isinstance(body, dict):
+            raise ValidationError(self.missing_message)
+        for name in self._required:
+            if body.get(name) in (None, '', []):
+                raise ValidationError(self.missing_message)
+        values = []
+        for name, convert, _ in self.fields:
+            value = body.get(name)
+            values.append(None if value is None else convert(value))
+        return tuple(values)
+
+
+def text(max_length, message, too_long):
+    """Converter of a non-blank string of at most ``max_length`` characters, stripped."""
+    def convert(value):
+        if not isinstance(value, str) or not value.strip():
+            raise ValidationError(message)
+        value = value.strip()
+        if len(value) > max_length:
+            raise ValidationError(too_long)
+        return value
+    return convert
+
+
+def phone_number(message):
+    """Converter of a Kenyan mobile number to the 2547XXXXXXXX or 2541XXXXXXXX form.
+
+    Accepts the number as a string or integer, in the 07XXXXXXXX, 7XXXXXXXX,
+    2547XXXXXXXX or +2547XXXXXXXX forms, with spaces or dashes. Numbers are
+    returned as integers, as Daraja takes them.
+    """
+    def convert(value):
+        if isinstance(value, bool) or not isinstance(value, (str, int)):
+            raise ValidationError(message)
+        number = PHONE_SEPARATOR.sub('', value.strip()) if isinstance(value, str) else str(value)
+        match = PHONE_NUMBER.fullmatch(number)
+        if match is None:
+            raise ValidationError(message)
+        return int('254' + match.group(1))
+    return convert
+
+
+def integer(minimum, maximum, message, out_of_range):
+    """Converter of a whole number between ``minimum`` and ``maximum``.
+
+    Accepts integers, whole floats and strings of digits.
+    """
+    def convert(value):
+        if isinstance(value, bool):
+            raise ValidationError(message)
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        elif isinstance(value, str) and value.strip().isdigit():
+            value = int(value)
+        if not isinstance(value, int):
+            raise ValidationError(message)
+        if not minimum <= value <= maximum:
+            raise ValidationError(out_of_range)
+        return value
+    return convert
+
+
+def string_list(max_items, max_length, message, too_many):
+    """Converter of a non-empty list of at most ``max_items`` strings of ``max_length``."""
+    def convert(value):
+        if not isinstance(value, list) or not value or not all(
+            isinstance(item, str) and 0 < len(item) <= max_length for item in value
+        ):
+            raise ValidationError(message)
+        if len(value) > max_items:
+            raise ValidationError(too_many)
+        return value
+    return convert
+
+
+def compile_schemas(config):
+    """Compile the request schemas of the endpoints from the application configuration.
+
+    Returns:
+        dict: ``stk_push``, ``status_query`` and ``status_sync`` schemas.
+    """
+    min_amount, max_amount = config['STK_PUSH_MIN_AMOUNT'], config['STK_PUSH_MAX_AMOUNT']
+    max_items = config['BULK_MAX_ITEMS']
+    return {
+        'stk_push': Schema((
+            ('full_name', text(
+                FULL_NAME_LENGTH, 'Invalid full name.',
+                f'Full name must be at most {FULL_NAME_LENGTH} characters.'
+            ), True),
+            ('phone_number', phone_number('Invalid phone number.'), True),
+            ('amount', integer(
+                min_amount, max_amount, 'Invalid amount.',
+                f'Amount must be between {min_amount} and {max_amount}.'
+            ), True),
+        ), 'Full name, phone number, and amount are required.'),
+        'status_query': Schema((
+            ('checkout_request_id', text(
+                CHECKOUT_REQUEST_ID_LENGTH, 'Checkout request ID is required.',
+                f'Checkout request ID must be at most {CHECKOUT_REQUEST_ID_LENGTH} characters.'
+            ), True),
+        ), 'Checkout request ID is required.'),
+        'status_sync': Schema((
+            ('checkout_request_ids', string_list(
+                max_items, CHECKOUT_REQUEST_ID_LENGTH,
+                'A non-empty list of checkout request IDs is required.',
+                f'At most {max_items} checkout request IDs are allowed.'
+            ), True),
+        ), 'A non-empty list of checkout request IDs is required.'),
+    }
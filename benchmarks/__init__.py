@@ -0,0 +1 @@
+"""Benchmarks for the payment service, run against a local mock Daraja server."""
@@ -0,0 +1,148 @@
+"""
+Latency of the hot transaction queries as the total volume grows, with and without archival.
+
+For each total volume, seeds a SQLite database with that many transactions
+at a steady daily rate, so larger volumes mean a longer history, and times
+the queries of the live paths: status lookups by checkout request ID of
+recent transactions, the first page of the listing and of the pending
+listing, and the reconciliation backlog. Then archives the final
+transactions older than ``--keep-days`` and times them again, along with a
+lookup that falls back to the archive. Prints the median milliseconds of
+each as JSON.
+
+Usage:
+    python -m benchmarks.bench_archive --volumes 50000 200000 800000 --daily 5000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from app import create_app, db, models, reports, services
+from app.archive import Archiver
+from app.reconciler import Reconciler
+
+# Share of transactions still pending, all of them among the most recent
+PENDING_SHARE = 0.01
+STATUSES = ['Completed'] * 16 + ['Cancelled'] * 3 + ['Failed']
+NOW = datetime(2024, 6, 1)
+
+
+def seed(rows, daily):
+    """Insert ``rows`` transactions made at ``daily`` per day up to NOW, oldest first."""
+    table = models.MpesaTransaction.__table__
+    rng = random.Random(42)
+    step = 86400 / daily
+    pending_from = rows - int(rows * PENDING_SHARE)
+    batch = []
+    for number in range(rows):
+        created_at = NOW - timedelta(seconds=(rows - number) * step)
+        batch.append({
+            'full_name': 'Benchmark Customer',
+            'phone_number': f'2547{rng.randrange(10 ** 8):08d}',
+            'amount': rng.randrange(1, 5000),
+            'checkout_request_id': f'ws_CO_{number:012d}',
+            'status': models.PENDING if number >= pending_from else rng.choice(STATUSES),
+            'created_at': created_at,
+            'updated_at': created_at,
+        })
+        if len(batch) == 10000:
+            db.session.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+    db.session.commit()
+
+
+def median_ms(func, repeat):
+    """Median milliseconds of ``repeat`` calls of ``func``."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 3)
+
+
+def time_queries(recent_ids, repeat):
+    """Median milliseconds of the hot queries."""
+    rng = random.Random(7)
+    reconciler = Reconciler(min_age=300)
+    return {
+        'lookup': median_ms(
+            lambda: services.find_transaction(rng.choice(recent_ids)), repeat
+        ),
+        'listing_page': median_ms(
+            lambda: reports.list_transactions(reports.parse_filters({}), 50), repeat
+        ),
+        'pending_page': median_ms(
+            lambda: reports.list_transactions(
+                reports.parse_filters({'status': models.PENDING}), 50
+            ), repeat
+        ),
+        'reconciliation_backlog': median_ms(reconciler.backlog, repeat),
+    }
+
+
+def run_volume(path, rows, daily, keep_days, repeat):
+    """Seed ``rows`` transactions, time the queries, archive and time them again."""
+    if os.path.exists(path):
+        os.remove(path)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    with app.app_context():
+        db.create_all()
+        seed(rows, daily)
+        kept = min(rows, daily * keep_days)
+        recent_ids = [f'ws_CO_{number:012d}' for number in range(rows - kept, rows)]
+        before = time_queries(recent_ids, repeat)
+
+        started = time.perf_counter()
+        archived = Archiver(batch_size=10000, pause=0).run(
+            cutoff=NOW - timedelta(days=keep_days)
+        )
+        archive_seconds = time.perf_counter() - started
+        db.session.execute(db.text('ANALYZE'))
+        after = time_queries(recent_ids, repeat)
+        after['archived_lookup'] = median_ms(
+            lambda: services.find_transaction('ws_CO_000000000000'), repeat
+        )
+        live = models.MpesaTransaction.query.count()
+        db.session.remove()
+        db.engine.dispose()
+    os.remove(path)
+    return {
+        'days': round(rows / daily, 1),
+        'live_rows_after': live,
+        'archived_rows': archived,
+        'archive_seconds': round(archive_seconds, 2),
+        'before_ms': before,
+        'after_ms': after,
+    }
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--volumes', type=int, nargs='+', default=[50000, 200000, 800000],
+                        help='total transactions of each run')
+    parser.add_argument('--daily', type=int, default=5000, help='transactions per day')
+    parser.add_argument('--keep-days', type=int, default=30, help='days kept in the live table')
+    parser.add_argument('--repeat', type=int, default=200, help='runs of each query')
+    parser.add_argument('--db', default='/tmp/bench_archive.db')
+    args = parser.parse_args()
+
+    print(json.dumps({
+        'benchmark': 'archive',
+        'daily': args.daily,
+        'keep_days': args.keep_days,
+        'volumes': {
+            rows: run_volume(args.db, rows, args.daily, args.keep_days, args.repeat)
+            for rows in args.volumes
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
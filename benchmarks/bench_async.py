@@ -0,0 +1,113 @@
+"""
+Load test of the sync and async STK push paths.
+
+Drives ``services.initiate_stk_push`` from a fixed pool of threads, the way
+Flask workers call it, and ``async_services.initiate_stk_push`` on the async
+engine, against a local mock Daraja server with simulated upstream latency.
+Prints the throughput of each as JSON.
+
+Usage:
+    SQLALCHEMY_DATABASE_URI=sqlite:////tmp/bench.db \\
+        python -m benchmarks.bench_async --requests 1000 --threads 16 --latency 0.2
+"""
+import argparse
+import json
+import multiprocessing
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app import create_app, db, services, async_services
+from app.models import MpesaTransaction
+from tests.mock_daraja import MockDaraja
+
+
+def start_mock_daraja(latency, **options):
+    """Run the mock Daraja server in its own process so it doesn't share our GIL.
+
+    Args:
+        latency (float): Simulated Daraja latency in seconds.
+        **options: Other arguments of ``MockDaraja``.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = multiprocessing.Process(
+        target=lambda: MockDaraja(port=port, latency=latency, **options).serve_forever(),
+        daemon=True
+    )
+    process.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def run_sync(app, total, threads):
+    """Run ``total`` STK pushes from ``threads`` threads and return requests per second."""
+    def push(amount):
+        with app.app_context():
+            return services.initiate_stk_push('Load Test', 254700000000, amount)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(push, range(1, total + 1)))
+    elapsed = time.perf_counter() - started
+    assert all(r['ResponseCode'] == '0' for r in results)
+    return total / elapsed
+
+
+def run_async(engine, total):
+    """Run ``total`` STK pushes concurrently on the async engine and return requests per second."""
+    started = time.perf_counter()
+    futures = [
+        engine.submit(async_services.initiate_stk_push('Load Test', 254700000000, amount))
+        for amount in range(1, total + 1)
+    ]
+    results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+    assert all(r['ResponseCode'] == '0' for r in results)
+    return total / elapsed
+
+
+def main():
+    """Run the load test and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=16,
+                        help='threads driving the sync path, i.e. worker capacity')
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help='simulated Daraja latency in seconds')
+    args = parser.parse_args()
+
+    server, url = start_mock_daraja(args.latency)
+    app = create_app({'MPESA_API_BASE_URL': url})
+    with app.app_context():
+        db.create_all()
+        engine = async_services.engine._get_current_object()  # pylint: disable=protected-access
+    try:
+        sync_rps = run_sync(app, args.requests, args.threads)
+        async_rps = run_async(engine, args.requests)
+        with app.app_context():
+            rows = MpesaTransaction.query.filter_by(full_name='Load Test').count()
+            MpesaTransaction.query.filter_by(full_name='Load Test').delete()
+            db.session.commit()
+    finally:
+        engine.stop()
+        server.terminate()
+
+    print(json.dumps({
+        'benchmark': 'async',
+        'requests': args.requests,
+        'latency': args.latency,
+        'sync': {'threads': args.threads, 'rps': round(sync_rps, 1)},
+        'async': {'pool_size': engine.client.pool_size, 'rps': round(async_rps, 1)},
+        'speedup': round(async_rps / sync_rps, 2),
+        'rows': rows,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
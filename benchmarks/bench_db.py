@@ -0,0 +1,120 @@
+"""
+Concurrent STK push inserts per second under each database configuration.
+
+Runs ``services.initiate_stk_push`` from a pool of threads against a local
+mock Daraja server, each call writing its transaction to a fresh SQLite file,
+with SQLite's default rollback journal, with the tuned engine settings
+(WAL, ``synchronous=NORMAL``, a sized pool) and with write-behind batching
+on top. Prints inserts per second and failed calls per configuration and
+concurrency as JSON.
+
+Usage:
+    python -m benchmarks.bench_db --requests 2000 --concurrency 1 8 32
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import OperationalError
+from app import create_app, db, services
+from app.models import MpesaTransaction
+from benchmarks.bench_async import start_mock_daraja
+
+# Settings of each configuration, on top of the ones from the environment
+CONFIGS = {
+    'default': {
+        'SQLALCHEMY_ENGINE_OPTIONS': {},
+        'SQLITE_JOURNAL_MODE': '',
+        'SQLITE_SYNCHRONOUS': '',
+    },
+    'wal': {
+        'SQLITE_JOURNAL_MODE': 'WAL',
+        'SQLITE_SYNCHRONOUS': 'NORMAL',
+    },
+    'wal-write-behind': {
+        'SQLITE_JOURNAL_MODE': 'WAL',
+        'SQLITE_SYNCHRONOUS': 'NORMAL',
+        'TRANSACTION_WRITE_BEHIND': True,
+    },
+}
+
+
+def run(settings, total, concurrency):
+    """Push ``total`` STK pushes from ``concurrency`` threads on a fresh database.
+
+    Returns:
+        dict: Inserts per second, failed pushes and rows written.
+    """
+    directory = tempfile.mkdtemp(prefix='bench-db-')
+    uri = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    app = create_app(dict(settings, SQLALCHEMY_DATABASE_URI=uri))
+    with app.app_context():
+        db.create_all()
+        # Fetch the access token and open the Daraja connections before timing
+        services.initiate_stk_push('Warm Up', 254700000000, 1)
+
+    def push(amount):
+        with app.app_context():
+            try:
+                services.initiate_stk_push('DB Bench', 254700000000, amount)
+                return True
+            except OperationalError:
+                db.session.rollback()
+                return False
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(push, range(1, total + 1)))
+        with app.app_context():
+            # Buffered transactions count once they are written
+            services.transaction_buffer.close()
+        elapsed = time.perf_counter() - started
+        with app.app_context():
+            rows = MpesaTransaction.query.filter_by(full_name='DB Bench').count()
+            services.client.close()
+            db.engine.dispose()
+    finally:
+        shutil.rmtree(directory)
+    return {
+        'inserts_per_second': round(rows / elapsed, 1),
+        'failed': results.count(False),
+        'rows': rows,
+    }
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--requests', type=int, default=2000, help='STK pushes per run')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32],
+                        help='threads pushing at once')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated Daraja latency in seconds')
+    args = parser.parse_args()
+
+    server, url = start_mock_daraja(args.latency)
+    results = {}
+    try:
+        for name, settings in CONFIGS.items():
+            settings = dict(settings, MPESA_API_BASE_URL=url)
+            results[name] = {
+                str(concurrency): run(settings, args.requests, concurrency)
+                for concurrency in args.concurrency
+            }
+    finally:
+        server.terminate()
+
+    print(json.dumps({
+        'benchmark': 'db',
+        'requests': args.requests,
+        'latency': args.latency,
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
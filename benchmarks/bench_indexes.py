@@ -0,0 +1,156 @@
+"""
+Benchmark the hot query paths on mpesa_transaction with and without indexes.
+
+Seeds a SQLite database with a large set of transactions, times the queries
+used by reconciliation, customer history and date range reports once with
+only the primary key and unique checkout ID indexes and once with the
+indexes of the current schema, and prints the timings as JSON.
+
+Usage:
+    python -m benchmarks.bench_indexes --rows 500000 --db /tmp/bench_indexes.db
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+import sqlalchemy as sa
+from app.models import MpesaTransaction, parse_mpesa_time
+
+STATUSES = ['Pending'] * 2 + ['Completed'] * 14 + ['Cancelled'] * 3 + ['Failed']
+
+# Transactions span this many days before NOW
+SPAN_DAYS = 90
+NOW = datetime(2024, 6, 1)
+
+QUERIES = {
+    'stale_pending': sa.text(
+        "SELECT checkout_request_id FROM mpesa_transaction "
+        "WHERE status = 'Pending' AND created_at <= :cutoff ORDER BY created_at LIMIT 100"
+    ),
+    'customer_history': sa.text(
+        "SELECT id, amount, status, created_at FROM mpesa_transaction "
+        "WHERE phone_number = :phone ORDER BY created_at DESC LIMIT 50"
+    ),
+    'completed_in_range': sa.text(
+        "SELECT count(*), sum(amount) FROM mpesa_transaction "
+        "WHERE status = 'Completed' AND created_at >= :start AND created_at < :end"
+    ),
+    'paid_in_range': sa.text(
+        "SELECT count(*) FROM mpesa_transaction "
+        "WHERE transaction_time >= :start AND transaction_time < :end"
+    ),
+}
+
+
+def seed(engine, rows, phones):
+    """Create the table and insert ``rows`` random transactions."""
+    table = MpesaTransaction.__table__
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+    rng = random.Random(42)
+    batch = []
+    with engine.begin() as connection:
+        for number in range(rows):
+            created_at = NOW - timedelta(seconds=rng.randrange(SPAN_DAYS * 86400))
+            status = rng.choice(STATUSES)
+            paid = created_at + timedelta(hours=3, seconds=20)
+            transaction_date = paid.strftime('%Y%m%d%H%M%S') if status == 'Completed' else None
+            batch.append({
+                'full_name': 'Benchmark Customer',
+                'phone_number': f'2547{rng.randrange(phones):08d}',
+                'amount': rng.randrange(1, 5000),
+                'checkout_request_id': f'ws_CO_{number:012d}',
+                'status': status,
+                'transaction_date': transaction_date,
+                'transaction_time': parse_mpesa_time(transaction_date),
+                'created_at': created_at,
+                'updated_at': created_at,
+            })
+            if len(batch) == 10000:
+                connection.execute(table.insert(), batch)
+                batch = []
+        if batch:
+            connection.execute(table.insert(), batch)
+
+
+def time_queries(engine, repeat):
+    """Run every query ``repeat`` times and return its median time in milliseconds and plan."""
+    params = {
+        'cutoff': NOW - timedelta(minutes=5),
+        'phone': '254700000123',
+        'start': NOW - timedelta(days=30),
+        'end': NOW - timedelta(days=29),
+    }
+    results = {}
+    with engine.connect() as connection:
+        for name, query in QUERIES.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                connection.execute(query, params).all()
+                timings.append((time.perf_counter() - started) * 1000)
+            plan = connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {query.text}",
+                {key: str(value) for key, value in params.items()}
+            ).all()
+            results[name] = {
+                'median_ms': round(statistics.median(timings), 3),
+                'plan': ' / '.join(row[-1] for row in plan),
+            }
+    return results
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--phones', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--db', default='/tmp/bench_indexes.db')
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = sa.create_engine(f'sqlite:///{args.db}')
+    indexes = list(MpesaTransaction.__table__.indexes)
+
+    started = time.perf_counter()
+    seed(engine, args.rows, args.phones)
+    seed_seconds = time.perf_counter() - started
+
+    for index in indexes:
+        index.drop(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql('ANALYZE')
+    before = time_queries(engine, args.repeat)
+
+    started = time.perf_counter()
+    for index in indexes:
+        index.create(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql('ANALYZE')
+    index_seconds = time.perf_counter() - started
+    after = time_queries(engine, args.repeat)
+    engine.dispose()
+
+    print(json.dumps({
+        'benchmark': 'indexes',
+        'rows': args.rows,
+        'seed_seconds': round(seed_seconds, 2),
+        'index_seconds': round(index_seconds, 2),
+        'queries': {
+            name: {
+                'before': before[name],
+                'after': after[name],
+                'speedup': round(before[name]['median_ms'] / max(after[name]['median_ms'], 1e-3), 1),
+            }
+            for name in QUERIES
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Cost of the metrics instrumentation on the STK push route.
+
+Posts STK pushes through the Flask test client, so every request runs the
+route, the Daraja call to a local mock server and the database write, in
+alternating rounds with the metrics registry enabled and disabled. Prints
+the median time per request of each, the overhead of instrumentation and
+the cost of a single histogram observation as JSON.
+
+Usage:
+    SQLALCHEMY_DATABASE_URI=sqlite:////tmp/bench.db \\
+        python -m benchmarks.bench_metrics --requests 50 --rounds 100
+"""
+import argparse
+import json
+import statistics
+import time
+import timeit
+from app import create_app, db, metrics
+from app.models import MpesaTransaction
+from benchmarks.bench_async import start_mock_daraja
+
+
+def run_round(client, requests):
+    """Post ``requests`` STK pushes and return the seconds per request."""
+    body = {'full_name': 'Metrics Bench', 'phone_number': '254708374149', 'amount': 1}
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.post('/initiate_mpesa_stk_push', json=body)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return (time.perf_counter() - started) / requests
+
+
+def observation_cost(number=100000):
+    """Microseconds taken by one labelled histogram observation."""
+    histogram = metrics.Histogram(
+        'bench_seconds', 'Benchmark.', ('stage',), registry=metrics.Registry()
+    )
+    seconds = timeit.timeit(lambda: histogram.observe(0.01, stage='bench'), number=number)
+    return seconds / number * 1e6
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--requests', type=int, default=50, help='requests per round')
+    parser.add_argument('--rounds', type=int, default=100, help='rounds with each setting')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated Daraja latency in seconds')
+    args = parser.parse_args()
+
+    server, url = start_mock_daraja(args.latency)
+    app = create_app({'MPESA_API_BASE_URL': url})
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    timings = {True: [], False: []}
+    try:
+        # Warm up connections, the token cache and the metric label sets
+        run_round(client, 20)
+        for number in range(args.rounds):
+            # Alternate which setting goes first so drift doesn't favour either
+            for enabled in (True, False) if number % 2 else (False, True):
+                metrics.REGISTRY.enabled = enabled
+                timings[enabled].append(run_round(client, args.requests))
+        with app.app_context():
+            MpesaTransaction.query.filter_by(full_name='Metrics Bench').delete()
+            db.session.commit()
+    finally:
+        metrics.REGISTRY.enabled = True
+        server.terminate()
+
+    enabled = statistics.median(timings[True])
+    disabled = statistics.median(timings[False])
+    print(json.dumps({
+        'benchmark': 'metrics',
+        'requests': args.requests * args.rounds,
+        'latency': args.latency,
+        'disabled_ms': round(disabled * 1000, 3),
+        'enabled_ms': round(enabled * 1000, 3),
+        'overhead_percent': round((enabled - disabled) / disabled * 100, 2),
+        'observation_us': round(observation_cost(), 3),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
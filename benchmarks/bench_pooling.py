@@ -0,0 +1,65 @@
+"""
+Benchmark Daraja calls with and without connection pooling.
+
+Sends STK status queries to a local mock Daraja server, once opening a new
+connection per call with module-level ``requests.post`` and once through the
+pooled ``DarajaClient``, and reports requests per second for each as JSON.
+
+Usage:
+    python -m benchmarks.bench_pooling --requests 2000 --concurrency 8
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from app.daraja import DarajaClient, ENDPOINTS
+from tests.mock_daraja import MockDaraja
+
+QUERY = {'CheckoutRequestID': 'ws_CO_benchmark'}
+
+
+def run(call, total, concurrency):
+    """Issue ``total`` calls from ``concurrency`` threads and return requests per second."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for response in executor.map(lambda _: call(), range(total)):
+            response.raise_for_status()
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    server = MockDaraja().start()
+    url = f"{server.url}{ENDPOINTS['stk_query'][1]}"
+    client = DarajaClient(server.url, pool_size=args.concurrency)
+    try:
+        unpooled = run(
+            lambda: requests.post(url, json=QUERY, timeout=10), args.requests, args.concurrency
+        )
+        unpooled_connections = server.connections
+        pooled = run(
+            lambda: client.request('stk_query', json=QUERY), args.requests, args.concurrency
+        )
+        pooled_connections = server.connections - unpooled_connections
+    finally:
+        client.close()
+        server.stop()
+
+    print(json.dumps({
+        'benchmark': 'pooling',
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'unpooled': {'rps': round(unpooled, 1), 'connections': unpooled_connections},
+        'pooled': {'rps': round(pooled, 1), 'connections': pooled_connections},
+        'speedup': round(pooled / unpooled, 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Compare the ways of serving the application under the same load.
+
+Serves the application with the Flask development server, as ``run.py``
+does, and with gunicorn using sync and threaded workers, each against its
+own SQLite database and the same mock Daraja server, and drives each with
+the same fixed-rate load as ``benchmarks.loadtest``. Prints throughput and
+latency percentiles per endpoint for every mode as JSON.
+
+Usage:
+    python -m benchmarks.bench_servers --rps 100 --duration 15 --latency 0.1 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+from benchmarks.loadtest import (
+    APP_ENVIRONMENT, ENDPOINTS, count_rows, drive, free_port, serve_mock_daraja, start_app,
+    summarize, wait_for_port
+)
+
+MODES = ('dev', 'gunicorn-sync', 'gunicorn-gthread')
+
+
+def server_command(mode, port, workers, threads):
+    """Command serving the application on ``port`` in ``mode``."""
+    if mode == 'dev':
+        return [
+            sys.executable, '-c',
+            'import sys; from app import create_app; create_app().run(port=int(sys.argv[1]))',
+            str(port)
+        ]
+    command = [
+        sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+        '--bind', f'127.0.0.1:{port}', '--workers', str(workers)
+    ]
+    if mode == 'gunicorn-sync':
+        # Gunicorn turns sync workers into gthread ones when given several threads
+        return command + ['--worker-class', 'sync', '--threads', '1', 'wsgi:app']
+    return command + ['--worker-class', 'gthread', '--threads', str(threads), 'wsgi:app']
+
+
+def run_mode(mode, args, mock_url, workdir):
+    """Serve the application in ``mode``, load it and summarize the results."""
+    database_uri = f"sqlite:///{os.path.join(workdir, f'{mode}.db')}"
+    port = free_port()
+    environment = {
+        'MPESA_API_BASE_URL': mock_url,
+        'CONFIRMATION_URL': f"http://127.0.0.1:{port}/mpesa_callback",
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'GUNICORN_ACCESSLOG': '',
+    }
+    env = dict(os.environ, **APP_ENVIRONMENT, **environment)
+    env.pop('FLASK_ENV', None)
+    subprocess.run(
+        [sys.executable, '-c', 'from benchmarks.loadtest import create_tables; create_tables()'],
+        env=env, check=True
+    )
+    server = start_app(
+        port, environment, server_command(mode, port, args.workers, args.threads)
+    )
+    try:
+        wait_for_port(port)
+        samples, elapsed = asyncio.run(
+            drive(f"http://127.0.0.1:{port}", args.rps, args.duration, args.query_ratio, seed=1)
+        )
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        'elapsed_seconds': round(elapsed, 3),
+        'endpoints': {name: summarize(samples[name], elapsed) for name in ENDPOINTS},
+        'database': count_rows(database_uri),
+    }
+
+
+def main():
+    """Run the load against every mode and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--rps', type=float, default=100, help='requests sent per second')
+    parser.add_argument('--duration', type=float, default=15, help='seconds of load per mode')
+    parser.add_argument('--query-ratio', type=float, default=0.3,
+                        help='share of requests that are status queries')
+    parser.add_argument('--latency', type=float, default=0.1,
+                        help='simulated Daraja latency in seconds')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gthread worker')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    mock_port = free_port()
+    # Callbacks are left out so every mode sees only the driven load
+    mock = multiprocessing.Process(
+        target=serve_mock_daraja, args=(mock_port, args.latency, 0.0, None), daemon=True
+    )
+    mock.start()
+    workdir = tempfile.mkdtemp(prefix='bench-servers-')
+    try:
+        wait_for_port(mock_port)
+        results = {
+            mode: run_mode(mode, args, f"http://127.0.0.1:{mock_port}", workdir)
+            for mode in args.modes
+        }
+    finally:
+        mock.terminate()
+
+    print(json.dumps({
+        'benchmark': 'servers',
+        'rps': args.rps,
+        'duration': args.duration,
+        'latency': args.latency,
+        'workers': args.workers,
+        'threads': args.threads,
+        'modes': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Daraja calls made by several worker processes, with and without a shared state store.
+
+Pushes ``--payments`` payments to a local mock Daraja server, then forks
+``--workers`` processes that each, like a gunicorn worker, get an access
+token and query the status of every payment. Runs once with per-process
+caches only and once per ``--stores`` URL given as ``SHARED_STATE_URL``, and
+prints the OAuth and status query calls that reached Daraja, along with the
+microseconds a read of each store takes, as JSON.
+
+Usage:
+    python -m benchmarks.bench_shared_state --workers 8 --payments 20
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import timeit
+import requests
+from app import create_app, db, services, shared_state
+from benchmarks.bench_async import start_mock_daraja
+
+OAUTH_PATH = '/oauth/v1/generate'
+QUERY_PATH = '/mpesa/stkpushquery/v1/query'
+
+
+def worker(config, checkout_request_ids):
+    """Get a token and query every payment, as a fresh worker process would."""
+    app = create_app(config)
+    with app.app_context():
+        services.token_manager.get_token()
+        for checkout_request_id in checkout_request_ids:
+            services.status_cache.lookup(
+                checkout_request_id,
+                lambda checkout_request_id=checkout_request_id:
+                    services.request_transaction_status(checkout_request_id)
+            )
+        services.client.close()
+
+
+def calls(url):
+    """OAuth and status query calls the mock Daraja server has received so far."""
+    counts = requests.get(f"{url}/_mock/stats", timeout=10).json()['calls']
+    return counts.get(OAUTH_PATH, 0), counts.get(QUERY_PATH, 0)
+
+
+def run(url, config, checkout_request_ids, workers):
+    """Run ``workers`` worker processes at once and count the Daraja calls they made."""
+    context = multiprocessing.get_context('fork')
+    before = calls(url)
+    processes = [
+        context.Process(target=worker, args=(config, checkout_request_ids))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    oauth, queries = (after - start for after, start in zip(calls(url), before))
+    return {'oauth_calls': oauth, 'status_queries': queries}
+
+
+def read_microseconds(url, number=20000):
+    """Microseconds per read of a stored status response in the store of ``url``."""
+    store = shared_state.from_url(url)
+    store.set('bench', {'ResultCode': '0', 'ResultDesc': 'Processed'}, 60)
+    return round(timeit.timeit(lambda: store.get('bench'), number=number) / number * 1e6, 2)
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--payments', type=int, default=20)
+    parser.add_argument('--stores', nargs='+', default=['sqlite:///{dir}/shared_state.db'],
+                        help='SHARED_STATE_URL of each run; {dir} is a temporary directory')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-shared-')
+    server, url = start_mock_daraja(0.0)
+    try:
+        config = {
+            'MPESA_API_BASE_URL': url,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'bench.db')}",
+        }
+        app = create_app(config)
+        with app.app_context():
+            db.create_all()
+            checkout_request_ids = [
+                services.initiate_stk_push('Shared Bench', 254700000000, amount)
+                ['CheckoutRequestID']
+                for amount in range(1, args.payments + 1)
+            ]
+            services.client.close()
+
+        results = {'per_process': run(url, config, checkout_request_ids, args.workers)}
+        reads = {}
+        for store in args.stores:
+            store = store.format(dir=directory)
+            results[store] = run(
+                url, dict(config, SHARED_STATE_URL=store), checkout_request_ids, args.workers
+            )
+            reads[store] = read_microseconds(store)
+    finally:
+        server.terminate()
+        shutil.rmtree(directory)
+
+    print(json.dumps({
+        'benchmark': 'shared_state',
+        'workers': args.workers,
+        'payments': args.payments,
+        'results': results,
+        'store_read_microseconds': dict(reads, memory=read_microseconds('memory://')),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Cost of signing and building STK push and status query request bodies.
+
+Times ``services.stk_push_payload`` and ``services.stk_query_payload``
+against the implementation they replaced, which formatted the timestamp
+twice, concatenated and base64-encoded the shortcode and passkey and built
+the whole body for every request. Prints the median microseconds per body of
+each and the saving as JSON.
+
+Usage:
+    python -m benchmarks.bench_signing --number 100000 --repeat 7
+"""
+import argparse
+import base64
+import json
+import statistics
+import timeit
+from datetime import datetime
+from functools import partial
+from app import create_app, services
+
+
+def unsigned_password(tenant):
+    """Password as generated before the signer: encoded for every request."""
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    concat_string = f"{tenant.shortcode}{tenant.passkey}{timestamp}"
+    return base64.b64encode(concat_string.encode()).decode()
+
+
+def unsigned_stk_push_payload(phone_number, amount, tenant):
+    """STK push body as built before the signer."""
+    return {
+        "BusinessShortCode": int(tenant.shortcode),
+        "Password": unsigned_password(tenant),
+        "Timestamp": datetime.now().strftime('%Y%m%d%H%M%S'),
+        "TransactionType": "CustomerPayBillOnline",
+        "Amount": amount,
+        "PartyA": phone_number,
+        "PartyB": int(tenant.shortcode),
+        "PhoneNumber": phone_number,
+        "CallBackURL": tenant.confirmation_url,
+        "AccountReference": "CompanyXLTD",
+        "TransactionDesc": "Payment of X"
+    }
+
+
+def unsigned_stk_query_payload(checkout_request_id, tenant):
+    """Status query body as built before the signer."""
+    return {
+        "BusinessShortCode": int(tenant.shortcode),
+        "Password": unsigned_password(tenant),
+        "Timestamp": datetime.now().strftime('%Y%m%d%H%M%S'),
+        "CheckoutRequestID": checkout_request_id
+    }
+
+
+def median_microseconds(func, number, repeat):
+    """Median microseconds per call of ``func`` over ``repeat`` runs of ``number`` calls."""
+    runs = timeit.repeat(func, number=number, repeat=repeat)
+    return statistics.median(runs) / number * 1e6
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--number', type=int, default=100000, help='bodies per run')
+    parser.add_argument('--repeat', type=int, default=7, help='runs of each builder')
+    args = parser.parse_args()
+
+    app = create_app({
+        'MPESA_SHORTCODE': '174379',
+        'MPESA_PASSKEY': 'bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b10f78e6b72ada1ed2c919',
+        'MPESA_CONFIRMATION_URL': 'https://example.com/callback',
+    })
+    builders = {
+        'stk_push': (
+            lambda tenant: unsigned_stk_push_payload(254708374149, 1, tenant),
+            lambda tenant: services.stk_push_payload(254708374149, 1, tenant),
+        ),
+        'stk_query': (
+            lambda tenant: unsigned_stk_query_payload('ws_CO_1', tenant),
+            lambda tenant: services.stk_query_payload('ws_CO_1', tenant),
+        ),
+    }
+    results = {}
+    with app.app_context():
+        tenant = services.get_tenant()
+        for name, (before, after) in builders.items():
+            assert list(before(tenant)) == list(after(tenant)), name
+            before_us = median_microseconds(partial(before, tenant), args.number, args.repeat)
+            after_us = median_microseconds(partial(after, tenant), args.number, args.repeat)
+            results[name] = {
+                'before_us': round(before_us, 3),
+                'after_us': round(after_us, 3),
+                'saved_us': round(before_us - after_us, 3),
+                'speedup': round(before_us / after_us, 2),
+            }
+
+    print(json.dumps({
+        'benchmark': 'signing',
+        'number': args.number,
+        'repeat': args.repeat,
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
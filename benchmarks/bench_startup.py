@@ -0,0 +1,104 @@
+"""
+Startup cost of the application.
+
+Runs each measurement in a fresh interpreter, so nothing is cached between
+runs: the time to import the ``app`` package, to build an app with
+``create_app`` and to serve its first request through the test client.
+Also reports the slowest imports of the package from ``python -X importtime``.
+Prints the medians as JSON.
+
+Usage:
+    python -m benchmarks.bench_startup --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from benchmarks.loadtest import APP_ENVIRONMENT
+
+# Timed in the child interpreter; prints the seconds of each stage as JSON
+PROBE = """
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get('/metrics')
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'create_app': created - imported,
+    'first_request': served - created,
+}))
+"""
+
+
+def environment():
+    """Environment of the child interpreters."""
+    env = dict(os.environ)
+    for name, value in APP_ENVIRONMENT.items():
+        env.setdefault(name, value)
+    env.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+    return env
+
+
+def measure(env):
+    """Seconds of each startup stage in a fresh interpreter."""
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env, count=10):
+    """Modules imported directly by ``import app``, by cumulative milliseconds."""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        env=env, check=True, capture_output=True, text=True
+    ).stderr
+    children = {}
+    for line in stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package", indented by depth
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0:
+            # A module is reported after everything it imported
+            if name.strip() == 'app':
+                break
+            children = {}
+        elif depth == 1:
+            children[name.strip()] = int(cumulative) / 1000
+    ordered = sorted(children.items(), key=lambda item: item[1], reverse=True)
+    return {name: round(milliseconds, 1) for name, milliseconds in ordered[:count]}
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters to time')
+    args = parser.parse_args()
+
+    env = environment()
+    # The first run warms the filesystem and bytecode caches
+    measure(env)
+    runs = [measure(env) for _ in range(args.runs)]
+    stages = {
+        stage: round(statistics.median(run[stage] for run in runs) * 1000, 1)
+        for stage in ('import', 'create_app', 'first_request')
+    }
+    print(json.dumps({
+        'benchmark': 'startup',
+        'runs': args.runs,
+        'median_ms': dict(stages, total=round(sum(stages.values()), 1)),
+        'slowest_imports_ms': slowest_imports(env),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Daraja status queries made for clients polling payments, with and without the status cache.
+
+Sends STK pushes to a local mock Daraja server that reports each payment as
+still being processed for ``--processing-time`` seconds, as while the
+customer enters their PIN. Every payment is then polled by ``--pollers``
+clients every ``--interval`` seconds until they see its result, once through
+the uncached query path (a Daraja call and a database write per poll) and
+once through ``services.query_transaction_status``. Uncached polls are
+slower, so the runs serve different numbers of polls; prints the polls
+served, the status queries that reached Daraja and the reduction in queries
+per poll as JSON.
+
+Usage:
+    python -m benchmarks.bench_status_cache --payments 50 --pollers 2 \\
+        --interval 0.1 --processing-time 1.0 --pending-ttl 0.2
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import requests
+from app import create_app, db, services
+from app.status_cache import is_final
+from benchmarks.bench_async import start_mock_daraja
+
+QUERY_PATH = '/mpesa/stkpushquery/v1/query'
+
+
+def uncached_query(checkout_request_id):
+    """Status query as it was made before the cache: one Daraja call per poll."""
+    response_data = services.request_transaction_status(checkout_request_id)
+    services.record_query_result(checkout_request_id, response_data)
+    return response_data
+
+
+def poll(app, query, checkout_request_id, interval, polls):
+    """Poll one payment until its result comes back, counting the polls."""
+    while True:
+        # One app context per poll, as each poll would be its own request
+        with app.app_context():
+            response = query(checkout_request_id)
+        polls.append(1)
+        if is_final(response):
+            return
+        time.sleep(interval)
+
+
+def run(url, query, args):
+    """Push ``args.payments`` payments and poll them all with ``query``.
+
+    Returns:
+        tuple: Number of polls and of status queries that reached Daraja.
+    """
+    directory = tempfile.mkdtemp(prefix='bench-status-')
+    app = create_app({
+        'MPESA_API_BASE_URL': url,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'bench.db')}",
+        'STATUS_CACHE_PENDING_TTL': args.pending_ttl,
+    })
+    try:
+        with app.app_context():
+            db.create_all()
+            checkout_request_ids = [
+                services.initiate_stk_push('Status Bench', 254700000000, amount)
+                ['CheckoutRequestID']
+                for amount in range(1, args.payments + 1)
+            ]
+        before = stats(url)
+        polls = []
+        threads = [
+            threading.Thread(
+                target=poll, args=(app, query, checkout_request_id, args.interval, polls)
+            )
+            for checkout_request_id in checkout_request_ids
+            for _ in range(args.pollers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with app.app_context():
+            services.client.close()
+            db.engine.dispose()
+        return len(polls), stats(url) - before
+    finally:
+        shutil.rmtree(directory)
+
+
+def stats(url):
+    """Status queries the mock Daraja server has received so far."""
+    return requests.get(f"{url}/_mock/stats", timeout=10).json()['calls'].get(QUERY_PATH, 0)
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--payments', type=int, default=50)
+    parser.add_argument('--pollers', type=int, default=2, help='clients polling each payment')
+    parser.add_argument('--interval', type=float, default=0.1, help='seconds between polls')
+    parser.add_argument('--processing-time', type=float, default=1.0,
+                        help='seconds a payment is reported as being processed')
+    parser.add_argument('--pending-ttl', type=float, default=0.2,
+                        help='seconds a "being processed" answer is cached')
+    args = parser.parse_args()
+
+    server, url = start_mock_daraja(0.0, processing_time=args.processing_time)
+    try:
+        results = {}
+        for name, query in (('uncached', uncached_query),
+                            ('cached', services.query_transaction_status)):
+            polls, queries = run(url, query, args)
+            results[name] = {
+                'polls': polls,
+                'daraja_queries': queries,
+                'daraja_queries_per_poll': round(queries / polls, 3),
+            }
+    finally:
+        server.terminate()
+
+    uncached = results['uncached']['daraja_queries_per_poll']
+    cached = results['cached']['daraja_queries_per_poll']
+    print(json.dumps({
+        'benchmark': 'status_cache',
+        'payments': args.payments,
+        'pollers': args.pollers,
+        'interval': args.interval,
+        'processing_time': args.processing_time,
+        'pending_ttl': args.pending_ttl,
+        'results': results,
+        'daraja_queries_saved_percent': round((uncached - cached) / uncached * 100, 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Throughput of the request validation path.
+
+Validates a mix of valid and malformed STK push bodies with the compiled
+schema and with the validator it replaced, which cast the phone number and
+amount with ``int`` and so let negative and short numbers through. Then posts
+malformed bodies, rejected before any token fetch or Daraja call, to
+``/initiate_mpesa_stk_push`` through the test client with each installed JSON
+provider. Prints validations and requests per second as JSON.
+
+Usage:
+    python -m benchmarks.bench_validation --number 100000 --requests 5000
+"""
+import argparse
+import importlib.util
+import json
+import time
+from app import create_app, routes
+
+BODIES = [
+    {'full_name': 'John Doe', 'phone_number': '254708374149', 'amount': 10},
+    {'full_name': 'Jane Doe', 'phone_number': '0712 345 678', 'amount': '2500'},
+    {'full_name': 'John Doe', 'phone_number': 'invalid_phone', 'amount': 1},
+    {'full_name': 'John Doe', 'phone_number': '254708374149', 'amount': 'invalid_amount'},
+    {'full_name': 'John Doe', 'phone_number': '254708374149'},
+]
+
+# Malformed bodies, rejected by the route before any upstream call
+REJECTED = [
+    {'full_name': 'John Doe', 'phone_number': '-254708374149', 'amount': 1},
+    {'full_name': 'J' * 51, 'phone_number': '0708374149', 'amount': 1},
+    {'full_name': 'John Doe', 'phone_number': '0708374149', 'amount': 10 ** 9},
+]
+
+
+def unchecked_validate_stk_push(body):
+    """STK push validation as done before the compiled schema."""
+    if not isinstance(body, dict):
+        return None, 'Full name, phone number, and amount are required.'
+    full_name = body.get('full_name')
+    phone_number = body.get('phone_number')
+    amount = body.get('amount')
+    if not all([full_name, phone_number, amount]):
+        return None, 'Full name, phone number, and amount are required.'
+    try:
+        phone_number = int(phone_number)
+    except ValueError:
+        return None, 'Invalid phone number.'
+    try:
+        amount = int(amount)
+    except ValueError:
+        return None, 'Invalid amount.'
+    return (full_name, phone_number, amount), None
+
+
+def per_second(func, number):
+    """Calls of ``func`` per second over ``number`` calls."""
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return number / (time.perf_counter() - started)
+
+
+def validations_per_second(validate, number):
+    """Validations of the sample bodies per second with ``validate``."""
+    bodies = BODIES * (number // len(BODIES))
+
+    def run():
+        for body in bodies:
+            validate(body)
+    return per_second(run, 1) * len(bodies)
+
+
+def requests_per_second(provider, number):
+    """Rejected STK push requests per second through the test client."""
+    app = create_app({'JSON_PROVIDER': provider})
+    client = app.test_client()
+    bodies = [json.dumps(body) for body in REJECTED]
+    count = iter(range(number))
+
+    def post():
+        response = client.post(
+            '/initiate_mpesa_stk_push', data=bodies[next(count) % len(bodies)],
+            content_type='application/json'
+        )
+        assert response.status_code == 400, response.get_data()
+    return per_second(post, number)
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--number', type=int, default=100000, help='bodies validated')
+    parser.add_argument('--requests', type=int, default=5000, help='requests per JSON provider')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        schema = routes.schemas['stk_push']
+
+        def validate(body):
+            try:
+                schema.validate(body)
+            except ValueError:
+                pass
+        validations = {
+            'unchecked_per_second': round(
+                validations_per_second(unchecked_validate_stk_push, args.number)
+            ),
+            'schema_per_second': round(validations_per_second(validate, args.number)),
+        }
+
+    providers = ['default'] + (['orjson'] if importlib.util.find_spec('orjson') else [])
+    print(json.dumps({
+        'benchmark': 'validation',
+        'number': args.number,
+        'requests': args.requests,
+        'validations': validations,
+        'rejected_requests_per_second': {
+            provider: round(requests_per_second(provider, args.requests))
+            for provider in providers
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+"""
+End-to-end load test of the HTTP endpoints.
+
+Starts a mock Daraja server that posts STK push results back to the service
+after a delay, serves the application on a threaded WSGI server against a
+fresh SQLite database and drives ``/initiate_mpesa_stk_push`` and
+``/query_transaction_status`` at a fixed arrival rate, so slow responses
+don't slow down the offered load. Once the callbacks have settled it prints
+latency percentiles and throughput per endpoint, callback delivery and the
+database row counts as JSON.
+
+Usage:
+    python -m benchmarks.loadtest --rps 50 --duration 30 --latency 0.2 --callback-delay 1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import aiohttp
+import requests
+import sqlalchemy as sa
+from tests.mock_daraja import MockDaraja
+
+ENDPOINTS = {
+    'initiate': '/initiate_mpesa_stk_push',
+    'query': '/query_transaction_status',
+}
+
+# Settings the application refuses to start without
+APP_ENVIRONMENT = {
+    'SECRET_KEY': 'loadtest',
+    'CONSUMER_KEY': 'loadtest',
+    'CONSUMER_SECRET': 'loadtest',
+    'SHORTCODE': '174379',
+    'PASSKEY': 'loadtest',
+}
+
+
+def free_port():
+    """Return a loopback port nobody is listening on."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30.0):
+    """Block until something accepts connections on ``port``."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def serve_mock_daraja(port, latency, error_rate, callback_delay):
+    """Serve the mock Daraja API until the process is terminated."""
+    MockDaraja(
+        port=port, latency=latency, error_rate=error_rate, callback_delay=callback_delay
+    ).serve_forever()
+
+
+def create_tables(app=None):
+    """Create the tables of the database of ``app``, or of a new app."""
+    from app import create_app, db  # pylint: disable=import-outside-toplevel
+
+    with (app or create_app()).app_context():
+        db.create_all()
+
+
+def serve_app(port):
+    """Create the tables and serve the application until the process is terminated."""
+    # pylint: disable=import-outside-toplevel
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    # One access log line per request would cost more than some requests
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    app = create_app()
+    create_tables(app)
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def start_app(port, environment, command=None):
+    """Run the application in a child process, configured by ``environment``.
+
+    Args:
+        port (int): Port to serve on.
+        environment (dict): Variables added to the environment of the child.
+        command (list): Command serving the application; by default a threaded
+            WSGI server in a child interpreter.
+    """
+    env = dict(os.environ, **environment)
+    for name, value in APP_ENVIRONMENT.items():
+        env.setdefault(name, value)
+    env.pop('FLASK_ENV', None)
+    if command is None:
+        command = [
+            sys.executable, '-c',
+            'import sys; from benchmarks.loadtest import serve_app; serve_app(int(sys.argv[1]))',
+            str(port)
+        ]
+    return subprocess.Popen(command, env=env)
+
+
+def percentile(values, share):
+    """Nearest-rank percentile of ``values``; None when there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(share * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def latency_summary(seconds):
+    """Percentiles and maximum of latencies, in milliseconds."""
+    milliseconds = [value * 1000 for value in seconds]
+    return {
+        name: None if value is None else round(value, 2)
+        for name, value in (
+            ('p50', percentile(milliseconds, 0.50)),
+            ('p95', percentile(milliseconds, 0.95)),
+            ('p99', percentile(milliseconds, 0.99)),
+            ('max', max(milliseconds, default=None)),
+        )
+    }
+
+
+def summarize(samples, elapsed):
+    """Summarize ``(seconds, ok)`` samples of one endpoint."""
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, ok in samples if not ok),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': latency_summary([seconds for seconds, _ in samples]),
+    }
+
+
+async def drive(app_url, rps, duration, query_ratio, seed=None):
+    """Send requests at ``rps`` for ``duration`` seconds.
+
+    Returns:
+        tuple: ``(seconds, ok)`` samples by endpoint and the elapsed seconds.
+    """
+    rng = random.Random(seed)
+    samples = {name: [] for name in ENDPOINTS}
+    checkout_request_ids = []
+    timeout = aiohttp.ClientTimeout(total=60)
+    connector = aiohttp.TCPConnector(limit=0)
+
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        async def call(name, body):
+            started = time.perf_counter()
+            try:
+                async with session.post(app_url + ENDPOINTS[name], json=body) as response:
+                    data = await response.json(content_type=None)
+                    ok = response.status < 400
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                data, ok = None, False
+            samples[name].append((time.perf_counter() - started, ok))
+            return data if ok else None
+
+        async def initiate(number):
+            data = await call('initiate', {
+                'full_name': 'Load Test',
+                'phone_number': f"2547{number % 100000000:08d}",
+                'amount': 1 + number % 100,
+            })
+            if data and data.get('CheckoutRequestID'):
+                checkout_request_ids.append(data['CheckoutRequestID'])
+
+        loop = asyncio.get_running_loop()
+        tasks = []
+        started = loop.time()
+        for number in range(int(rps * duration)):
+            delay = started + number / rps - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if checkout_request_ids and rng.random() < query_ratio:
+                body = {'checkout_request_id': rng.choice(checkout_request_ids)}
+                tasks.append(asyncio.create_task(call('query', body)))
+            else:
+                tasks.append(asyncio.create_task(initiate(number)))
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - started
+    return samples, elapsed
+
+
+def count_rows(database_uri):
+    """Count transactions by status and queued STK push requests."""
+    engine = sa.create_engine(database_uri)
+    try:
+        with engine.connect() as connection:
+            by_status = dict(connection.execute(sa.text(
+                "SELECT status, count(*) FROM mpesa_transaction GROUP BY status"
+            )).all())
+            queued = connection.execute(sa.text("SELECT count(*) FROM stk_push_request")).scalar()
+    finally:
+        engine.dispose()
+    return {
+        'transactions': sum(by_status.values()),
+        'transactions_by_status': by_status,
+        'stk_push_requests': queued,
+    }
+
+
+def callback_stats(mock_url):
+    """Summarize the callbacks the mock Daraja server delivered."""
+    stats = requests.get(f"{mock_url}/_mock/stats", timeout=10).json()
+    callbacks = stats.get('callbacks')
+    if callbacks is None:
+        return None
+    return {
+        'sent': callbacks['sent'],
+        'failed': callbacks['failed'],
+        'latency_ms': latency_summary(callbacks['latencies']),
+    }
+
+
+def main():
+    """Run the load test and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--rps', type=float, default=50, help='requests sent per second')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load')
+    parser.add_argument('--query-ratio', type=float, default=0.3,
+                        help='share of requests that are status queries')
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help='simulated Daraja latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of Daraja calls that fail with a 503')
+    parser.add_argument('--callback-delay', type=float, default=1.0,
+                        help='seconds before Daraja posts the result of a push')
+    parser.add_argument('--settle', type=float, default=5.0,
+                        help='seconds to wait for callbacks after the load stops')
+    parser.add_argument('--db', default=None, help='SQLite file; a temporary one by default')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default=None, help='also write the results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    database_uri = f"sqlite:///{args.db or os.path.join(workdir, 'loadtest.db')}"
+    mock_port, app_port = free_port(), free_port()
+    mock_url, app_url = f"http://127.0.0.1:{mock_port}", f"http://127.0.0.1:{app_port}"
+
+    mock = multiprocessing.Process(
+        target=serve_mock_daraja,
+        args=(mock_port, args.latency, args.error_rate, args.callback_delay),
+        daemon=True
+    )
+    mock.start()
+    server = start_app(app_port, {
+        'MPESA_API_BASE_URL': mock_url,
+        'CONFIRMATION_URL': f"{app_url}/mpesa_callback",
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+    })
+    try:
+        wait_for_port(mock_port)
+        wait_for_port(app_port)
+        samples, elapsed = asyncio.run(
+            drive(app_url, args.rps, args.duration, args.query_ratio, args.seed)
+        )
+        time.sleep(args.settle)
+        results = {
+            'config': {
+                'rps': args.rps,
+                'duration': args.duration,
+                'query_ratio': args.query_ratio,
+                'latency': args.latency,
+                'error_rate': args.error_rate,
+                'callback_delay': args.callback_delay,
+            },
+            'elapsed_seconds': round(elapsed, 3),
+            'endpoints': {name: summarize(samples[name], elapsed) for name in ENDPOINTS},
+            'callbacks': callback_stats(mock_url),
+            'database': count_rows(database_uri),
+        }
+    finally:
+        server.terminate()
+        server.wait()
+        mock.terminate()
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Gunicorn settings for serving the payment service in production:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden from the environment.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8080')}")
+
+# Worker processes, and the worker model: 'gthread' serves GUNICORN_THREADS
+# requests per process at once, which suits routes that mostly wait on Daraja;
+# 'sync' serves one request per process at a time
+workers = int(os.environ.get('GUNICORN_WORKERS', str(multiprocessing.cpu_count() * 2 + 1)))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+
+# Import the application once in the master so workers fork with it loaded
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+# Seconds a silent worker lives, and seconds a stopping worker gets to finish
+# the requests and Daraja calls it has in flight
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+# Restart workers after this many requests, spread by the jitter; 0 never restarts them
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+
+# Access log destination, '-' for stdout; empty to disable
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-') or None
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Start the connection pools of a new worker."""
+    # pylint: disable=import-outside-toplevel
+    from app import lifecycle
+    from wsgi import app
+    lifecycle.init_worker(app)
+
+
+def worker_exit(server, worker):  # pylint: disable=unused-argument
+    """Finish the Daraja calls and buffered writes of a stopping worker."""
+    # pylint: disable=import-outside-toplevel
+    from app import lifecycle
+    from wsgi import app
+    lifecycle.shutdown_worker(app, graceful_timeout)
@@ -0,0 +1,92 @@
+"""add updated_at, transaction_time and hot path indexes
+
+Revision ID: 5f3a9b8d6e21
+Revises: 4e8a1c7b2f93
+Create Date: 2024-06-12 14:48:02.371586
+
+"""
+from datetime import datetime, timedelta
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f3a9b8d6e21'
+down_revision = '4e8a1c7b2f93'
+branch_labels = None
+depends_on = None
+
+# Rows backfilled per statement
+CHUNK_SIZE = 1000
+
+# M-Pesa reports times in East Africa Time
+MPESA_UTC_OFFSET = timedelta(hours=3)
+
+transaction = sa.table(
+    'mpesa_transaction',
+    sa.column('id', sa.Integer()),
+    sa.column('transaction_date', sa.String()),
+    sa.column('transaction_time', sa.DateTime()),
+    sa.column('created_at', sa.DateTime()),
+    sa.column('updated_at', sa.DateTime()),
+)
+
+
+def parse_mpesa_time(value):
+    """Convert an M-Pesa YYYYMMDDHHMMSS time to UTC, or None if malformed."""
+    try:
+        return datetime.strptime(value, '%Y%m%d%H%M%S') - MPESA_UTC_OFFSET
+    except (TypeError, ValueError):
+        return None
+
+
+def backfill_transaction_time(connection):
+    """Fill transaction_time from transaction_date in id order, one chunk at a time."""
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(transaction.c.id, transaction.c.transaction_date).where(
+                transaction.c.id > last_id, transaction.c.transaction_date.isnot(None)
+            ).order_by(transaction.c.id).limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            return
+        updates = [
+            {'b_id': row_id, 'b_time': parse_mpesa_time(value)} for row_id, value in rows
+        ]
+        updates = [update for update in updates if update['b_time'] is not None]
+        if updates:
+            connection.execute(
+                transaction.update().where(transaction.c.id == sa.bindparam('b_id')).values(
+                    transaction_time=sa.bindparam('b_time')
+                ),
+                updates
+            )
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    with op.batch_alter_table('mpesa_transaction', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('transaction_time', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    op.execute(transaction.update().values(updated_at=transaction.c.created_at))
+    backfill_transaction_time(op.get_bind())
+
+    with op.batch_alter_table('mpesa_transaction', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_index(
+            'ix_mpesa_transaction_phone_number_created_at', ['phone_number', 'created_at'],
+            unique=False
+        )
+        batch_op.create_index(
+            'ix_mpesa_transaction_transaction_time', ['transaction_time'], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('mpesa_transaction', schema=None) as batch_op:
+        batch_op.drop_index('ix_mpesa_transaction_transaction_time')
+        batch_op.drop_index('ix_mpesa_transaction_phone_number_created_at')
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('transaction_time')
@@ -0,0 +1,41 @@
+"""add created_at and status index
+
+Revision ID: 7c4e2a9f1d35
+Revises: 3b1f6c2d9a47
+Create Date: 2024-06-05 16:41:09.532874
+
+"""
+from datetime import datetime, timezone
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c4e2a9f1d35'
+down_revision = '3b1f6c2d9a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('mpesa_transaction', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+
+    # Existing rows get the time of the migration, in UTC like the rows the app inserts
+    transaction = sa.table('mpesa_transaction', sa.column('created_at', sa.DateTime()))
+    op.execute(transaction.update().values(
+        created_at=datetime.now(timezone.utc).replace(tzinfo=None)
+    ))
+
+    # Only SQLite needs the table rebuilt to make the column NOT NULL
+    with op.batch_alter_table('mpesa_transaction', schema=None) as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_index(
+            'ix_mpesa_transaction_status_created_at', ['status', 'created_at'], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('mpesa_transaction', schema=None) as batch_op:
+        batch_op.drop_index('ix_mpesa_transaction_status_created_at')
+        batch_op.drop_column('created_at')
@@ -0,0 +1,12 @@
+"""
+Entry point of the reconciliation poller, run next to the web app with ``python reconcile.py``.
+"""
+import logging
+from app import create_app
+from app.reconciler import Reconciler
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    app = create_app()
+    with app.app_context():
+        Reconciler.from_config(app.config).run_forever(app.config['RECONCILE_INTERVAL'])
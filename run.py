@@ -1,4 +1,9 @@
-from app import app
+"""
+Development server. Production deployments use gunicorn, see ``gunicorn.conf.py``.
+"""
+from app import create_app
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8080)
@@ -0,0 +1,66 @@
+"""
+Local stand-in for a Redis client.
+
+Implements the commands ``app.shared_state.RedisStore`` sends, ``get``,
+``set`` with ``nx`` and ``px``, ``delete`` and ``scan_iter``, with the
+semantics of redis-py, on a dictionary. Clients made with the same
+``FakeRedis.Server`` see the same keys, like processes on one Redis server.
+"""
+import fnmatch
+import threading
+import time
+
+
+class FakeRedis:
+    """Redis client whose server is a dictionary shared with the other clients of it."""
+
+    class Server:
+        """Keys of a stand-in server: value bytes and monotonic expiry time, by key."""
+
+        def __init__(self, clock=time.monotonic):
+            self.clock = clock
+            self.lock = threading.Lock()
+            self.entries = {}
+
+    def __init__(self, server=None):
+        self.server = server or FakeRedis.Server()
+
+    def _live(self, name):
+        """Return the entry of ``name`` if it has not expired; call holding the lock."""
+        entry = self.server.entries.get(name)
+        if entry is not None and entry[1] is not None and entry[1] <= self.server.clock():
+            del self.server.entries[name]
+            return None
+        return entry
+
+    def get(self, name):
+        """GET: the value of ``name`` as bytes, or None."""
+        with self.server.lock:
+            entry = self._live(name)
+            return None if entry is None else entry[0]
+
+    def set(self, name, value, ex=None, px=None, nx=False):
+        """SET with EX, PX and NX: True if set, None if NX found the key."""
+        with self.server.lock:
+            if nx and self._live(name) is not None:
+                return None
+            ttl = ex if ex is not None else (px / 1000 if px is not None else None)
+            expires_at = None if ttl is None else self.server.clock() + ttl
+            data = value if isinstance(value, bytes) else str(value).encode()
+            self.server.entries[name] = (data, expires_at)
+            return True
+
+    def delete(self, *names):
+        """DEL: the number of keys removed."""
+        with self.server.lock:
+            return sum(
+                self._live(name) is not None and bool(self.server.entries.pop(name))
+                for name in names
+            )
+
+    def scan_iter(self, match='*'):
+        """SCAN: the live keys matching the glob ``match``."""
+        with self.server.lock:
+            names = list(self.server.entries)
+            return [name for name in names
+                    if self._live(name) is not None and fnmatch.fnmatchcase(name, match)]
@@ -0,0 +1,417 @@
+"""
+Local stand-in for the Daraja API.
+
+Serves the endpoints used by the payment service on a loopback port so that
+tests and benchmarks can exercise real HTTP calls without reaching Safaricom.
+It can add latency, fail a share of calls, inject an outage and post STK push
+results to the CallBackURL of each push, like M-Pesa does.
+
+Run it on its own with:
+    python -m tests.mock_daraja --port 8001 --latency 0.1 --error-rate 0.01 --callback-delay 2
+
+and start or end an outage of the running server with:
+    curl -X POST localhost:8001/_mock/fault -d '{"fault": "unavailable", "latency": 5}'
+"""
+import argparse
+import heapq
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+
+class MockDarajaHandler(BaseHTTPRequestHandler):
+    """Request handler dispatching Daraja endpoints to the owning MockDaraja."""
+
+    protocol_version = 'HTTP/1.1'
+    # Write each response in one segment so kept-alive connections don't stall on Nagle
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def setup(self):
+        """Count every new TCP connection."""
+        super().setup()
+        self.server.mock.record_connection()
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handle GET requests."""
+        path = self.path.split('?', 1)[0]
+        self.server.mock.record(path)
+        if path != '/_mock/stats' and self.inject_fault():
+            return
+        if path == '/oauth/v1/generate':
+            self.send_json(200, self.server.mock.oauth_response())
+        elif path == '/_mock/stats':
+            self.send_json(200, self.server.mock.stats())
+        else:
+            self.send_json(404, {'errorMessage': 'Not found'})
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handle POST requests."""
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if self.path == '/_mock/fault':
+            self.send_json(200, self.server.mock.set_fault(**body))
+            return
+        self.server.mock.record(self.path, body.get('BusinessShortCode'))
+        if self.server.mock.latency:
+            time.sleep(self.server.mock.latency)
+        if self.inject_fault():
+            return
+        if self.server.mock.is_revoked(self.headers.get('Authorization', '')):
+            self.send_json(404, self.server.mock.invalid_token_response())
+        elif self.server.mock.should_fail():
+            self.send_json(503, self.server.mock.error_response())
+        elif self.path == '/mpesa/stkpush/v1/processrequest':
+            self.send_json(200, self.server.mock.stk_push_response(body))
+        elif self.path == '/mpesa/stkpushquery/v1/query':
+            if self.server.mock.is_processing(body.get('CheckoutRequestID')):
+                self.send_json(500, self.server.mock.processing_response())
+            else:
+                self.send_json(200, self.server.mock.stk_query_response(body))
+        else:
+            self.send_json(404, {'errorMessage': 'Not found'})
+
+    def inject_fault(self):
+        """Fail the call as the mock's ``fault`` says.
+
+        Returns:
+            bool: Whether the call was failed.
+        """
+        fault = self.server.mock.fault
+        if fault == 'unavailable':
+            self.send_json(503, self.server.mock.error_response())
+        elif fault == 'reset':
+            # Hang up without answering, as a failing load balancer would
+            self.close_connection = True
+        else:
+            return False
+        return True
+
+    def send_json(self, status, body):
+        """Write a JSON response with an explicit content length."""
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Silence per-request logging."""
+
+
+class MockDarajaServer(ThreadingHTTPServer):
+    """Threaded HTTP server that can queue many simultaneous connections."""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class CallbackSender:
+    """
+    Posts STK push results to their callback URLs once they are due.
+
+    Attributes:
+        sent (int): Number of callbacks acknowledged with a 2xx.
+        failed (int): Number of callbacks that could not be delivered.
+        latencies (list): Seconds each delivered callback took to be acknowledged.
+    """
+
+    def __init__(self, workers=8):
+        self._session = requests.Session()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='callback')
+        self._due = []
+        self._condition = threading.Condition()
+        self._lock = threading.Lock()
+        self._stopped = False
+        self.sent = 0
+        self.failed = 0
+        self.latencies = []
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def schedule(self, delay, url, body):
+        """Post ``body`` to ``url`` in ``delay`` seconds."""
+        with self._condition:
+            heapq.heappush(self._due, (time.monotonic() + delay, uuid.uuid4().hex, url, body))
+            self._condition.notify()
+
+    def stop(self):
+        """Stop delivering callbacks."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        """Hand callbacks to the delivery threads as they become due."""
+        with self._condition:
+            while not self._stopped:
+                if not self._due:
+                    self._condition.wait()
+                    continue
+                wait = self._due[0][0] - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                _, _, url, body = heapq.heappop(self._due)
+                self._executor.submit(self._deliver, url, body)
+
+    def _deliver(self, url, body):
+        """Post one callback and record the outcome."""
+        started = time.monotonic()
+        try:
+            response = self._session.post(url, json=body, timeout=10)
+            delivered = response.ok
+        except requests.RequestException:
+            delivered = False
+        with self._lock:
+            if delivered:
+                self.sent += 1
+                self.latencies.append(time.monotonic() - started)
+            else:
+                self.failed += 1
+
+
+class MockDaraja:
+    """
+    Threaded mock Daraja server.
+
+    Attributes:
+        calls (Counter): Number of requests received per path.
+        shortcodes (Counter): Number of STK push and query calls per BusinessShortCode.
+        connections (int): Number of TCP connections accepted.
+        latency (float): Seconds to wait before answering STK push and query calls.
+        error_rate (float): Share of STK push and query calls answered with a 503.
+        callback_delay (float): Seconds after an accepted STK push at which its
+            result is posted to the push's CallBackURL; None to send no callbacks.
+        processing_time (float): Seconds after an accepted STK push during which
+            status queries report it as still being processed.
+        fault (str): Outage to inject into every Daraja call: 'unavailable'
+            answers a 503, 'reset' closes the connection without answering,
+            None serves calls normally. Combine with ``latency`` for a slow
+            outage.
+        token_ttl (int): ``expires_in`` value returned by the OAuth endpoint.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, token_ttl=3599, latency=0.0,
+                 error_rate=0.0, callback_delay=None, seed=None, processing_time=0.0,
+                 fault=None):
+        self.token_ttl = token_ttl
+        self.fault = fault
+        self.latency = latency
+        self.error_rate = error_rate
+        self.callback_delay = callback_delay
+        self.processing_time = processing_time
+        # Monotonic time each accepted push finishes processing, by CheckoutRequestID
+        self._processed_at = {}
+        self._random = random.Random(seed)
+        self.callbacks = CallbackSender() if callback_delay is not None else None
+        self.calls = Counter()
+        self.shortcodes = Counter()
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._tokens_issued = 0
+        self._revoked = set()
+        self._server = MockDarajaServer((host, port), MockDarajaHandler)
+        self._server.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL of the running server."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Start serving in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serve in the calling thread until the process is stopped."""
+        self._server.serve_forever()
+
+    def stop(self):
+        """Shut the server down."""
+        if self.callbacks is not None:
+            self.callbacks.stop()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        """Counters of the server, as served on ``/_mock/stats``."""
+        with self._lock:
+            stats = {'calls': dict(self.calls), 'connections': self.connections}
+        if self.callbacks is not None:
+            with self.callbacks._lock:  # pylint: disable=protected-access
+                stats['callbacks'] = {
+                    'sent': self.callbacks.sent,
+                    'failed': self.callbacks.failed,
+                    'latencies': list(self.callbacks.latencies),
+                }
+        return stats
+
+    def set_fault(self, fault=None, latency=None):
+        """Start or stop an outage, as posted to ``/_mock/fault``.
+
+        Args:
+            fault (str): New value of ``fault``.
+            latency (float): New value of ``latency``; None keeps the current one.
+
+        Returns:
+            dict: The fault and latency now in effect.
+        """
+        self.fault = fault
+        if latency is not None:
+            self.latency = latency
+        return {'fault': self.fault, 'latency': self.latency}
+
+    def should_fail(self):
+        """Decide whether the current call fails, according to ``error_rate``."""
+        with self._lock:
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def error_response(self):
+        """Reject a call as Daraja does when it is overloaded."""
+        return {
+            'requestId': uuid.uuid4().hex[:20],
+            'errorCode': '503.001.01',
+            'errorMessage': 'Service Unavailable'
+        }
+
+    def record(self, path, shortcode=None):
+        """Count a request for ``path``, and the shortcode it was made for."""
+        with self._lock:
+            self.calls[path] += 1
+            if shortcode is not None:
+                self.shortcodes[str(shortcode)] += 1
+
+    def record_connection(self):
+        """Count a new connection."""
+        with self._lock:
+            self.connections += 1
+
+    def oauth_response(self):
+        """Issue a new access token."""
+        with self._lock:
+            self._tokens_issued += 1
+            token = f"mock-token-{self._tokens_issued}"
+        return {'access_token': token, 'expires_in': str(self.token_ttl)}
+
+    def revoke_tokens(self):
+        """Reject every access token issued so far, as after a credential rotation."""
+        with self._lock:
+            self._revoked.update(
+                f"mock-token-{number}" for number in range(1, self._tokens_issued + 1)
+            )
+
+    def is_revoked(self, authorization):
+        """Whether the bearer token of an ``Authorization`` header was revoked."""
+        with self._lock:
+            return authorization.rpartition(' ')[2] in self._revoked
+
+    def invalid_token_response(self):
+        """Reject a call made with a revoked access token."""
+        return {
+            'requestId': uuid.uuid4().hex[:20],
+            'errorCode': '404.001.03',
+            'errorMessage': 'Invalid Access Token'
+        }
+
+    def stk_push_response(self, body):
+        """Accept an STK push request and schedule its callback."""
+        response = {
+            'MerchantRequestID': uuid.uuid4().hex[:20],
+            'CheckoutRequestID': f"ws_CO_{uuid.uuid4().hex}",
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing'
+        }
+        if self.processing_time:
+            with self._lock:
+                self._processed_at[response['CheckoutRequestID']] = (
+                    time.monotonic() + self.processing_time
+                )
+        if self.callbacks is not None and body.get('CallBackURL'):
+            self.callbacks.schedule(
+                self.callback_delay, body['CallBackURL'], self.stk_callback(body, response)
+            )
+        return response
+
+    def stk_callback(self, body, response):
+        """Build the callback M-Pesa posts for a successful STK push."""
+        with self._lock:
+            receipt = f"MCK{self._random.randrange(36 ** 7):07X}"[:10]
+        return {'Body': {'stkCallback': {
+            'MerchantRequestID': response['MerchantRequestID'],
+            'CheckoutRequestID': response['CheckoutRequestID'],
+            'ResultCode': 0,
+            'ResultDesc': 'The service request is processed successfully.',
+            'CallbackMetadata': {'Item': [
+                {'Name': 'Amount', 'Value': body.get('Amount')},
+                {'Name': 'MpesaReceiptNumber', 'Value': receipt},
+                {'Name': 'TransactionDate', 'Value': int(datetime.now().strftime('%Y%m%d%H%M%S'))},
+                {'Name': 'PhoneNumber', 'Value': body.get('PhoneNumber')},
+            ]}
+        }}}
+
+    def is_processing(self, checkout_request_id):
+        """Whether the push of ``checkout_request_id`` is still being processed."""
+        with self._lock:
+            return self._processed_at.get(checkout_request_id, 0) > time.monotonic()
+
+    def processing_response(self):
+        """Answer a status query for a push that is still being processed."""
+        return {
+            'requestId': uuid.uuid4().hex[:20],
+            'errorCode': '500.001.1001',
+            'errorMessage': 'The transaction is being processed'
+        }
+
+    def stk_query_response(self, body):
+        """Report an STK push as processed successfully."""
+        return {
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successsfully',
+            'MerchantRequestID': uuid.uuid4().hex[:20],
+            'CheckoutRequestID': body.get('CheckoutRequestID'),
+            'ResultCode': '0',
+            'ResultDesc': 'The service request is processed successfully.'
+        }
+
+
+def main():
+    """Serve a mock Daraja until interrupted."""
+    parser = argparse.ArgumentParser(description='Serve a mock Daraja API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--callback-delay', type=float, default=None)
+    parser.add_argument('--processing-time', type=float, default=0.0)
+    parser.add_argument('--fault', choices=('unavailable', 'reset'), default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    mock = MockDaraja(
+        host=args.host, port=args.port, latency=args.latency, error_rate=args.error_rate,
+        callback_delay=args.callback_delay, seed=args.seed, processing_time=args.processing_time,
+        fault=args.fault
+    )
+    print(f"Mock Daraja listening on {mock.url}", flush=True)
+    try:
+        mock.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Module for testing the archival of old transactions."""
+
+import unittest
+from datetime import timedelta
+from unittest.mock import patch
+from app import create_app, db, models, services, summary
+from app.archive import Archiver
+from app.models import ArchivedTransaction, MpesaTransaction
+
+
+class TestArchive(unittest.TestCase):
+    """Test case for moving old transactions to the archive and finding them there."""
+
+    def setUp(self):
+        """Create an app and store old and recent transactions."""
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+        self.app.config['TESTING'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        now = models.utcnow()
+        # Five old final transactions, one old pending and two recent final ones
+        for number, (status, age) in enumerate(
+            [('Completed', 100)] * 3 + [('Cancelled', 120)] * 2 + [('Pending', 100)]
+            + [('Completed', 1)] * 2
+        ):
+            db.session.add(MpesaTransaction(
+                full_name='John Doe', phone_number='254708374149', amount=number + 1,
+                checkout_request_id=f'ws_CO_{number}', status=status,
+                result_code='0' if status == 'Completed' else '1032',
+                created_at=now - timedelta(days=age)
+            ))
+        db.session.commit()
+        summary.rebuild()
+
+    def tearDown(self):
+        """Drop the database."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def archive(self):
+        """Archive the transactions older than 90 days, two at a time."""
+        return Archiver(after_days=90, batch_size=2, pause=0).run()
+
+    def test_moves_old_final_transactions_in_batches(self):
+        """Test that only old final transactions are moved, keeping their IDs."""
+        live_ids = {transaction.checkout_request_id: transaction.id
+                    for transaction in MpesaTransaction.query.all()}
+        self.assertEqual(self.archive(), 5)
+        self.assertEqual(self.archive(), 0)
+
+        self.assertEqual(
+            sorted(transaction.checkout_request_id for transaction in MpesaTransaction.query),
+            ['ws_CO_5', 'ws_CO_6', 'ws_CO_7']
+        )
+        archived = ArchivedTransaction.query.all()
+        self.assertEqual(len(archived), 5)
+        for transaction in archived:
+            self.assertEqual(transaction.id, live_ids[transaction.checkout_request_id])
+            self.assertIsNotNone(transaction.archived_at)
+
+    def test_max_batches(self):
+        """Test that a run can be bounded to a number of batches."""
+        self.assertEqual(Archiver(after_days=90, batch_size=2, pause=0).run(max_batches=1), 2)
+        self.assertEqual(MpesaTransaction.query.count(), 6)
+
+    @patch('app.services.request_transaction_status')
+    def test_lookups_fall_back_to_the_archive(self, request_transaction_status):
+        """Test that archived transactions are still found by checkout request ID."""
+        self.archive()
+
+        self.assertEqual(services.find_transaction('ws_CO_3').status, 'Cancelled')
+        response = self.client.post(
+            '/query_transaction_status', json={'checkout_request_id': 'ws_CO_0'}
+        )
+        self.assertEqual(response.get_json()['ResultCode'], '0')
+        request_transaction_status.assert_not_called()
+
+        results = self.client.post('/sync_transaction_statuses', json={
+            'checkout_request_ids': ['ws_CO_1', 'ws_CO_9']
+        }).get_json()['results']
+        self.assertEqual([result['status'] for result in results], ['Completed', 'unknown'])
+        request_transaction_status.assert_not_called()
+
+    def test_late_updates_of_archived_transactions(self):
+        """Test that an update of an archived transaction is known and changes nothing."""
+        self.archive()
+        update = {'checkout_request_id': 'ws_CO_0', 'status': 'Timeout', 'result_code': '1037'}
+        self.assertEqual(services.apply_status_updates([update]), [])
+        self.assertEqual(services.find_transaction('ws_CO_0').status, 'Completed')
+
+    def test_archived_listing_and_summary(self):
+        """Test that archived transactions are listed on request and stay summarized."""
+        totals = summary.aggregate()['totals']
+        self.archive()
+
+        body = self.client.get('/transactions', query_string={'archived': 'true'}).get_json()
+        self.assertEqual(len(body['transactions']), 5)
+        self.assertEqual(len(self.client.get('/transactions').get_json()['transactions']), 3)
+
+        summary.rebuild()
+        self.assertEqual(summary.aggregate()['totals'], totals)
+
+    def test_archive_command(self):
+        """Test the ``flask archive run`` command."""
+        result = self.app.test_cli_runner().invoke(
+            args=['archive', 'run', '--after-days', '110', '--batch-size', '10']
+        )
+        self.assertEqual(result.output.strip(), 'Archived 2 transactions.')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""Module for testing the async payment engine and async routes."""
+
+import asyncio
+import unittest
+from unittest.mock import patch
+from app import create_app, db, services
+from app.async_services import AsyncEngine, initiate_stk_push, query_transaction_status
+from app.models import MpesaTransaction
+from tests.mock_daraja import MockDaraja
+
+app = create_app()
+
+
+class TestAsyncServices(unittest.TestCase):
+    """Test case for the async services against a local mock Daraja."""
+
+    def setUp(self):
+        """Start the mock server, a fresh engine and an in-memory database."""
+        app.config['TESTING'] = True
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.app = app.test_client()
+        db.create_all()
+
+        self.server = MockDaraja().start()
+        self.base_url = services.client.base_url
+        services.client.base_url = self.server.url
+        services.token_manager.invalidate()
+
+        self.engine = AsyncEngine(app, db_workers=1)
+        self.engine.run(self.noop())
+        self.engine.client.base_url = self.server.url
+        self.engine_patch = patch('app.async_services.engine', self.engine)
+        self.engine_patch.start()
+
+    def tearDown(self):
+        """Stop the engine and the mock server and drop the database."""
+        self.engine_patch.stop()
+        self.engine.stop()
+        services.client.base_url = self.base_url
+        services.token_manager.invalidate()
+        self.server.stop()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    async def noop(self):
+        """Coroutine used to start the engine."""
+
+    def test_stop_drains_calls_in_flight(self):
+        """Test that stopping with a timeout lets the running coroutines finish."""
+        engine = AsyncEngine(app, db_workers=1)
+
+        async def slow():
+            await asyncio.sleep(0.2)
+            return 'done'
+
+        future = engine.submit(slow())
+        engine.stop(timeout=5)
+        self.assertEqual(future.result(0), 'done')
+
+    def test_initiate_stk_push(self):
+        """Test that an accepted STK push is recorded as pending."""
+        response = self.engine.run(initiate_stk_push('John Doe', 254700000000, 100))
+
+        self.assertEqual(response['ResponseCode'], '0')
+        transaction = MpesaTransaction.query.filter_by(
+            checkout_request_id=response['CheckoutRequestID']
+        ).one()
+        self.assertEqual(transaction.status, 'Pending')
+        self.assertEqual(transaction.amount, 100)
+
+    def test_concurrent_stk_pushes_share_one_token(self):
+        """Test that many in-flight pushes reuse the cached token and pooled client."""
+        futures = [
+            self.engine.submit(initiate_stk_push('John Doe', 254700000000, amount))
+            for amount in range(1, 21)
+        ]
+        responses = [future.result(10) for future in futures]
+
+        self.assertTrue(all(r['ResponseCode'] == '0' for r in responses))
+        self.assertEqual(MpesaTransaction.query.count(), 20)
+        self.assertEqual(self.server.calls['/oauth/v1/generate'], 1)
+        self.assertLessEqual(self.server.connections, 21)
+
+    def test_query_transaction_status(self):
+        """Test that a successful status query completes the transaction."""
+        response = self.engine.run(initiate_stk_push('John Doe', 254700000000, 100))
+        checkout_request_id = response['CheckoutRequestID']
+
+        response = self.engine.run(query_transaction_status(checkout_request_id))
+
+        self.assertEqual(response['ResultCode'], '0')
+        transaction = MpesaTransaction.query.filter_by(
+            checkout_request_id=checkout_request_id
+        ).one()
+        db.session.refresh(transaction)
+        self.assertEqual(transaction.status, 'Completed')
+
+    def test_revoked_token_is_replaced(self):
+        """Test that a rejected access token is dropped and the call retried once."""
+        self.engine.run(initiate_stk_push('John Doe', 254700000000, 100))
+        self.server.revoke_tokens()
+
+        response = self.engine.run(initiate_stk_push('John Doe', 254700000000, 100))
+
+        self.assertEqual(response['ResponseCode'], '0')
+        self.assertEqual(self.server.calls['/oauth/v1/generate'], 2)
+        self.assertEqual(self.server.calls['/mpesa/stkpush/v1/processrequest'], 3)
+
+    def test_async_initiate_route(self):
+        """Test the async STK push route."""
+        response = self.app.post('/async/initiate_mpesa_stk_push', json={
+            'full_name': 'John Doe',
+            'phone_number': '254700000000',
+            'amount': 1
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['ResponseCode'], '0')
+
+    def test_async_initiate_route_invalid_amount(self):
+        """Test that the async STK push route validates its input."""
+        response = self.app.post('/async/initiate_mpesa_stk_push', json={
+            'full_name': 'John Doe',
+            'phone_number': '254700000000',
+            'amount': 'invalid_amount'
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['error'], 'Invalid amount.')
+        self.assertEqual(self.server.calls['/mpesa/stkpush/v1/processrequest'], 0)
+
+    def test_async_query_route(self):
+        """Test the async transaction status route."""
+        response = self.app.post('/async/query_transaction_status', json={
+            'checkout_request_id': 'ws_CO_13012021093521236557'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['ResultCode'], '0')
+
+    def test_async_query_route_missing_checkout_request_id(self):
+        """Test the async transaction status route without a checkout request ID."""
+        response = self.app.post('/async/query_transaction_status', json={})
+        self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
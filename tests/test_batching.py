@@ -0,0 +1,89 @@
+"""Module for testing the batch buffer."""
+
+import threading
+import unittest
+from app.batching import BatchBuffer
+
+
+class TestBatchBuffer(unittest.TestCase):
+    """Test case for the BatchBuffer class."""
+
+    def setUp(self):
+        """Set up a buffer that records its batches."""
+        self.batches = []
+        self.flushed = threading.Event()
+        self.buffer = BatchBuffer(self.record, batch_size=3, interval=60)
+
+    def tearDown(self):
+        """Stop the background thread."""
+        self.buffer.close()
+
+    def record(self, items):
+        """Flush function that remembers every batch."""
+        self.batches.append(sorted(items))
+        self.flushed.set()
+
+    def test_flush_hands_over_waiting_items(self):
+        """Test that a manual flush delivers all waiting items in one batch."""
+        self.buffer.add('a', 1)
+        self.buffer.add('b', 2)
+        self.assertEqual(len(self.buffer), 2)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.batches, [[1, 2]])
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_duplicate_keys_are_coalesced(self):
+        """Test that an item replaces the one waiting under the same key."""
+        self.buffer.add('a', 1)
+        self.buffer.add('a', 2)
+        self.assertEqual(self.buffer.get('a'), 2)
+        self.buffer.flush()
+        self.assertEqual(self.batches, [[2]])
+
+    def test_full_buffer_is_flushed_in_background(self):
+        """Test that reaching the batch size wakes the flush thread."""
+        for key in 'abc':
+            self.buffer.add(key, key)
+        self.assertTrue(self.flushed.wait(2))
+        self.assertEqual(self.batches, [['a', 'b', 'c']])
+        self.assertEqual(self.buffer.batches, 1)
+
+    def test_interval_flush(self):
+        """Test that waiting items are flushed after the interval."""
+        buffer = BatchBuffer(self.record, batch_size=100, interval=0.05)
+        buffer.add('a', 1)
+        self.assertTrue(self.flushed.wait(2))
+        buffer.close()
+        self.assertEqual(self.batches, [[1]])
+
+    def test_failed_flush_keeps_items(self):
+        """Test that items are put back when the flush function raises."""
+        def failing(items):
+            raise RuntimeError(items)
+
+        buffer = BatchBuffer(failing, batch_size=100, interval=60)
+        buffer.add('a', 1)
+        with self.assertLogs('app.batching', 'ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+            self.assertEqual(buffer.get('a'), 1)
+            buffer.close()
+
+    def test_items_are_visible_while_flushing(self):
+        """Test that an item can still be read while its flush is running."""
+        seen = []
+        buffer = BatchBuffer(lambda items: seen.append(buffer.get('a')), interval=60)
+        buffer.add('a', 1)
+        buffer.flush()
+        self.assertEqual(seen, [1])
+        self.assertIsNone(buffer.get('a'))
+        buffer.close()
+
+    def test_close_flushes_remaining_items(self):
+        """Test that closing the buffer flushes what is left."""
+        self.buffer.add('a', 1)
+        self.buffer.close()
+        self.assertEqual(self.batches, [[1]])
+
+if __name__ == '__main__':
+    unittest.main()
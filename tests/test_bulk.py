@@ -0,0 +1,130 @@
+"""Module for testing bulk STK pushes."""
+
+import json
+import time
+import unittest
+from unittest.mock import patch
+import requests
+from app import create_app, db, services
+from app.bulk import BulkStkPush
+from app.models import MpesaTransaction
+from app.ratelimit import RateLimiter
+from tests.mock_daraja import MockDaraja
+
+app = create_app()
+
+
+def items(count):
+    """Build ``count`` valid bulk items."""
+    return [
+        {'full_name': 'John Doe', 'phone_number': '254708374149', 'amount': amount}
+        for amount in range(1, count + 1)
+    ]
+
+
+class TestBulkStkPush(unittest.TestCase):
+    """Test case for the bulk STK push endpoint against a local mock Daraja."""
+
+    def setUp(self):
+        """Start the mock server and set up a test client and an in-memory database."""
+        app.config['TESTING'] = True
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.app = app.test_client()
+        db.create_all()
+        self.server = MockDaraja(latency=0.05).start()
+        self.base_url = services.client.base_url
+        services.client.base_url = self.server.url
+        services.token_manager.invalidate()
+
+    def tearDown(self):
+        """Stop the mock server and drop the database."""
+        services.client.base_url = self.base_url
+        services.token_manager.invalidate()
+        self.server.stop()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def post(self, body):
+        """Post a bulk request and parse the streamed results."""
+        response = self.app.post('/bulk_stk_push', json=body)
+        if response.mimetype != 'application/x-ndjson':
+            return response, None
+        lines = response.get_data(as_text=True).splitlines()
+        return response, [json.loads(line) for line in lines]
+
+    @patch('app.bulk.limiter', RateLimiter(0))
+    def test_items_are_sent_concurrently_and_inserted(self):
+        """Test that every item is sent, reported and recorded."""
+        started = time.perf_counter()
+        response, results = self.post({'items': items(40)})
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(result['index'] for result in results), list(range(40)))
+        self.assertTrue(all(result['status'] == 'accepted' for result in results))
+        self.assertEqual(MpesaTransaction.query.count(), 40)
+        self.assertEqual(self.server.calls['/mpesa/stkpush/v1/processrequest'], 40)
+        # 40 calls of 50 ms each would take 2 s one at a time
+        self.assertLess(elapsed, 1.5)
+
+    def test_invalid_items_reject_the_whole_batch(self):
+        """Test that nothing is sent unless every item is valid."""
+        batch = items(3)
+        batch[1]['amount'] = 'ten'
+        batch[2] = {'full_name': 'John Doe'}
+        response, _ = self.post({'items': batch})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['errors'], [
+            {'index': 1, 'error': 'Invalid amount.'},
+            {'index': 2, 'error': 'Full name, phone number, and amount are required.'},
+        ])
+        self.assertEqual(self.server.calls['/mpesa/stkpush/v1/processrequest'], 0)
+
+    def test_empty_and_oversized_batches(self):
+        """Test that a batch must hold between one and the maximum number of items."""
+        self.assertEqual(self.post({'items': []})[0].status_code, 400)
+        self.assertEqual(self.post([])[0].status_code, 400)
+        maximum = app.config['BULK_MAX_ITEMS']
+        self.assertEqual(self.post({'items': items(maximum + 1)})[0].status_code, 400)
+
+    @patch('app.services.send_stk_push')
+    def test_rejected_and_failed_items(self, mock_send):
+        """Test that rejected and failed pushes are reported and not recorded."""
+        def send(_phone_number, amount, _tenant=None):
+            if amount == 2:
+                return {'ResponseCode': '1', 'ResponseDescription': 'Invalid amount'}
+            if amount == 3:
+                raise requests.ConnectionError('Daraja unavailable')
+            return {'ResponseCode': '0', 'CheckoutRequestID': f'ws_CO_{amount}'}
+        mock_send.side_effect = send
+
+        with self.assertLogs('app.bulk', 'WARNING'):
+            _, results = self.post({'items': items(3)})
+
+        statuses = {result['index']: result['status'] for result in results}
+        self.assertEqual(statuses, {0: 'accepted', 1: 'rejected', 2: 'error'})
+        self.assertEqual(MpesaTransaction.query.one().checkout_request_id, 'ws_CO_1')
+
+    def test_rate_limit(self):
+        """Test that the rate limiter spaces the pushes out."""
+        sender = BulkStkPush(concurrency=8, rate_limiter=RateLimiter(20, burst=1))
+        started = time.perf_counter()
+        results = list(sender.run([('John Doe', 254708374149, 1)] * 6))
+        self.assertEqual(len(results), 6)
+        self.assertGreaterEqual(time.perf_counter() - started, 0.25)
+
+    def test_abandoned_stream_records_accepted_pushes(self):
+        """Test that pushes already accepted are recorded when the client goes away."""
+        sender = BulkStkPush(concurrency=4, insert_batch_size=100)
+        results = sender.run([('John Doe', 254708374149, amount) for amount in range(1, 21)])
+        next(results)
+        results.close()
+        recorded = MpesaTransaction.query.count()
+        self.assertGreaterEqual(recorded, 1)
+        self.assertEqual(recorded, self.server.calls['/mpesa/stkpush/v1/processrequest'])
+
+if __name__ == '__main__':
+    unittest.main()
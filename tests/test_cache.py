@@ -0,0 +1,99 @@
+"""Module for testing the caching primitives."""
+
+import threading
+import time
+import unittest
+from app.cache import SingleFlight, TTLCache
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    """Test case for the TTLCache class."""
+
+    def setUp(self):
+        """Set up a cache of three entries living ten seconds."""
+        self.clock = FakeClock()
+        self.cache = TTLCache(maxsize=3, ttl=10, clock=self.clock)
+
+    def test_get_and_expiry(self):
+        """Test that entries are served until their time to live runs out."""
+        self.cache.set('a', 1)
+        self.clock.now = 9.9
+        self.assertEqual(self.cache.get('a'), 1)
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_per_entry_ttl(self):
+        """Test that an entry can be given its own time to live."""
+        self.cache.set('a', 1, ttl=1)
+        self.cache.set('b', 2, ttl=0)
+        self.clock.now = 2
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+
+    def test_least_recently_used_is_evicted(self):
+        """Test that the cache stays within its size by evicting the least recently used entry."""
+        for key in 'abc':
+            self.cache.set(key, key)
+        self.cache.get('a')
+        self.cache.set('d', 'd')
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual([self.cache.get(key) for key in 'acd'], ['a', 'c', 'd'])
+
+    def test_pop(self):
+        """Test that an entry can be removed."""
+        self.cache.set('a', 1)
+        self.assertEqual(self.cache.pop('a'), 1)
+        self.assertIsNone(self.cache.pop('a'))
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test case for the SingleFlight class."""
+
+    def test_concurrent_calls_share_one_result(self):
+        """Test that callers arriving while a call runs get its result."""
+        flight = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'result'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do('key', slow)))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['result'] * 10)
+        self.assertEqual(len(calls), 1)
+
+    def test_error_is_raised_and_not_kept(self):
+        """Test that a failed call raises and the next call runs again."""
+        flight = SingleFlight()
+
+        def failing():
+            raise RuntimeError('boom')
+
+        with self.assertRaises(RuntimeError):
+            flight.do('key', failing)
+        self.assertEqual(flight.do('key', lambda: 1), 1)
+
+if __name__ == '__main__':
+    unittest.main()
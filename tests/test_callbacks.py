@@ -0,0 +1,197 @@
+"""Module for testing the M-Pesa callback endpoint and status ingestion."""
+
+import unittest
+from datetime import datetime
+from app import create_app, db, services
+from app.models import MpesaTransaction
+from tests.mock_daraja import MockDaraja
+
+app = create_app()
+
+
+def stk_callback(checkout_request_id, result_code=0, result_desc=None, metadata=True):
+    """Build an STK push callback body as posted by M-Pesa."""
+    callback = {
+        'MerchantRequestID': '29115-34620561-1',
+        'CheckoutRequestID': checkout_request_id,
+        'ResultCode': result_code,
+        'ResultDesc': result_desc or 'The service request is processed successfully.',
+    }
+    if metadata:
+        callback['CallbackMetadata'] = {'Item': [
+            {'Name': 'Amount', 'Value': 1.00},
+            {'Name': 'MpesaReceiptNumber', 'Value': 'NLJ7RT61SV'},
+            {'Name': 'Balance'},
+            {'Name': 'TransactionDate', 'Value': 20191219102115},
+            {'Name': 'PhoneNumber', 'Value': 254708374149},
+        ]}
+    return {'Body': {'stkCallback': callback}}
+
+
+class TestCallbacks(unittest.TestCase):
+    """Test case for STK push callback handling."""
+
+    def setUp(self):
+        """Set up a test client and pending transactions."""
+        app.config['TESTING'] = True
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.app = app.test_client()
+        db.create_all()
+        for checkout_request_id in ('ws_CO_1', 'ws_CO_2'):
+            db.session.add(MpesaTransaction(
+                full_name='John Doe',
+                phone_number='254708374149',
+                amount=1,
+                checkout_request_id=checkout_request_id,
+                status='Pending'
+            ))
+        db.session.commit()
+
+    def tearDown(self):
+        """Drop the database and empty the callback buffer."""
+        services.callback_buffer.flush()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def transaction(self, checkout_request_id):
+        """Load a transaction fresh from the database."""
+        db.session.expire_all()
+        return MpesaTransaction.query.filter_by(checkout_request_id=checkout_request_id).one()
+
+    def test_parse_successful_callback(self):
+        """Test that a successful callback maps to a completed transaction."""
+        update = services.parse_stk_callback(stk_callback('ws_CO_1'))
+        self.assertEqual(update, {
+            'checkout_request_id': 'ws_CO_1',
+            'status': 'Completed',
+            'result_code': '0',
+            'result_desc': 'The service request is processed successfully.',
+            'mpesa_receipt_number': 'NLJ7RT61SV',
+            'transaction_date': '20191219102115',
+            'transaction_time': datetime(2019, 12, 19, 7, 21, 15),
+        })
+
+    def test_parse_cancelled_callback(self):
+        """Test that a cancelled request carries no receipt."""
+        update = services.parse_stk_callback(
+            stk_callback('ws_CO_1', 1032, 'Request cancelled by user', metadata=False)
+        )
+        self.assertEqual(update['status'], 'Cancelled')
+        self.assertIsNone(update['mpesa_receipt_number'])
+        self.assertIsNone(update['transaction_date'])
+
+    def test_parse_invalid_callback(self):
+        """Test that a body without an STK callback is rejected."""
+        with self.assertRaises(ValueError):
+            services.parse_stk_callback({'Body': {}})
+
+    def test_status_for_result_code(self):
+        """Test the mapping of result codes to statuses."""
+        self.assertEqual(services.status_for_result_code(0), 'Completed')
+        self.assertEqual(services.status_for_result_code('1037'), 'Timeout')
+        self.assertEqual(services.status_for_result_code(1), 'Insufficient Funds')
+        self.assertEqual(services.status_for_result_code('2001'), 'Failed')
+
+    def test_mock_daraja_callback_is_accepted(self):
+        """Test that the callbacks posted by the mock Daraja server parse."""
+        mock = MockDaraja(callback_delay=60).start()
+        try:
+            body = {'Amount': 5, 'PhoneNumber': 254708374149, 'CallBackURL': 'http://x/cb'}
+            response = mock.stk_push_response(body)
+            update = services.parse_stk_callback(mock.stk_callback(body, response))
+        finally:
+            mock.stop()
+        self.assertEqual(update['checkout_request_id'], response['CheckoutRequestID'])
+        self.assertEqual(update['status'], 'Completed')
+        self.assertIsNotNone(update['transaction_time'])
+
+    def test_callback_is_acknowledged_and_buffered(self):
+        """Test that the endpoint acknowledges before anything is written."""
+        response = self.app.post('/mpesa_callback', json=stk_callback('ws_CO_1'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'ResultCode': 0, 'ResultDesc': 'Accepted'})
+        self.assertIsNotNone(services.callback_buffer.get('ws_CO_1'))
+        self.assertEqual(self.transaction('ws_CO_1').status, 'Pending')
+
+    def test_invalid_callback_is_rejected(self):
+        """Test that a malformed callback is not buffered."""
+        response = self.app.post('/mpesa_callback', json={'Body': {}})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['ResultCode'], 1)
+        self.assertEqual(len(services.callback_buffer), 0)
+
+    def test_buffered_callbacks_are_written_in_one_batch(self):
+        """Test that a flush writes every buffered callback."""
+        self.app.post('/mpesa_callback', json=stk_callback('ws_CO_1'))
+        self.app.post('/mpesa_callback', json=stk_callback(
+            'ws_CO_2', 1032, 'Request cancelled by user', metadata=False
+        ))
+        batches = services.callback_buffer.batches
+
+        self.assertEqual(services.callback_buffer.flush(), 2)
+
+        self.assertEqual(services.callback_buffer.batches, batches + 1)
+        completed = self.transaction('ws_CO_1')
+        self.assertEqual(completed.status, 'Completed')
+        self.assertEqual(completed.mpesa_receipt_number, 'NLJ7RT61SV')
+        self.assertEqual(completed.transaction_date, '20191219102115')
+        self.assertEqual(completed.transaction_time, datetime(2019, 12, 19, 7, 21, 15))
+        self.assertGreaterEqual(completed.updated_at, completed.created_at)
+        cancelled = self.transaction('ws_CO_2')
+        self.assertEqual(cancelled.status, 'Cancelled')
+        self.assertEqual(cancelled.result_desc, 'Request cancelled by user')
+
+    def test_duplicate_deliveries_are_idempotent(self):
+        """Test that replayed callbacks don't change a final transaction."""
+        self.app.post('/mpesa_callback', json=stk_callback('ws_CO_1'))
+        self.app.post('/mpesa_callback', json=stk_callback('ws_CO_1'))
+        self.assertEqual(services.callback_buffer.flush(), 1)
+
+        # A late, conflicting delivery after the transaction is final is ignored
+        self.app.post('/mpesa_callback', json=stk_callback('ws_CO_1', 1037, 'Timed out'))
+        services.callback_buffer.flush()
+
+        transaction = self.transaction('ws_CO_1')
+        self.assertEqual(transaction.status, 'Completed')
+        self.assertEqual(transaction.mpesa_receipt_number, 'NLJ7RT61SV')
+
+    def test_callback_for_unknown_transaction(self):
+        """Test that a callback without a matching transaction is reported and not written."""
+        update = services.parse_stk_callback(stk_callback('ws_CO_9'))
+        self.assertEqual(services.apply_status_updates([update]), [update])
+        self.assertEqual(MpesaTransaction.query.count(), 2)
+
+    def test_early_callback_waits_for_its_transaction(self):
+        """Test that a callback beating its transaction's commit is applied on the next flush."""
+        self.app.post('/mpesa_callback', json=stk_callback('ws_CO_3'))
+        with self.assertLogs('app.services', 'INFO'):
+            services.callback_buffer.flush()
+        self.assertIsNotNone(services.callback_buffer.get('ws_CO_3'))
+
+        db.session.add(MpesaTransaction(
+            full_name='John Doe',
+            phone_number='254708374149',
+            amount=1,
+            checkout_request_id='ws_CO_3',
+            status='Pending'
+        ))
+        db.session.commit()
+        services.callback_buffer.flush()
+
+        transaction = self.transaction('ws_CO_3')
+        self.assertEqual(transaction.status, 'Completed')
+        self.assertEqual(transaction.mpesa_receipt_number, 'NLJ7RT61SV')
+
+    def test_unknown_callback_is_dropped_after_one_retry(self):
+        """Test that a callback for a transaction that never appears is dropped."""
+        self.app.post('/mpesa_callback', json=stk_callback('ws_CO_9'))
+        services.callback_buffer.flush()
+        with self.assertLogs('app.services', 'WARNING'):
+            services.callback_buffer.flush()
+        self.assertEqual(len(services.callback_buffer), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,9 @@
 import unittest
 import os
 from dotenv import load_dotenv
-from app import app
+from app import create_app
+
+app = create_app()
 
 # Load environment variables from .env file
 load_dotenv()
@@ -0,0 +1,125 @@
+"""Module for testing the pooled Daraja HTTP client."""
+
+import unittest
+from unittest.mock import patch, MagicMock
+import requests
+from app.daraja import DarajaClient, DEFAULT_TIMEOUT
+from tests.mock_daraja import MockDaraja
+
+
+def make_response(status_code, headers=None):
+    """Build a mock response with the given status code and headers."""
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    return response
+
+
+class TestDarajaClient(unittest.TestCase):
+    """Test case for the DarajaClient class."""
+
+    def setUp(self):
+        """Set up a client without retry delays."""
+        self.client = DarajaClient(
+            'https://daraja.test/',
+            timeouts={'stk_push': (1, 5)},
+            retries=2,
+            backoff=0
+        )
+
+    @patch('app.daraja.requests.Session.request')
+    def test_request_uses_endpoint_path_and_timeout(self, mock_request):
+        """Test that the endpoint name resolves to its method, URL and timeout."""
+        mock_request.return_value = make_response(200)
+        self.client.request('stk_push', json={'Amount': 1})
+        mock_request.assert_called_once_with(
+            'POST', 'https://daraja.test/mpesa/stkpush/v1/processrequest',
+            timeout=(1, 5), json={'Amount': 1}
+        )
+
+    @patch('app.daraja.requests.Session.request')
+    def test_request_default_timeout(self, mock_request):
+        """Test that endpoints without a configured timeout use the default."""
+        mock_request.return_value = make_response(200)
+        self.client.request('oauth')
+        self.assertEqual(mock_request.call_args.kwargs['timeout'], DEFAULT_TIMEOUT)
+
+    @patch('app.daraja.requests.Session.request')
+    def test_idempotent_call_is_retried(self, mock_request):
+        """Test that idempotent calls are retried on retryable statuses and errors."""
+        mock_request.side_effect = [
+            make_response(503), requests.ConnectionError(), make_response(200)
+        ]
+        response = self.client.request('stk_query', json={})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_request.call_count, 3)
+
+    @patch('app.daraja.requests.Session.request')
+    def test_idempotent_call_gives_up_after_retries(self, mock_request):
+        """Test that the last response is returned once retries are exhausted."""
+        mock_request.return_value = make_response(503)
+        response = self.client.request('oauth')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(mock_request.call_count, 3)
+
+    @patch('app.daraja.requests.Session.request')
+    def test_still_processing_query_is_not_retried(self, mock_request):
+        """Test that a 500 for a payment that is still being processed is returned at once."""
+        mock_request.return_value = make_response(500)
+        response = self.client.request('stk_query', json={})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(mock_request.call_count, 1)
+
+    @patch('app.daraja.time.sleep')
+    @patch('app.daraja.requests.Session.request')
+    def test_retry_after_is_honoured(self, mock_request, mock_sleep):
+        """Test that a 429 waits as long as its Retry-After header asks."""
+        mock_request.side_effect = [
+            make_response(429, {'Retry-After': '2'}), make_response(200)
+        ]
+        response = self.client.request('stk_query', json={})
+        self.assertEqual(response.status_code, 200)
+        mock_sleep.assert_called_once_with(2.0)
+
+    @patch('app.daraja.requests.Session.request')
+    def test_stk_push_is_not_retried(self, mock_request):
+        """Test that STK push requests are sent at most once."""
+        mock_request.side_effect = requests.Timeout()
+        with self.assertRaises(requests.Timeout):
+            self.client.request('stk_push', json={})
+        self.assertEqual(mock_request.call_count, 1)
+
+    def test_session_is_recreated_after_fork(self):
+        """Test that a new process gets its own session."""
+        session = self.client.session
+        self.assertIs(self.client.session, session)
+        with patch('app.daraja.os.getpid', return_value=-1):
+            self.assertIsNot(self.client.session, session)
+
+    def test_connections_are_kept_alive(self):
+        """Test that consecutive calls reuse one connection to the server."""
+        server = MockDaraja().start()
+        try:
+            client = DarajaClient(server.url)
+            for _ in range(5):
+                client.request('stk_query', json={'CheckoutRequestID': 'ws_CO_1'})
+            client.close()
+            self.assertEqual(server.calls['/mpesa/stkpushquery/v1/query'], 5)
+            self.assertEqual(server.connections, 1)
+        finally:
+            server.stop()
+
+    def test_mock_error_rate(self):
+        """Test that the mock Daraja server fails calls at its error rate."""
+        server = MockDaraja(error_rate=1.0).start()
+        try:
+            client = DarajaClient(server.url)
+            response = client.request('stk_push', json={})
+            client.close()
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.json()['errorCode'], '503.001.01')
+        finally:
+            server.stop()
+
+if __name__ == '__main__':
+    unittest.main()
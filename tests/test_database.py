@@ -0,0 +1,101 @@
+"""Module for testing the database engine configuration."""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import sqlalchemy as sa
+from app import create_app, db, services
+from app.database import engine_options
+from app.models import MpesaTransaction
+
+app = create_app()
+
+
+class TestEngineOptions(unittest.TestCase):
+    """Test case for the engine arguments of each kind of database."""
+
+    def options(self, uri, **settings):
+        """Engine options for ``uri`` with the app's settings and ``settings``."""
+        return engine_options(dict(app.config, SQLALCHEMY_DATABASE_URI=uri, **settings))
+
+    def test_memory_database_is_not_pooled(self):
+        """Test that an in-memory database only gets the options its static pool takes."""
+        self.assertEqual(self.options('sqlite:///:memory:'), {'pool_pre_ping': True})
+
+    def test_sqlite_file(self):
+        """Test that a SQLite file gets a sized pool and a busy timeout."""
+        options = self.options('sqlite:////tmp/payments.db', DB_POOL_SIZE=5,
+                               SQLITE_BUSY_TIMEOUT=2500)
+        self.assertEqual(options['pool_size'], 5)
+        self.assertEqual(options['max_overflow'], app.config['DB_MAX_OVERFLOW'])
+        self.assertEqual(options['pool_recycle'], app.config['DB_POOL_RECYCLE'])
+        self.assertEqual(options['connect_args'], {'timeout': 2.5})
+
+    def test_statement_timeouts(self):
+        """Test that PostgreSQL and MySQL connections set a statement timeout."""
+        postgres = self.options('postgresql://user@localhost/payments', DB_STATEMENT_TIMEOUT=500)
+        mysql = self.options('mysql://user@localhost/payments', DB_STATEMENT_TIMEOUT=500)
+        self.assertEqual(postgres['connect_args'], {'options': '-c statement_timeout=500'})
+        self.assertEqual(mysql['connect_args'],
+                         {'init_command': 'SET SESSION max_execution_time=500'})
+        self.assertNotIn(
+            'connect_args',
+            self.options('postgresql://user@localhost/payments', DB_STATEMENT_TIMEOUT=0)
+        )
+
+    def test_explicit_engine_options_win(self):
+        """Test that SQLALCHEMY_ENGINE_OPTIONS set by the caller are used as they are."""
+        custom = create_app({'SQLALCHEMY_ENGINE_OPTIONS': {'echo': False}})
+        self.assertEqual(custom.config['SQLALCHEMY_ENGINE_OPTIONS'], {'echo': False})
+
+
+class TestSqlitePragmas(unittest.TestCase):
+    """Test case for the pragmas of SQLite file databases."""
+
+    def setUp(self):
+        """Create an app on a temporary SQLite file."""
+        self.directory = tempfile.mkdtemp()
+        uri = f"sqlite:///{os.path.join(self.directory, 'payments.db')}"
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'SQLITE_BUSY_TIMEOUT': 1234})
+        with self.app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Drop the database file."""
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def pragma(self, name):
+        """Value of a pragma on a pooled connection."""
+        with self.app.app_context():
+            return db.session.execute(sa.text(f'PRAGMA {name}')).scalar()
+
+    def test_pragmas_are_set_on_connect(self):
+        """Test that connections use WAL, synchronous=NORMAL and the busy timeout."""
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        # 1 is NORMAL
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), 1234)
+
+    def test_concurrent_inserts(self):
+        """Test that transactions recorded from many threads at once are all written."""
+        def record(number):
+            with self.app.app_context():
+                services.record_transaction('John Doe', '254708374149', 1, {
+                    'CheckoutRequestID': f'ws_CO_{number}', 'ResponseCode': '0'
+                })
+
+        threads = [threading.Thread(target=record, args=(number,)) for number in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with self.app.app_context():
+            self.assertEqual(MpesaTransaction.query.count(), 20)
+
+if __name__ == '__main__':
+    unittest.main()
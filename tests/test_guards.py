@@ -0,0 +1,227 @@
+"""Module for testing the rate limits and circuit breakers of the Daraja endpoints."""
+
+import time
+import unittest
+from unittest.mock import patch
+import requests
+from app import create_app, db, models, services, stk_queue
+from app.async_services import AsyncEngine, initiate_stk_push
+from app.guards import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, EndpointGuard,
+    EndpointRateLimitedError
+)
+from app.ratelimit import RateLimiter
+from tests.mock_daraja import MockDaraja
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test case for the CircuitBreaker class."""
+
+    def setUp(self):
+        """Set up a breaker on a fake clock."""
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            'stk_push', window=4, min_calls=4, failure_threshold=0.5,
+            slow_call_seconds=1.0, reset_timeout=10, clock=self.clock
+        )
+
+    def test_opens_once_enough_calls_fail(self):
+        """Test that the circuit opens when the bad share of a full enough window is reached."""
+        for failed in (True, False, True):
+            self.breaker.admit()
+            self.breaker.record(failed, 0.1)
+        # Too few calls to judge the endpoint yet
+        self.assertEqual(self.breaker.state, CLOSED)
+
+        self.breaker.record(False, 2.0)
+        self.assertEqual(self.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError) as context:
+            self.breaker.admit()
+        self.assertEqual(context.exception.retry_after, 10)
+        self.assertEqual(self.breaker.snapshot()['slow_calls'], 1)
+
+    def test_stays_closed_while_most_calls_succeed(self):
+        """Test that occasional failures don't open the circuit."""
+        for number in range(20):
+            self.breaker.record(number % 4 == 0, 0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_half_open_probe_closes_or_reopens(self):
+        """Test that after the cool-down one probe decides whether the circuit closes."""
+        for _ in range(4):
+            self.breaker.record(True, 0.1)
+        self.clock.now += 10
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+
+        self.breaker.admit()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.admit()
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, OPEN)
+
+        self.clock.now += 10
+        self.breaker.admit()
+        self.breaker.record(False, 0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.snapshot()['calls'], 0)
+
+    def test_rate_limited_probe_is_given_back(self):
+        """Test that a probe turned away by the rate limit doesn't use up the half-open slot."""
+        guard = EndpointGuard(
+            'stk_push', RateLimiter(1, clock=self.clock), self.breaker, queue_timeout=0
+        )
+        for _ in range(4):
+            self.breaker.record(True, 0.1)
+        self.clock.now += 10
+        guard.limiter.acquire()
+
+        with self.assertRaises(EndpointRateLimitedError) as context:
+            guard.admit()
+        self.assertEqual(context.exception.retry_after, 1.0)
+        self.clock.now += 1
+        guard.admit()
+
+
+class TestGuardedDarajaCalls(unittest.TestCase):
+    """Test case for guarded Daraja calls against a fault-injecting mock Daraja."""
+
+    def setUp(self):
+        """Start the mock server and an app with a small, quick circuit breaker."""
+        self.server = MockDaraja().start()
+        self.app = create_app({
+            'MPESA_API_BASE_URL': self.server.url,
+            'MPESA_HTTP_RETRIES': 0,
+            'MPESA_CIRCUIT_BREAKER_WINDOW': 4,
+            'MPESA_CIRCUIT_BREAKER_MIN_CALLS': 4,
+            'MPESA_CIRCUIT_BREAKER_SLOW_CALL': 0.2,
+            'MPESA_CIRCUIT_BREAKER_RESET_TIMEOUT': 0.3,
+        })
+        self.app.config['TESTING'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        # Fetch the access token before the outage
+        services.generate_access_token()
+
+    def tearDown(self):
+        """Stop the mock server and drop the database."""
+        services.client.close()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.server.stop()
+
+    @property
+    def pushes(self):
+        """STK pushes that reached the mock Daraja."""
+        return self.server.calls['/mpesa/stkpush/v1/processrequest']
+
+    def breaker(self, endpoint):
+        """Circuit breaker of ``endpoint``."""
+        return services.endpoint_guards(self.app)[endpoint].breaker
+
+    def test_outage_fails_fast_then_recovers(self):
+        """Test that an outage opens the circuit, and a probe closes it once Daraja is back."""
+        self.server.fault = 'unavailable'
+        for _ in range(4):
+            self.assertEqual(
+                services.send_stk_push(254708374149, 1)['errorCode'], '503.001.01'
+            )
+
+        started = time.perf_counter()
+        response = self.client.post('/initiate_mpesa_stk_push', json={
+            'full_name': 'John Doe', 'phone_number': '254708374149', 'amount': 1
+        })
+        self.assertLess(time.perf_counter() - started, 0.2)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(self.pushes, 4)
+        state = self.client.get('/circuit_breakers').json
+        self.assertEqual(state['stk_push']['state'], 'open')
+        self.assertEqual(state['stk_push']['failed_calls'], 4)
+        self.assertEqual(state['stk_query']['state'], 'closed')
+
+        self.server.fault = None
+        time.sleep(0.3)
+        self.assertEqual(services.send_stk_push(254708374149, 1)['ResponseCode'], '0')
+        self.assertEqual(self.breaker('stk_push').state, CLOSED)
+
+    def test_dropped_connections_open_the_circuit(self):
+        """Test that connection failures count against the endpoint."""
+        self.server.fault = 'reset'
+        for _ in range(4):
+            with self.assertRaises(requests.ConnectionError):
+                services.request_transaction_status('ws_CO_1')
+        with self.assertRaises(CircuitOpenError):
+            services.request_transaction_status('ws_CO_1')
+        self.assertEqual(self.server.calls['/mpesa/stkpushquery/v1/query'], 4)
+
+    def test_slow_calls_open_the_circuit(self):
+        """Test that calls slower than the slow call threshold count against the endpoint."""
+        self.server.latency = 0.25
+        for _ in range(4):
+            services.send_stk_push(254708374149, 1)
+        self.assertEqual(self.breaker('stk_push').state, OPEN)
+        self.assertEqual(self.breaker('stk_push').snapshot()['slow_calls'], 4)
+
+    def test_async_calls_share_the_breaker(self):
+        """Test that the async engine fails fast on the same open circuit."""
+        for _ in range(4):
+            self.breaker('stk_push').record(True, 0.1)
+        engine = AsyncEngine(self.app, db_workers=1)
+        try:
+            with patch('app.async_services.engine', engine), \
+                    self.assertRaises(CircuitOpenError):
+                engine.run(initiate_stk_push('John Doe', 254708374149, 1))
+        finally:
+            engine.stop()
+        self.assertEqual(self.pushes, 0)
+
+    def test_queued_push_waits_out_an_open_circuit(self):
+        """Test that the queue worker puts a push turned away by the breaker back."""
+        push_request = stk_queue.enqueue('John Doe', 254708374149, 1)
+        for _ in range(4):
+            self.breaker('stk_push').record(True, 0.1)
+        worker = stk_queue.StkPushWorker()
+
+        self.assertEqual(worker.run_once(), 0)
+        self.assertEqual(db.session.get(models.StkPushRequest, push_request.id).status,
+                         models.QUEUED)
+
+        time.sleep(0.3)
+        self.assertEqual(worker.run_once(), 1)
+        self.assertEqual(worker.sent, 1)
+
+    def test_endpoint_rate_limit(self):
+        """Test that calls over an endpoint's rate limit are turned away with a 429."""
+        self.app.config['MPESA_RATE_LIMITS'] = {'stk_query': 1}
+        self.app.config['MPESA_RATE_LIMIT_TIMEOUT'] = 0
+        app = create_app(dict(self.app.config))
+        client = app.test_client()
+        with app.app_context():
+            db.create_all()
+
+        responses = [
+            client.post('/query_transaction_status', json={'checkout_request_id': f'ws_CO_{n}'})
+            for n in range(2)
+        ]
+
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(responses[1].status_code, 429)
+        self.assertEqual(responses[1].headers['Retry-After'], '1')
+        with app.app_context():
+            services.client.close()
+
+if __name__ == '__main__':
+    unittest.main()
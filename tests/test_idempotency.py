@@ -0,0 +1,130 @@
+"""Module for testing Idempotency-Key support on the STK push endpoint."""
+
+import threading
+import time
+import unittest
+from datetime import timedelta
+from unittest.mock import patch
+from app import create_app, db, routes
+from app.idempotency import fingerprint
+from app.models import IdempotencyKey, utcnow
+
+app = create_app()
+
+ACCEPTED = {
+    'MerchantRequestID': '29115-34620561-1',
+    'CheckoutRequestID': 'ws_CO_191220191020363925',
+    'ResponseCode': '0',
+    'ResponseDescription': 'Success. Request accepted for processing',
+    'CustomerMessage': 'Success. Request accepted for processing'
+}
+
+PAYMENT = {'full_name': 'John Doe', 'phone_number': '254708374149', 'amount': 10}
+
+
+class TestIdempotency(unittest.TestCase):
+    """Test case for idempotent STK push requests."""
+
+    def setUp(self):
+        """Set up a test client, an in-memory database and an empty cache."""
+        app.config['TESTING'] = True
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.app = app.test_client()
+        db.create_all()
+        routes.idempotency_store.cache.clear()
+
+    def tearDown(self):
+        """Drop the database."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def push(self, key, body=None):
+        """Post an STK push with an idempotency key."""
+        return self.app.post(
+            '/initiate_mpesa_stk_push', json=body or PAYMENT, headers={'Idempotency-Key': key}
+        )
+
+    @patch('app.services.initiate_stk_push', return_value=ACCEPTED)
+    def test_replay_returns_stored_response(self, mock_initiate):
+        """Test that a retried request gets the first response without another push."""
+        first = self.push('key-1')
+        second = self.push('key-1')
+
+        self.assertEqual(first.get_json(), ACCEPTED)
+        self.assertEqual(second.get_json(), ACCEPTED)
+        self.assertEqual(second.headers['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+        mock_initiate.assert_called_once()
+
+    @patch('app.services.initiate_stk_push', return_value=ACCEPTED)
+    def test_replay_is_served_from_the_database(self, mock_initiate):
+        """Test that a key stored by another process is replayed from the database."""
+        self.push('key-1')
+        routes.idempotency_store.cache.clear()
+        self.assertEqual(self.push('key-1').get_json(), ACCEPTED)
+        mock_initiate.assert_called_once()
+
+    @patch('app.services.initiate_stk_push', return_value=ACCEPTED)
+    def test_key_reused_with_a_different_body(self, mock_initiate):
+        """Test that a key can't be reused for another payment."""
+        self.push('key-1')
+        response = self.push('key-1', dict(PAYMENT, amount=20))
+        self.assertEqual(response.status_code, 422)
+        mock_initiate.assert_called_once()
+
+    @patch('app.services.initiate_stk_push')
+    def test_failed_push_is_not_stored(self, mock_initiate):
+        """Test that a rejected push can be retried with the same key."""
+        mock_initiate.side_effect = [{'ResponseCode': '1', 'ResponseDescription': 'Busy'}, ACCEPTED]
+        self.assertEqual(self.push('key-1').status_code, 500)
+        self.assertEqual(self.push('key-1').status_code, 200)
+        self.assertEqual(mock_initiate.call_count, 2)
+
+    @patch('app.services.initiate_stk_push', return_value=ACCEPTED)
+    def test_in_progress_key_is_a_conflict(self, mock_initiate):
+        """Test that a key still being processed elsewhere is rejected."""
+        db.session.add(IdempotencyKey(key='key-1', request_hash=fingerprint(PAYMENT)))
+        db.session.commit()
+        self.assertEqual(self.push('key-1').status_code, 409)
+        mock_initiate.assert_not_called()
+
+    @patch('app.services.initiate_stk_push', return_value=ACCEPTED)
+    def test_expired_key_is_reused(self, mock_initiate):
+        """Test that a stored response is no longer replayed after its time to live."""
+        db.session.add(IdempotencyKey(
+            key='key-1', request_hash=fingerprint(PAYMENT), status_code=200, response={},
+            created_at=utcnow() - timedelta(seconds=app.config['IDEMPOTENCY_TTL'] + 1)
+        ))
+        db.session.commit()
+        self.assertEqual(self.push('key-1').get_json(), ACCEPTED)
+        mock_initiate.assert_called_once()
+
+    @patch('app.services.initiate_stk_push')
+    def test_concurrent_requests_share_one_push(self, mock_initiate):
+        """Test that requests arriving together with one key send one push."""
+        def slow_push(*_args, **_options):
+            time.sleep(0.2)
+            return ACCEPTED
+        mock_initiate.side_effect = slow_push
+
+        statuses = []
+
+        def post():
+            with app.test_client() as client:
+                statuses.append(client.post(
+                    '/initiate_mpesa_stk_push', json=PAYMENT, headers={'Idempotency-Key': 'key-1'}
+                ).status_code)
+
+        threads = [threading.Thread(target=post) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses, [200] * 5)
+        mock_initiate.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""Module for testing the per-worker setup and teardown of the production server."""
+
+import unittest
+from unittest.mock import patch
+from app import async_services, clients, create_app, db, lifecycle, services
+
+app = create_app()
+
+
+class TestLifecycle(unittest.TestCase):
+    """Test case for worker initialization and shutdown."""
+
+    def setUp(self):
+        """Look up the database engine of the application."""
+        with app.app_context():
+            self.engine = db.engine
+
+    def test_init_worker_starts_fresh_pools(self):
+        """Test that a forked worker drops inherited connections and builds its own session."""
+        with app.app_context(), \
+                patch.object(services.client, '_create_session') as mock_create_session, \
+                patch.object(self.engine, 'dispose') as mock_dispose, \
+                patch('app.daraja.os.getpid', return_value=-1):
+            lifecycle.init_worker(app)
+        mock_dispose.assert_called_once_with(close=False)
+        mock_create_session.assert_called_once()
+        with app.app_context():
+            services.client.close()
+
+    def test_shutdown_worker_drains(self):
+        """Test that a stopping worker drains the engine and writes buffered callbacks."""
+        # pylint: disable=protected-access
+        with app.app_context():
+            client = services.client._get_current_object()
+            callback_buffer = services.callback_buffer._get_current_object()
+            engine = async_services.engine._get_current_object()
+        with patch.object(engine, 'stop') as mock_stop, \
+                patch.object(callback_buffer, 'close') as mock_buffer_close, \
+                patch.object(client, 'close') as mock_client_close, \
+                patch.object(self.engine, 'dispose') as mock_dispose:
+            lifecycle.shutdown_worker(app, timeout=7)
+        mock_stop.assert_called_once_with(7)
+        mock_buffer_close.assert_called_once()
+        mock_client_close.assert_called_once()
+        mock_dispose.assert_called_once_with()
+        engine.stop()
+        callback_buffer.close()
+        client.close()
+
+    def test_shutdown_worker_skips_unused_clients(self):
+        """Test that a worker that never called Daraja doesn't build clients to close them."""
+        fresh = create_app()
+        lifecycle.shutdown_worker(fresh, timeout=1)
+        self.assertIsNone(clients.of(fresh).peek('daraja_client'))
+        self.assertIsNone(clients.of(fresh).peek('async_engine'))
+
+if __name__ == '__main__':
+    unittest.main()
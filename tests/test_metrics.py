@@ -0,0 +1,159 @@
+"""Module for testing the metrics registry and the /metrics endpoint."""
+
+import unittest
+from unittest.mock import patch
+from app import create_app, db, metrics, routes, services
+from app.metrics import Counter, Gauge, Histogram, Registry
+from app.cache import TTLCache
+
+app = create_app()
+
+
+class TestMetrics(unittest.TestCase):
+    """Test case for counters, gauges and histograms."""
+
+    def setUp(self):
+        """Set up an empty registry."""
+        self.registry = Registry()
+
+    def test_counter_and_gauge(self):
+        """Test that counters add up per label set and gauges go both ways."""
+        counter = Counter('calls_total', 'Calls.', ('endpoint',), registry=self.registry)
+        counter.inc(endpoint='a')
+        counter.inc(2, endpoint='a')
+        counter.inc(endpoint='b')
+        gauge = Gauge('in_flight', 'In flight.', registry=self.registry)
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+
+        self.assertEqual(counter.value(endpoint='a'), 3)
+        self.assertEqual(gauge.value(), 1)
+        text = self.registry.render()
+        self.assertIn('# TYPE calls_total counter', text)
+        self.assertIn('calls_total{endpoint="a"} 3', text)
+        self.assertIn('calls_total{endpoint="b"} 1', text)
+        self.assertIn('in_flight 1', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that histogram buckets, count and sum are rendered cumulatively."""
+        histogram = Histogram('latency_seconds', 'Latency.', ('stage',), buckets=(0.1, 1.0),
+                              registry=self.registry)
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, stage='db')
+
+        text = self.registry.render()
+        self.assertIn('latency_seconds_bucket{stage="db",le="0.1"} 2', text)
+        self.assertIn('latency_seconds_bucket{stage="db",le="1.0"} 3', text)
+        self.assertIn('latency_seconds_bucket{stage="db",le="+Inf"} 4', text)
+        self.assertIn('latency_seconds_count{stage="db"} 4', text)
+        self.assertIn('latency_seconds_sum{stage="db"} 3.65', text)
+
+    def test_timer_as_decorator(self):
+        """Test that a timer observes every call of a decorated function."""
+        histogram = Histogram('work_seconds', 'Work.', ('operation',), registry=self.registry)
+
+        @histogram.time(operation='work')
+        def work():
+            return 'done'
+
+        self.assertEqual(work(), 'done')
+        self.assertEqual(work(), 'done')
+        self.assertEqual(histogram.count(operation='work'), 2)
+
+    def test_wrong_labels_are_rejected(self):
+        """Test that labels must match the label names of the metric."""
+        counter = Counter('calls_total', 'Calls.', ('endpoint',), registry=self.registry)
+        with self.assertRaises(ValueError):
+            counter.inc(status='200')
+        with self.assertRaises(ValueError):
+            counter.inc()
+
+    def test_label_values_are_escaped(self):
+        """Test that quotes and newlines in label values are escaped."""
+        counter = Counter('codes_total', 'Codes.', ('code',), registry=self.registry)
+        counter.inc(code='a"b\nc')
+        self.assertIn('codes_total{code="a\\"b\\nc"} 1', self.registry.render())
+
+    def test_disabled_registry_records_nothing(self):
+        """Test that updates are no-ops while the registry is disabled."""
+        counter = Counter('calls_total', 'Calls.', registry=self.registry)
+        histogram = Histogram('latency_seconds', 'Latency.', registry=self.registry)
+        self.registry.enabled = False
+        counter.inc()
+        histogram.observe(1.0)
+        self.assertEqual(counter.value(), 0)
+        self.assertEqual(histogram.count(), 0)
+
+    def test_cache_hits_and_misses(self):
+        """Test that registered caches report their hits and misses."""
+        cache = TTLCache(maxsize=2, ttl=10)
+        self.registry.register_cache('tokens', cache)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        text = self.registry.render()
+        self.assertIn('cache_hits_total{cache="tokens"} 1', text)
+        self.assertIn('cache_misses_total{cache="tokens"} 1', text)
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    """Test case for the instrumentation of the application."""
+
+    def setUp(self):
+        """Set up the test client and database."""
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Drop the database."""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    @patch('app.services.generate_access_token', return_value='token')
+    def test_stages_and_codes_are_recorded(self, _mock_token):
+        """Test that an STK push records route, Daraja and database timings and its code."""
+        endpoint = 'payments.initiate_mpesa_stk_push'
+        handled = metrics.HTTP_REQUEST_SECONDS.count(endpoint=endpoint, method='POST', status='200')
+        writes = metrics.DB_OPERATION_SECONDS.count(operation='record_transaction')
+        accepted = metrics.RESPONSE_CODES.value(endpoint='stk_push', code='0')
+
+        with app.app_context(), patch.object(services.client, 'request') as mock_request:
+            mock_request.return_value.status_code = 200
+            mock_request.return_value.json.return_value = {
+                'CheckoutRequestID': 'ws_CO_metrics', 'ResponseCode': '0'
+            }
+            response = self.app.post('/initiate_mpesa_stk_push', json={
+                'full_name': 'John Doe', 'phone_number': '254708374149', 'amount': 1
+            })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            metrics.HTTP_REQUEST_SECONDS.count(endpoint=endpoint, method='POST', status='200'),
+            handled + 1
+        )
+        self.assertEqual(
+            metrics.DB_OPERATION_SECONDS.count(operation='record_transaction'), writes + 1
+        )
+        self.assertEqual(metrics.RESPONSE_CODES.value(endpoint='stk_push', code='0'), accepted + 1)
+        self.assertEqual(metrics.HTTP_REQUESTS_IN_FLIGHT.value(), 0)
+
+    def test_metrics_endpoint(self):
+        """Test that /metrics serves the text exposition format."""
+        with app.app_context():
+            # Caches report from the moment they are created
+            services.token_manager.invalidate()
+            routes.idempotency_store.cache.clear()
+        response = self.app.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        text = response.get_data(as_text=True)
+        self.assertIn('# TYPE mpesa_daraja_request_seconds histogram', text)
+        self.assertIn('cache_hits_total{cache="access_token"}', text)
+        self.assertIn('cache_misses_total{cache="idempotency"}', text)
+
+if __name__ == '__main__':
+    unittest.main()
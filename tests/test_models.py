@@ -1,7 +1,8 @@
 """Module for testing MpesaTransaction class."""
 
 import unittest
-from app.models import MpesaTransaction
+from datetime import datetime
+from app.models import MpesaTransaction, parse_mpesa_time
 
 
 class TestMpesaTransaction(unittest.TestCase):
@@ -29,5 +30,12 @@ class TestMpesaTransaction(unittest.TestCase):
         )
         self.assertEqual(repr(self.transaction), expected_repr)
 
+    def test_parse_mpesa_time(self):
+        """Test that M-Pesa times are converted from East Africa Time to UTC."""
+        self.assertEqual(parse_mpesa_time(20191219102115), datetime(2019, 12, 19, 7, 21, 15))
+        self.assertEqual(parse_mpesa_time('20191219102115'), datetime(2019, 12, 19, 7, 21, 15))
+        self.assertIsNone(parse_mpesa_time(None))
+        self.assertIsNone(parse_mpesa_time('yesterday'))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,82 @@
+"""Module for testing the token bucket rate limiter."""
+
+import unittest
+from app.ratelimit import RateLimiter
+
+
+class FakeTime:
+    """Clock whose sleep advances it instantly."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = 0.0
+
+    def clock(self):
+        """Return the current time."""
+        return self.now
+
+    def sleep(self, seconds):
+        """Advance the clock."""
+        self.now += seconds
+        self.slept += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test case for the RateLimiter class."""
+
+    def setUp(self):
+        """Set up a limiter of 10 calls per second with a burst of 2."""
+        self.time = FakeTime()
+        self.limiter = RateLimiter(10, burst=2, clock=self.time.clock, sleep=self.time.sleep)
+
+    def test_burst_then_limit(self):
+        """Test that the burst is available at once and then exhausted."""
+        self.assertTrue(self.limiter.try_acquire())
+        self.assertTrue(self.limiter.try_acquire())
+        self.assertFalse(self.limiter.try_acquire())
+
+    def test_tokens_refill_over_time(self):
+        """Test that tokens come back at the configured rate."""
+        self.limiter.try_acquire(2)
+        self.time.now += 0.1
+        self.assertTrue(self.limiter.try_acquire())
+        self.assertFalse(self.limiter.try_acquire())
+
+    def test_acquire_waits_for_tokens(self):
+        """Test that acquire sleeps until enough tokens have accrued."""
+        for _ in range(12):
+            self.limiter.acquire()
+        self.assertAlmostEqual(self.time.slept, 1.0)
+
+    def test_acquire_survives_rounding_errors(self):
+        """Test that acquire returns when rounding leaves a token just short of whole."""
+        limiter = RateLimiter(10, burst=1, clock=self.time.clock, sleep=self.time.sleep)
+        for _ in range(100):
+            limiter.acquire()
+        self.assertAlmostEqual(self.time.slept, 9.9)
+
+    def test_acquire_gives_up_after_timeout(self):
+        """Test that acquire doesn't wait longer than its timeout."""
+        self.limiter.acquire(2)
+        self.assertFalse(self.limiter.acquire(timeout=0.05))
+        self.assertEqual(self.time.slept, 0)
+        self.assertTrue(self.limiter.acquire(timeout=0.1))
+        self.assertAlmostEqual(self.time.slept, 0.1)
+
+    def test_more_tokens_than_burst_are_rejected(self):
+        """Test that asking for more tokens than the bucket holds raises."""
+        with self.assertRaises(ValueError):
+            self.limiter.acquire(3)
+        with self.assertRaises(ValueError):
+            self.limiter.try_acquire(3)
+
+    def test_zero_rate_disables_limiting(self):
+        """Test that a rate of zero never limits."""
+        limiter = RateLimiter(0, clock=self.time.clock, sleep=self.time.sleep)
+        for _ in range(100):
+            limiter.acquire()
+        self.assertTrue(limiter.try_acquire())
+        self.assertEqual(self.time.slept, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+"""Module for testing the reconciliation poller."""
+
+import unittest
+from datetime import timedelta
+from unittest.mock import patch
+import requests
+from app import create_app, db
+from app.models import MpesaTransaction, utcnow
+from app.reconciler import Reconciler
+
+app = create_app()
+
+PROCESSING = {
+    'requestId': '29115-34620561-1',
+    'errorCode': '500.001.1001',
+    'errorMessage': 'The transaction is being processed'
+}
+
+
+def query_result(result_code, result_desc):
+    """Build a status query response carrying a result."""
+    return {
+        'ResponseCode': '0',
+        'ResponseDescription': 'The service request has been accepted successsfully',
+        'ResultCode': result_code,
+        'ResultDesc': result_desc
+    }
+
+
+class TestReconciler(unittest.TestCase):
+    """Test case for the Reconciler class."""
+
+    def setUp(self):
+        """Set up pending transactions of different ages."""
+        app.config['TESTING'] = True
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        now = utcnow()
+        for checkout_request_id, age in (('ws_CO_old', 600), ('ws_CO_stale', 120),
+                                         ('ws_CO_new', 5)):
+            db.session.add(MpesaTransaction(
+                full_name='John Doe',
+                phone_number='254708374149',
+                amount=1,
+                checkout_request_id=checkout_request_id,
+                status='Pending',
+                created_at=now - timedelta(seconds=age)
+            ))
+        db.session.add(MpesaTransaction(
+            full_name='John Doe',
+            phone_number='254708374149',
+            amount=1,
+            checkout_request_id='ws_CO_done',
+            status='Completed',
+            created_at=now - timedelta(seconds=900)
+        ))
+        db.session.commit()
+        self.now = 0.0
+        self.reconciler = Reconciler(
+            min_age=60, batch_size=10, concurrency=2, rate=0, backoff=30,
+            max_backoff=100, clock=lambda: self.now
+        )
+
+    def tearDown(self):
+        """Drop the database."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def status(self, checkout_request_id):
+        """Load the status of a transaction fresh from the database."""
+        db.session.expire_all()
+        return MpesaTransaction.query.filter_by(
+            checkout_request_id=checkout_request_id
+        ).one().status
+
+    def test_due_transactions_are_stale_and_pending(self):
+        """Test that only pending transactions past the minimum age are due, oldest first."""
+        self.assertEqual(self.reconciler.due_transactions(), ['ws_CO_old', 'ws_CO_stale'])
+
+    def test_backlog(self):
+        """Test the backlog size and lag."""
+        backlog = self.reconciler.backlog()
+        self.assertEqual(backlog['backlog'], 2)
+        self.assertGreaterEqual(backlog['lag_seconds'], 600)
+
+    @patch('app.services.request_transaction_status')
+    def test_run_once_writes_results(self, mock_status):
+        """Test that final results are written and pending ones are left alone."""
+        mock_status.side_effect = lambda checkout_request_id, retries: {
+            'ws_CO_old': query_result('1032', 'Request cancelled by user'),
+            'ws_CO_stale': PROCESSING
+        }[checkout_request_id]
+
+        self.assertEqual(self.reconciler.run_once(), 1)
+
+        self.assertEqual(self.status('ws_CO_old'), 'Cancelled')
+        self.assertEqual(self.status('ws_CO_stale'), 'Pending')
+        self.assertEqual(self.reconciler.checked, 2)
+        self.assertEqual(self.reconciler.backlog()['backlog'], 1)
+        mock_status.assert_any_call('ws_CO_stale', retries=0)
+
+    @patch('app.services.request_transaction_status')
+    def test_still_pending_transactions_back_off(self, mock_status):
+        """Test that a transaction that is still processing is retried with backoff."""
+        mock_status.return_value = PROCESSING
+        self.reconciler.run_once()
+        self.assertEqual(self.reconciler.due_transactions(), [])
+
+        self.now += 30
+        self.assertEqual(self.reconciler.due_transactions(), ['ws_CO_old', 'ws_CO_stale'])
+        self.reconciler.run_once()
+
+        # The second delay is doubled
+        self.now += 30
+        self.assertEqual(self.reconciler.due_transactions(), [])
+        self.now += 30
+        self.assertEqual(len(self.reconciler.due_transactions()), 2)
+
+    @patch('app.services.request_transaction_status')
+    def test_failed_queries_are_counted_and_retried(self, mock_status):
+        """Test that a failing status query leaves the transaction pending."""
+        mock_status.side_effect = requests.ConnectionError('Daraja unavailable')
+        with self.assertLogs('app.reconciler', 'WARNING'):
+            self.assertEqual(self.reconciler.run_once(), 0)
+        self.assertEqual(self.reconciler.errors, 2)
+        self.assertEqual(self.status('ws_CO_old'), 'Pending')
+
+    def test_backlog_route(self):
+        """Test the reconciliation backlog endpoint."""
+        response = app.test_client().get('/reconciliation_backlog')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['backlog'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
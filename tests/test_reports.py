@@ -0,0 +1,105 @@
+"""Module for testing the transaction listing and export endpoints."""
+
+import csv
+import io
+import json
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.models import MpesaTransaction
+
+app = create_app()
+
+START = datetime(2024, 6, 1)
+
+
+class TestReports(unittest.TestCase):
+    """Test case for transaction listings and exports."""
+
+    def setUp(self):
+        """Set up a test client and 25 transactions, two of which share a creation time."""
+        app.config['TESTING'] = True
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.app = app.test_client()
+        db.create_all()
+        for number in range(25):
+            db.session.add(MpesaTransaction(
+                full_name='John Doe',
+                phone_number='254708374149' if number % 2 else '254711111111',
+                amount=number + 1,
+                checkout_request_id=f'ws_CO_{number}',
+                status='Completed' if number % 5 else 'Pending',
+                created_at=START + timedelta(hours=min(number, 23))
+            ))
+        db.session.commit()
+
+    def tearDown(self):
+        """Drop the database."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def pages(self, **params):
+        """Follow the cursors of a listing and return the amounts of every page."""
+        pages = []
+        cursor = None
+        while True:
+            query = dict(params, cursor=cursor) if cursor else params
+            body = self.app.get('/transactions', query_string=query).get_json()
+            pages.append([transaction['amount'] for transaction in body['transactions']])
+            cursor = body['next_cursor']
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_every_transaction_once(self):
+        """Test that keyset pages are newest first without gaps or repeats."""
+        pages = self.pages(limit=10)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        amounts = [amount for page in pages for amount in page]
+        # Transactions 24 and 25 share a creation time and are ordered by id
+        self.assertEqual(amounts, list(range(25, 0, -1)))
+
+    def test_filters(self):
+        """Test filtering by status, phone number and creation time."""
+        pages = self.pages(status='Pending', limit=2)
+        self.assertEqual(pages, [[21, 16], [11, 6], [1]])
+        pages = self.pages(phone_number='254711111111', start='2024-06-01T10:00:00',
+                           end='2024-06-01T15:00:00')
+        self.assertEqual(pages, [[15, 13, 11]])
+
+    def test_invalid_arguments(self):
+        """Test that bad filters, limits and cursors are rejected."""
+        for query in ({'start': 'yesterday'}, {'limit': 0}, {'limit': 'all'},
+                      {'cursor': 'not-a-cursor'}):
+            response = self.app.get('/transactions', query_string=query)
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_export_csv(self):
+        """Test that the CSV export streams every matching transaction, oldest first."""
+        response = self.app.get('/transactions/export', query_string={'status': 'Completed'})
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertTrue(response.is_streamed)
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(rows[0]['amount'], '2')
+        self.assertEqual(rows[0]['created_at'], '2024-06-01T01:00:00')
+
+    def test_export_ndjson(self):
+        """Test that the NDJSON export has one transaction per line."""
+        app.config['EXPORT_CHUNK_SIZE'] = 3
+        try:
+            response = self.app.get('/transactions/export', query_string={'format': 'ndjson'})
+        finally:
+            app.config['EXPORT_CHUNK_SIZE'] = 1000
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 25)
+        self.assertEqual(json.loads(lines[-1])['checkout_request_id'], 'ws_CO_24')
+
+    def test_export_unknown_format(self):
+        """Test that an unknown export format is rejected."""
+        response = self.app.get('/transactions/export', query_string={'format': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,7 +6,9 @@ specifically focusing on the M-Pesa STK push initiation and transaction status q
 """
 import unittest
 from unittest.mock import patch
-from app import app, db
+from app import create_app, db
+
+app = create_app()
 
 class FlaskTestCase(unittest.TestCase):
     """Test case for Payment service routes."""
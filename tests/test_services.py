@@ -1,13 +1,17 @@
 import unittest
 from unittest.mock import patch, MagicMock
 from datetime import datetime
-from app import app, db
+from app import create_app, db
+from app import services
+from app.models import MpesaTransaction
 from app.services import (
     generate_access_token,
     initiate_stk_push,
     query_transaction_status
 )
 
+app = create_app()
+
 class TestMpesaServices(unittest.TestCase):
 
     def setUp(self):
@@ -15,6 +19,8 @@ class TestMpesaServices(unittest.TestCase):
             # Set up an in-memory SQLite database for testing
             app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
             db.create_all()
+            services.token_manager.invalidate()
+            services.status_cache.cache.clear()
 
     def tearDown(self):
         with app.app_context():
@@ -22,15 +28,20 @@ class TestMpesaServices(unittest.TestCase):
             db.session.remove()
             db.drop_all()
 
-    @patch('app.services.requests.get')
+    @patch('app.daraja.requests.Session.request')
     def test_generate_access_token(self, mock_get):
         expected_token = "c9SQxWWhmdVRlyh0zh8gZDTkubVF"
         mock_get.return_value.json.return_value = {"access_token": expected_token}
-        token = generate_access_token()
-        self.assertEqual(token, expected_token)
+        with app.app_context():
+            token = generate_access_token()
+            self.assertEqual(token, expected_token)
+            # A second call is served from the cache
+            self.assertEqual(generate_access_token(), expected_token)
+        mock_get.assert_called_once()
 
-    @patch('app.services.requests.post')
-    def test_initiate_stk_push(self, mock_post):
+    @patch('app.services.generate_access_token', return_value='token')
+    @patch('app.daraja.requests.Session.request')
+    def test_initiate_stk_push(self, mock_post, _mock_token):
         mock_response = MagicMock()
         mock_response.json.return_value = {
             "MerchantRequestID": "29115-34620561-1",
@@ -50,8 +61,9 @@ class TestMpesaServices(unittest.TestCase):
             self.assertEqual(response['ResponseCode'], "0")
             self.assertEqual(response['ResponseDescription'], "Success. Request accepted for processing")
 
-    @patch('app.services.requests.post')
-    def test_query_transaction_status(self, mock_post):
+    @patch('app.services.generate_access_token', return_value='token')
+    @patch('app.daraja.requests.Session.request')
+    def test_query_transaction_status(self, mock_post, _mock_token):
         mock_response = MagicMock()
         mock_response.json.return_value = {
             "ResponseCode": "0",
@@ -72,5 +84,33 @@ class TestMpesaServices(unittest.TestCase):
             self.assertEqual(response['ResultCode'], "0")
             self.assertEqual(response['ResultDesc'], "The service request is processed successfully.")
 
+    @patch('app.services.generate_access_token', return_value='token')
+    @patch('app.daraja.requests.Session.request')
+    def test_query_transaction_status_completes_transaction(self, mock_post, _mock_token):
+        checkout_request_id = "ws_CO_13012021093521236557"
+        mock_post.return_value.json.return_value = {
+            "ResponseCode": "0",
+            "CheckoutRequestID": checkout_request_id,
+            "ResultCode": "0",
+            "ResultDesc": "The service request is processed successfully."
+        }
+
+        with app.app_context():
+            db.session.add(MpesaTransaction(
+                full_name="John Doe",
+                phone_number="254700000000",
+                amount=100,
+                checkout_request_id=checkout_request_id,
+                status="Pending"
+            ))
+            db.session.commit()
+
+            query_transaction_status(checkout_request_id)
+
+            transaction = MpesaTransaction.query.filter_by(
+                checkout_request_id=checkout_request_id
+            ).one()
+            self.assertEqual(transaction.status, "Completed")
+
 if __name__ == '__main__':
     unittest.main()
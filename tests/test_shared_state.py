@@ -0,0 +1,247 @@
+"""Module for testing the state shared by worker processes."""
+
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from app import create_app, services, shared_state
+from app.shared_state import MemoryStore, RedisStore, SQLiteStore
+from app.status_cache import StatusCache
+from app.tokens import TokenManager
+from tests.fake_redis import FakeRedis
+
+COMPLETED = {'ResponseCode': '0', 'ResultCode': '0', 'ResultDesc': 'Processed'}
+
+
+class FakeClock:
+    """Manually advanced clock."""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StoreTests:  # pylint: disable=no-member
+    """Tests every store passes; mixed into a TestCase per store."""
+
+    def make_store(self, clock):
+        """Return a new store on ``clock``, sharing its entries with the previous ones."""
+        raise NotImplementedError
+
+    def setUp(self):  # pylint: disable=invalid-name
+        """Set up two stores on one set of entries, like two processes."""
+        self.clock = FakeClock()
+        self.store = self.make_store(self.clock)
+        self.other = self.make_store(self.clock)
+
+    def test_values_are_shared_until_they_expire(self):
+        """Test that a value set by one store is read by another until its ttl passes."""
+        self.store.set('key', {'token': 'abc', 'expires_at': 1.5}, 10)
+        self.assertEqual(self.other.get('key'), {'token': 'abc', 'expires_at': 1.5})
+        self.clock.now += 11
+        self.assertIsNone(self.other.get('key'))
+        self.assertIsNone(self.store.get('missing'))
+
+    def test_delete(self):
+        """Test deleting one key and every key with a prefix."""
+        for key in ('status:1', 'status:2', 'token'):
+            self.store.set(key, key, 10)
+        self.other.delete('status:1')
+        self.assertIsNone(self.store.get('status:1'))
+        self.other.delete_prefix('status:')
+        self.assertIsNone(self.store.get('status:2'))
+        self.assertEqual(self.store.get('token'), 'token')
+
+    def test_lock_is_exclusive_until_released_or_expired(self):
+        """Test that a lock held by one store keeps the other out until it is free."""
+        with self.store.lock('refresh', ttl=30) as acquired:
+            self.assertTrue(acquired)
+            with self.other.lock('refresh', timeout=0) as other_acquired:
+                self.assertFalse(other_acquired)
+        with self.other.lock('refresh', timeout=0) as acquired:
+            self.assertTrue(acquired)
+
+        # A lock left behind by a dead process expires
+        # pylint: disable-next=protected-access
+        self.store._add(shared_state.LOCK_PREFIX + 'refresh', '"dead"', 30)
+        with self.other.lock('refresh', timeout=0) as acquired:
+            self.assertFalse(acquired)
+        self.clock.now += 31
+        with self.other.lock('refresh', timeout=0) as acquired:
+            self.assertTrue(acquired)
+
+    def test_token_managers_share_one_fetch(self):
+        """Test that a token fetched by one manager serves the other until it nears expiry."""
+        fetches = []
+
+        def fetch():
+            fetches.append(1)
+            return f'token-{len(fetches)}', 3600
+
+        managers = [
+            TokenManager(fetch, expiry_margin=60, refresh_ahead=0, clock=self.clock,
+                         store=store, key='access_token:test', wall_clock=self.clock)
+            for store in (self.store, self.other)
+        ]
+        self.assertEqual(managers[0].get_token(), 'token-1')
+        self.assertEqual(managers[1].get_token(), 'token-1')
+        self.assertEqual(len(fetches), 1)
+        self.assertEqual(managers[1].stats()['shared'], 1)
+
+        # Both drop it within the expiry margin; only one of them fetches again
+        self.clock.now += 3600 - 30
+        self.assertEqual(managers[1].get_token(), 'token-2')
+        self.assertEqual(managers[0].get_token(), 'token-2')
+        self.assertEqual(len(fetches), 2)
+
+    def test_rejected_token_is_dropped_from_the_store(self):
+        """Test that invalidating a token drops it from the store, but not a newer one."""
+        manager = TokenManager(lambda: ('token-1', 3600), store=self.store,
+                               key='access_token:test', wall_clock=self.clock)
+        manager.get_token()
+        manager.invalidate('token-0')
+        self.assertIsNotNone(self.store.get('access_token:test'))
+        manager.invalidate('token-1')
+        self.assertIsNone(self.store.get('access_token:test'))
+
+    def test_status_caches_share_responses(self):
+        """Test that a status response remembered by one cache is served by the other."""
+        caches = [StatusCache(pending_ttl=2, final_ttl=60, store=store)
+                  for store in (self.store, self.other)]
+        caches[0].remember('ws_CO_1', COMPLETED)
+        self.assertEqual(caches[1].lookup('ws_CO_1', self.fail), COMPLETED)
+        self.assertEqual((caches[1].cache.hits, caches[1].cache.misses), (1, 0))
+        caches[1].invalidate('ws_CO_1')
+        self.assertIsNone(caches[0].get('ws_CO_1'))
+
+    def test_concurrent_status_loads_share_one_query(self):
+        """Test that caches on different stores load an uncached response once between them."""
+        loads = []
+
+        def load():
+            loads.append(1)
+            time.sleep(0.2)
+            return COMPLETED
+
+        caches = [StatusCache(store=store) for store in (self.store, self.other)]
+        threads = [threading.Thread(target=cache.lookup, args=('ws_CO_1', load))
+                   for cache in caches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(loads), 1)
+
+
+class TestMemoryStore(StoreTests, unittest.TestCase):
+    """Test case for the MemoryStore class."""
+
+    def make_store(self, clock):
+        """Return the one store of this process."""
+        if not hasattr(self, 'memory'):
+            self.memory = MemoryStore(clock=clock)  # pylint: disable=attribute-defined-outside-init
+        return self.memory
+
+
+class TestSQLiteStore(StoreTests, unittest.TestCase):
+    """Test case for the SQLiteStore class."""
+
+    def setUp(self):
+        """Set up two stores on one temporary file."""
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        super().setUp()
+
+    def tearDown(self):
+        """Remove the file."""
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def make_store(self, clock):
+        """Return a store on the temporary file."""
+        return SQLiteStore(self.path, clock=clock)
+
+    def test_one_fetch_across_processes(self):
+        """Test that worker processes started together fetch the token once between them."""
+        context = multiprocessing.get_context('fork')
+        fetches = context.Value('i', 0)
+        store = SQLiteStore(self.path)
+
+        def worker(queue):
+            def fetch():
+                with fetches.get_lock():
+                    fetches.value += 1
+                time.sleep(0.2)
+                return f'token-{os.getpid()}', 3600
+
+            queue.put(TokenManager(fetch, store=store, key='access_token:test').get_token())
+
+        queue = context.Queue()
+        processes = [context.Process(target=worker, args=(queue,)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        tokens = {queue.get(timeout=10) for _ in processes}
+        for process in processes:
+            process.join(timeout=10)
+        self.assertEqual(fetches.value, 1)
+        self.assertEqual(len(tokens), 1)
+
+
+class TestRedisStore(StoreTests, unittest.TestCase):
+    """Test case for the RedisStore class, on a stand-in Redis client."""
+
+    def make_store(self, clock):
+        """Return a store on a new client of the one stand-in server."""
+        if not hasattr(self, 'server'):
+            self.server = FakeRedis.Server(clock)  # pylint: disable=attribute-defined-outside-init
+        return RedisStore(FakeRedis(self.server))
+
+    def test_keys_are_prefixed(self):
+        """Test that the store only touches keys under its prefix."""
+        self.store.set('token', 'abc', 10)
+        self.assertEqual(list(self.server.entries), ['mpesa:token'])
+
+
+class TestSharedStateConfig(unittest.TestCase):
+    """Test case for choosing a store with SHARED_STATE_URL."""
+
+    def test_from_url(self):
+        """Test the store of each kind of URL."""
+        self.assertIsNone(shared_state.from_url(''))
+        self.assertIsInstance(shared_state.from_url('memory://'), MemoryStore)
+        with tempfile.TemporaryDirectory() as directory:
+            store = shared_state.from_url(f'sqlite:///{directory}/state.db')
+            self.assertIsInstance(store, SQLiteStore)
+        with self.assertRaises(ValueError):
+            shared_state.from_url('memcached://localhost')
+
+    def test_redis_needs_its_package(self):
+        """Test that a Redis URL without the redis package fails with a clear error."""
+        with patch('importlib.import_module', side_effect=ImportError):
+            with self.assertRaisesRegex(RuntimeError, 'redis package'):
+                shared_state.from_url('redis://localhost:6379/0')
+
+    @patch('app.services.fetch_access_token', return_value=('token-1', 3599))
+    def test_apps_share_the_token(self, fetch_access_token):
+        """Test that two apps on one store, like two workers, fetch the token once."""
+        with tempfile.TemporaryDirectory() as directory:
+            config = {
+                'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+                'SHARED_STATE_URL': f'sqlite:///{directory}/state.db',
+            }
+            for app in (create_app(config), create_app(config)):
+                with app.app_context():
+                    self.assertEqual(services.token_manager.get_token(), 'token-1')
+                    services.status_cache.remember('ws_CO_1', COMPLETED)
+                    self.assertEqual(services.status_cache.get('ws_CO_1'), COMPLETED)
+        fetch_access_token.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Module for testing the signing of STK push and status query requests."""
+
+import base64
+import time
+import unittest
+from app.signing import Signer
+
+SHORTCODE = '174379'
+PASSKEY = 'passkey'
+
+
+class FakeClock:
+    """Manually set wall clock."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestSigner(unittest.TestCase):
+    """Test case for the Signer class."""
+
+    def setUp(self):
+        """Set up a signer on a fake clock."""
+        self.clock = FakeClock(1718000000.25)
+        self.signer = Signer(SHORTCODE, PASSKEY, 'https://example.com/cb', clock=self.clock)
+
+    def test_password_matches_its_timestamp(self):
+        """Test that the password is the base64 of shortcode, passkey and the timestamp."""
+        password, timestamp = self.signer.credentials()
+        self.assertEqual(
+            timestamp, time.strftime('%Y%m%d%H%M%S', time.localtime(1718000000))
+        )
+        self.assertEqual(
+            base64.b64decode(password).decode(), f"{SHORTCODE}{PASSKEY}{timestamp}"
+        )
+
+    def test_credentials_are_cached_per_second(self):
+        """Test that the pair is computed once per second and changes with the second."""
+        first = self.signer.credentials()
+        self.clock.now += 0.7
+        self.assertIs(self.signer.credentials(), first)
+        self.clock.now += 0.1
+        second = self.signer.credentials()
+        self.assertNotEqual(second[1], first[1])
+        self.assertEqual(
+            base64.b64decode(second[0]).decode(), f"{SHORTCODE}{PASSKEY}{second[1]}"
+        )
+
+    def test_stk_push_payload(self):
+        """Test that STK push bodies fill the prebuilt one without changing it."""
+        password, timestamp = self.signer.credentials()
+        payload = self.signer.stk_push_payload(254708374149, 10)
+        self.assertEqual(payload, {
+            'BusinessShortCode': 174379,
+            'Password': password,
+            'Timestamp': timestamp,
+            'TransactionType': 'CustomerPayBillOnline',
+            'Amount': 10,
+            'PartyA': 254708374149,
+            'PartyB': 174379,
+            'PhoneNumber': 254708374149,
+            'CallBackURL': 'https://example.com/cb',
+            'AccountReference': 'CompanyXLTD',
+            'TransactionDesc': 'Payment of X'
+        })
+        payload['Amount'] = 99
+        self.assertEqual(self.signer.stk_push_payload(254708374149, 5)['Amount'], 5)
+
+    def test_stk_query_payload(self):
+        """Test that status query bodies carry the checkout request and credentials."""
+        password, timestamp = self.signer.credentials()
+        self.assertEqual(self.signer.stk_query_payload('ws_CO_1'), {
+            'BusinessShortCode': 174379,
+            'Password': password,
+            'Timestamp': timestamp,
+            'CheckoutRequestID': 'ws_CO_1'
+        })
+
+if __name__ == '__main__':
+    unittest.main()
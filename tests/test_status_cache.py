@@ -0,0 +1,171 @@
+"""Module for testing the transaction status cache."""
+
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+from app import create_app, db, services
+from app.async_services import AsyncEngine, query_transaction_status
+from app.cache import TTLCache
+from app.models import MpesaTransaction
+from app.status_cache import StatusCache
+from tests.mock_daraja import MockDaraja
+
+PROCESSING = {'errorCode': '500.001.1001', 'errorMessage': 'The transaction is being processed'}
+COMPLETED = {'ResponseCode': '0', 'ResultCode': '0', 'ResultDesc': 'Processed'}
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestStatusCache(unittest.TestCase):
+    """Test case for the StatusCache class."""
+
+    def setUp(self):
+        """Set up a cache on a fake clock."""
+        self.clock = FakeClock()
+        self.cache = StatusCache(pending_ttl=2, final_ttl=60)
+        self.cache.cache = TTLCache(ttl=60, clock=self.clock)
+
+    def test_ttl_depends_on_the_response(self):
+        """Test that final responses outlive pending ones and errors aren't kept."""
+        self.cache.remember('ws_CO_final', COMPLETED)
+        self.cache.remember('ws_CO_pending', PROCESSING)
+        self.cache.remember('ws_CO_error', {'errorCode': '503.001.01'})
+        self.assertIsNone(self.cache.get('ws_CO_error'))
+
+        self.clock.now += 3
+        self.assertEqual(self.cache.get('ws_CO_final'), COMPLETED)
+        self.assertIsNone(self.cache.get('ws_CO_pending'))
+
+    def test_lookup_loads_once(self):
+        """Test that a lookup is served from the cache once loaded."""
+        calls = []
+
+        def load():
+            calls.append(1)
+            return PROCESSING
+
+        self.assertEqual(self.cache.lookup('ws_CO_1', load), PROCESSING)
+        self.assertEqual(self.cache.lookup('ws_CO_1', load), PROCESSING)
+        self.assertEqual(len(calls), 1)
+
+    def test_concurrent_lookups_share_one_load(self):
+        """Test that lookups arriving while a load runs wait for it."""
+        release = threading.Event()
+        calls = []
+
+        def load():
+            calls.append(1)
+            release.wait(2)
+            return COMPLETED
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.lookup('ws_CO_1', load)))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [COMPLETED] * 10)
+        self.assertEqual(len(calls), 1)
+
+
+class TestCachedStatusQueries(unittest.TestCase):
+    """Test case for status queries against a mock Daraja that takes time to process."""
+
+    def setUp(self):
+        """Start the mock server and an app pointed at it."""
+        self.server = MockDaraja(processing_time=60).start()
+        self.app = create_app({'MPESA_API_BASE_URL': self.server.url})
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        response = services.initiate_stk_push('John Doe', 254708374149, 1)
+        self.checkout_request_id = response['CheckoutRequestID']
+
+    def tearDown(self):
+        """Stop the mock server and drop the database."""
+        services.client.close()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.server.stop()
+
+    @property
+    def upstream_queries(self):
+        """Status queries that reached the mock Daraja."""
+        return self.server.calls['/mpesa/stkpushquery/v1/query']
+
+    def test_polling_a_pending_payment(self):
+        """Test that repeated polls within the pending TTL make one upstream call."""
+        for _ in range(5):
+            response = services.query_transaction_status(self.checkout_request_id)
+            self.assertEqual(response['errorCode'], '500.001.1001')
+        self.assertEqual(self.upstream_queries, 1)
+
+        services.status_cache.invalidate(self.checkout_request_id)
+        services.query_transaction_status(self.checkout_request_id)
+        self.assertEqual(self.upstream_queries, 2)
+
+    def test_final_status_is_served_from_the_database(self):
+        """Test that a transaction with a stored result is answered without Daraja."""
+        transaction = MpesaTransaction.query.filter_by(
+            checkout_request_id=self.checkout_request_id
+        ).one()
+        transaction.status = 'Cancelled'
+        transaction.result_desc = 'Request cancelled by user'
+        db.session.commit()
+
+        response = services.query_transaction_status(self.checkout_request_id)
+
+        self.assertEqual(response['ResultCode'], '1032')
+        self.assertEqual(response['ResultDesc'], 'Request cancelled by user')
+        self.assertEqual(response['CheckoutRequestID'], self.checkout_request_id)
+        self.assertEqual(self.upstream_queries, 0)
+
+    def test_concurrent_polls_share_one_upstream_call(self):
+        """Test that simultaneous queries for one checkout request make one call."""
+        self.server.latency = 0.2
+
+        def poll():
+            with self.app.app_context():
+                services.query_transaction_status(self.checkout_request_id)
+
+        threads = [threading.Thread(target=poll) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.upstream_queries, 1)
+
+    def test_async_polls_share_one_upstream_call(self):
+        """Test that simultaneous async queries for one checkout request make one call."""
+        self.server.latency = 0.2
+        engine = AsyncEngine(self.app, db_workers=1)
+
+        async def poll_many():
+            return await asyncio.gather(*(
+                query_transaction_status(self.checkout_request_id) for _ in range(8)
+            ))
+
+        try:
+            with patch('app.async_services.engine', engine):
+                responses = engine.run(poll_many())
+        finally:
+            engine.stop()
+        self.assertEqual(len(responses), 8)
+        self.assertEqual(self.upstream_queries, 1)
+
+if __name__ == '__main__':
+    unittest.main()
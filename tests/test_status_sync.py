@@ -0,0 +1,144 @@
+"""Module for testing the persistence of status query results and bulk status syncs."""
+
+import unittest
+from unittest.mock import patch
+import requests
+from app import create_app, db, services
+from app.bulk import BulkStatusSync
+from app.models import MpesaTransaction
+from app.ratelimit import RateLimiter
+
+app = create_app()
+
+PROCESSING = {'errorCode': '500.001.1001', 'errorMessage': 'The transaction is being processed'}
+
+
+def query_result(result_code, result_desc):
+    """Build a status query response carrying a result."""
+    return {'ResponseCode': '0', 'ResultCode': result_code, 'ResultDesc': result_desc}
+
+
+class TestStatusSync(unittest.TestCase):
+    """Test case for recording status query results."""
+
+    def setUp(self):
+        """Set up a test client and pending transactions."""
+        app.config['TESTING'] = True
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.app = app.test_client()
+        db.create_all()
+        services.status_cache.cache.clear()
+        for checkout_request_id, status in (('ws_CO_1', 'Pending'), ('ws_CO_2', 'Pending'),
+                                            ('ws_CO_3', 'Pending'), ('ws_CO_done', 'Completed')):
+            db.session.add(MpesaTransaction(
+                full_name='John Doe', phone_number='254708374149', amount=1,
+                checkout_request_id=checkout_request_id, status=status
+            ))
+        db.session.commit()
+
+    def tearDown(self):
+        """Drop the database."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def stored(self, checkout_request_id):
+        """Status, result code and description of a transaction, fresh from the database."""
+        db.session.expire_all()
+        transaction = MpesaTransaction.query.filter_by(
+            checkout_request_id=checkout_request_id
+        ).one()
+        return transaction.status, transaction.result_code, transaction.result_desc
+
+    @patch('app.services.request_transaction_status')
+    def test_every_result_is_persisted(self, mock_status):
+        """Test that each kind of result stores its status, code and description."""
+        cases = {
+            'ws_CO_1': ('1', 'The balance is insufficient for the transaction.',
+                        'Insufficient Funds'),
+            'ws_CO_2': ('1032', 'Request cancelled by user', 'Cancelled'),
+            'ws_CO_3': ('2001', 'The initiator information is invalid.', 'Failed'),
+        }
+        for checkout_request_id, (result_code, result_desc, status) in cases.items():
+            mock_status.return_value = query_result(result_code, result_desc)
+            services.query_transaction_status(checkout_request_id)
+            self.assertEqual(
+                self.stored(checkout_request_id), (status, result_code, result_desc)
+            )
+
+    @patch('app.services.request_transaction_status', return_value=PROCESSING)
+    def test_pending_response_changes_nothing(self, _mock_status):
+        """Test that a payment still being processed stays pending."""
+        self.assertIsNone(services.record_query_result('ws_CO_1', PROCESSING))
+        self.assertEqual(self.stored('ws_CO_1'), ('Pending', None, None))
+
+    @patch('app.services.request_transaction_status')
+    def test_stored_failure_is_answered_from_the_database(self, mock_status):
+        """Test that a failure with its stored ResultCode isn't queried again."""
+        mock_status.return_value = query_result('2001', 'The initiator information is invalid.')
+        services.query_transaction_status('ws_CO_1')
+        services.status_cache.cache.clear()
+
+        response = services.query_transaction_status('ws_CO_1')
+
+        self.assertEqual(mock_status.call_count, 1)
+        self.assertEqual(response['ResultCode'], '2001')
+        self.assertEqual(response['ResultDesc'], 'The initiator information is invalid.')
+
+    @patch('app.bulk.limiter', RateLimiter(0))
+    @patch('app.services.request_transaction_status')
+    def test_bulk_sync_writes_results_in_one_transaction(self, mock_status):
+        """Test that pending transactions are queried and their results written together."""
+        def status(checkout_request_id, **_options):
+            if checkout_request_id == 'ws_CO_2':
+                return PROCESSING
+            if checkout_request_id == 'ws_CO_3':
+                raise requests.ConnectionError('Daraja unavailable')
+            return query_result('0', 'The service request is processed successfully.')
+        mock_status.side_effect = status
+
+        with patch('app.services.apply_status_updates',
+                   wraps=services.apply_status_updates) as mock_apply, \
+                self.assertLogs('app.bulk', 'WARNING'):
+            results = BulkStatusSync(concurrency=4).run(
+                ['ws_CO_1', 'ws_CO_2', 'ws_CO_3', 'ws_CO_done', 'ws_CO_unknown', 'ws_CO_1']
+            )
+
+        self.assertEqual(
+            [(result['checkout_request_id'], result['status'], result['updated'])
+             for result in results],
+            [('ws_CO_1', 'Completed', True), ('ws_CO_2', 'Pending', False),
+             ('ws_CO_3', 'error', False), ('ws_CO_done', 'Completed', False),
+             ('ws_CO_unknown', 'unknown', False)]
+        )
+        mock_apply.assert_called_once()
+        self.assertEqual(
+            sorted(call.args[0] for call in mock_status.call_args_list),
+            ['ws_CO_1', 'ws_CO_2', 'ws_CO_3']
+        )
+        self.assertEqual(self.stored('ws_CO_1')[:2], ('Completed', '0'))
+        self.assertEqual(self.stored('ws_CO_2')[0], 'Pending')
+        # The synced result is served to status queries without another call
+        self.assertEqual(services.query_transaction_status('ws_CO_1')['ResultCode'], '0')
+        self.assertEqual(mock_status.call_count, 3)
+
+    @patch('app.bulk.limiter', RateLimiter(0))
+    @patch('app.services.request_transaction_status')
+    def test_sync_endpoint(self, mock_status):
+        """Test the bulk status sync endpoint and its validation."""
+        mock_status.return_value = query_result('1037', 'DS timeout user cannot be reached')
+        for body in ({}, {'checkout_request_ids': []}, {'checkout_request_ids': [1]}, []):
+            response = self.app.post('/sync_transaction_statuses', json=body)
+            self.assertEqual(response.status_code, 400)
+
+        response = self.app.post(
+            '/sync_transaction_statuses', json={'checkout_request_ids': ['ws_CO_1', 'ws_CO_2']}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['updated'], 2)
+        self.assertEqual(self.stored('ws_CO_2')[0], 'Timeout')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+"""Module for testing the durable STK push queue."""
+
+import threading
+import unittest
+from unittest.mock import patch
+import requests
+from app import create_app, db, services
+from app.models import StkPushRequest
+from app.stk_queue import StkPushWorker, enqueue, queue_depth, start_workers
+
+app = create_app()
+
+ACCEPTED = {
+    'MerchantRequestID': '29115-34620561-1',
+    'CheckoutRequestID': 'ws_CO_191220191020363925',
+    'ResponseCode': '0',
+    'ResponseDescription': 'Success. Request accepted for processing',
+    'CustomerMessage': 'Success. Request accepted for processing'
+}
+
+
+class TestStkQueue(unittest.TestCase):
+    """Test case for the STK push queue and its workers."""
+
+    def setUp(self):
+        """Set up a test client, an in-memory database and a worker."""
+        app.config['TESTING'] = True
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.app = app.test_client()
+        db.create_all()
+        self.worker = StkPushWorker(batch_size=2, poll_interval=0.01)
+
+    def tearDown(self):
+        """Drop the database."""
+        app.config['STK_PUSH_MODE'] = 'sync'
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def request_status(self, request_id):
+        """Load a queued request fresh from the database."""
+        db.session.expire_all()
+        return db.session.get(StkPushRequest, request_id).status
+
+    @patch('app.services.initiate_stk_push')
+    def test_accepted_mode_queues_the_push(self, mock_initiate):
+        """Test that accepted mode answers 202 without calling Daraja."""
+        app.config['STK_PUSH_MODE'] = 'accepted'
+        response = self.app.post('/initiate_mpesa_stk_push', json={
+            'full_name': 'John Doe',
+            'phone_number': '254708374149',
+            'amount': 10
+        })
+
+        self.assertEqual(response.status_code, 202)
+        body = response.get_json()
+        self.assertEqual(body['status'], 'Queued')
+        self.assertTrue(
+            response.headers['Location'].endswith(f"/stk_push_requests/{body['request_id']}")
+        )
+        mock_initiate.assert_not_called()
+
+    @patch('app.services.initiate_stk_push')
+    def test_prefer_header_queues_the_push(self, mock_initiate):
+        """Test that a client can ask for accepted mode per request."""
+        response = self.app.post('/initiate_mpesa_stk_push', json={
+            'full_name': 'John Doe',
+            'phone_number': '254708374149',
+            'amount': 10
+        }, headers={'Prefer': 'respond-async'})
+        self.assertEqual(response.status_code, 202)
+        mock_initiate.assert_not_called()
+
+    @patch('app.services.initiate_stk_push', return_value=ACCEPTED)
+    def test_worker_sends_queued_pushes(self, mock_initiate):
+        """Test that the worker sends queued pushes in order and records the outcome."""
+        ids = [enqueue('John Doe', 254708374149, amount).id for amount in (1, 2, 3)]
+
+        self.assertEqual(self.worker.run_once(), 2)
+        self.assertEqual(self.worker.run_once(), 1)
+        self.assertEqual(self.worker.run_once(), 0)
+
+        mock_initiate.assert_called_with(
+            'John Doe', 254708374149, 3, tenant=services.tenant_registry.default
+        )
+        self.assertEqual(self.worker.sent, 3)
+        response = self.app.get(f'/stk_push_requests/{ids[0]}')
+        body = response.get_json()
+        self.assertEqual(body['status'], 'Sent')
+        self.assertEqual(body['checkout_request_id'], ACCEPTED['CheckoutRequestID'])
+        self.assertEqual(body['response'], ACCEPTED)
+
+    @patch('app.services.initiate_stk_push')
+    def test_failures_are_recorded(self, mock_initiate):
+        """Test that rejected and failed pushes are marked failed with a reason."""
+        mock_initiate.side_effect = [
+            {'ResponseCode': '1', 'ResponseDescription': 'Invalid amount'},
+            requests.ConnectionError('Daraja unavailable')
+        ]
+        rejected = enqueue('John Doe', 254708374149, 1).id
+        unreachable = enqueue('John Doe', 254708374149, 2).id
+
+        with self.assertLogs('app.stk_queue', 'WARNING'):
+            self.worker.run_once()
+
+        self.assertEqual(self.worker.failed, 2)
+        self.assertEqual(db.session.get(StkPushRequest, rejected).error, 'Invalid amount')
+        self.assertEqual(db.session.get(StkPushRequest, unreachable).error, 'Daraja unavailable')
+
+    def test_claimed_requests_are_not_claimed_again(self):
+        """Test that a request is handed to one worker only."""
+        enqueue('John Doe', 254708374149, 1)
+        claimed = self.worker.claim()
+        self.assertEqual([r.status for r in claimed], ['Processing'])
+        self.assertEqual(StkPushWorker().claim(), [])
+
+    def test_queue_depth(self):
+        """Test the queue depth endpoint."""
+        enqueue('John Doe', 254708374149, 1)
+        enqueue('John Doe', 254708374149, 2)
+        self.worker.batch_size = 1
+        self.worker.claim()
+
+        self.assertEqual(queue_depth()['queued'], 1)
+        body = self.app.get('/stk_push_queue').get_json()
+        self.assertEqual((body['queued'], body['processing']), (1, 1))
+
+    def test_unknown_request(self):
+        """Test that looking up an unknown request is a 404."""
+        self.assertEqual(self.app.get('/stk_push_requests/42').status_code, 404)
+
+    @patch('app.services.initiate_stk_push', return_value=ACCEPTED)
+    def test_thread_workers_drain_the_queue(self, _mock_initiate):
+        """Test that background worker threads drain the queue."""
+        request_id = enqueue('John Doe', 254708374149, 1).id
+        stop = threading.Event()
+        workers = start_workers(app, 1, stop=stop)
+        for _ in range(200):
+            if self.request_status(request_id) == 'Sent':
+                break
+            stop.wait(0.01)
+        stop.set()
+        workers[0].join(2)
+        self.assertFalse(workers[0].is_alive())
+        self.assertEqual(self.request_status(request_id), 'Sent')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+"""Module for testing the daily transaction summary."""
+
+import unittest
+from datetime import date, datetime, timedelta
+from app import create_app, db, models, services, summary
+from app.models import MpesaTransaction, TransactionSummary
+
+START = datetime(2024, 6, 1, 12)
+
+
+def accepted(checkout_request_id):
+    """STK push response accepting a push."""
+    return {'ResponseCode': '0', 'CheckoutRequestID': checkout_request_id}
+
+
+def result(checkout_request_id, status):
+    """Status update of a transaction."""
+    return {'checkout_request_id': checkout_request_id, 'status': status, 'result_code': '0'}
+
+
+class TestSummary(unittest.TestCase):
+    """Test case for keeping, rebuilding and serving the summary."""
+
+    def setUp(self):
+        """Create an app and its database."""
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+        self.app.config['TESTING'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+
+    def tearDown(self):
+        """Drop the database."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @staticmethod
+    def stored():
+        """The summary rows with a count, by ``(day, status, shortcode)``."""
+        return {
+            (row.day, row.status, row.shortcode): (row.count, row.amount)
+            for row in TransactionSummary.query.all() if row.count
+        }
+
+    def seed(self):
+        """Store transactions on three days without touching the summary."""
+        for number in range(9):
+            db.session.add(MpesaTransaction(
+                full_name='John Doe', phone_number='254708374149', amount=10 * (number + 1),
+                checkout_request_id=f'ws_CO_{number}', shortcode='600100' if number % 2 else None,
+                status='Completed' if number % 3 else 'Pending',
+                created_at=START + timedelta(days=number % 3)
+            ))
+        db.session.commit()
+
+    def test_kept_up_to_date_by_writes(self):
+        """Test that inserts and status changes update the summary as a rebuild would."""
+        services.record_transaction('John Doe', 254708374149, 100, accepted('ws_CO_1'), '600100')
+        services.record_transactions([
+            services.transaction_row('Jane Doe', 254711111111, 250, accepted('ws_CO_2'), None),
+            services.transaction_row('Jane Doe', 254711111111, 50, accepted('ws_CO_3'), None),
+        ])
+        services.apply_status_updates([
+            result('ws_CO_1', 'Completed'),
+            # Replayed and conflicting updates of a final transaction change nothing
+            result('ws_CO_1', 'Cancelled'),
+            result('ws_CO_2', 'Cancelled'),
+            result('ws_CO_9', 'Completed'),
+        ])
+        services.apply_status_updates([result('ws_CO_1', 'Timeout')])
+
+        today = models.utcnow().date()
+        self.assertEqual(self.stored(), {
+            (today, 'Completed', '600100'): (1, 100),
+            (today, 'Cancelled', ''): (1, 250),
+            (today, 'Pending', ''): (1, 50),
+        })
+        kept = self.stored()
+        summary.rebuild()
+        self.assertEqual(self.stored(), kept)
+
+    def test_write_behind_batches(self):
+        """Test that transactions inserted by the write-behind buffer are summarized."""
+        self.app.config['TRANSACTION_WRITE_BEHIND'] = True
+        services.record_transaction('John Doe', 254708374149, 100, accepted('ws_CO_1'))
+        self.assertEqual(self.stored(), {})
+        services.transaction_buffer.flush()
+        self.assertEqual(sum(count for count, _ in self.stored().values()), 1)
+
+    def test_disabled(self):
+        """Test that the summary is left alone when disabled."""
+        self.app.config['TRANSACTION_SUMMARY_ENABLED'] = False
+        services.record_transaction('John Doe', 254708374149, 100, accepted('ws_CO_1'))
+        services.apply_status_updates([result('ws_CO_1', 'Completed')])
+        self.assertEqual(self.stored(), {})
+        self.assertEqual(MpesaTransaction.query.one().status, 'Completed')
+
+    def test_rebuild(self):
+        """Test that a rebuild recomputes every day, or only the days asked for."""
+        self.seed()
+        self.assertEqual(summary.rebuild(), 6)
+        day = START.date()
+        self.assertEqual(self.stored()[(day, 'Pending', '')], (2, 10 + 70))
+        self.assertEqual(
+            self.stored()[(day + timedelta(days=1), 'Completed', '600100')], (2, 20 + 80)
+        )
+
+        TransactionSummary.query.delete()
+        db.session.commit()
+        summary.rebuild(day + timedelta(days=1), day + timedelta(days=2))
+        self.assertEqual({key[0] for key in self.stored()}, {day + timedelta(days=1)})
+
+    def test_rebuild_command(self):
+        """Test the ``flask summary rebuild`` command."""
+        self.seed()
+        runner = self.app.test_cli_runner()
+        output = runner.invoke(args=['summary', 'rebuild', '--start', '2024-06-02']).output
+        self.assertEqual(output.strip(), 'Wrote 4 summary rows.')
+        self.assertNotEqual(runner.invoke(args=['summary', 'rebuild', '--end', 'x']).exit_code, 0)
+
+    def test_summary_endpoint(self):
+        """Test that the endpoint serves the days and totals asked for."""
+        self.seed()
+        summary.rebuild()
+        body = self.client.get('/transactions/summary', query_string={
+            'start': '2024-06-02', 'status': 'Completed'
+        }).get_json()
+        self.assertEqual(
+            [row['day'] for row in body['days']], ['2024-06-02'] * 2 + ['2024-06-03'] * 2
+        )
+        self.assertEqual(body['days'][0], {
+            'day': '2024-06-02', 'status': 'Completed', 'shortcode': None,
+            'count': 1, 'amount': 50,
+        })
+        self.assertEqual(body['totals'], {'Completed': {'count': 6, 'amount': 330}})
+
+        everything = self.client.get('/transactions/summary').get_json()['totals']
+        self.assertEqual(sum(total['count'] for total in everything.values()), 9)
+        self.assertEqual(everything['Pending'], {'count': 3, 'amount': 120})
+
+        response = self.client.get('/transactions/summary', query_string={'end': 'June'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['error'], 'End must be an ISO 8601 date.')
+
+    def test_day_ranges_match_transactions(self):
+        """Test that a day range of the summary matches the transactions created in it."""
+        self.seed()
+        summary.rebuild()
+        start, end = date(2024, 6, 1), date(2024, 6, 3)
+        totals = summary.aggregate(start, end)['totals']
+        transactions = MpesaTransaction.query.filter(
+            MpesaTransaction.created_at >= datetime(2024, 6, 1),
+            MpesaTransaction.created_at < datetime(2024, 6, 3)
+        ).all()
+        self.assertEqual(
+            sum(total['amount'] for total in totals.values()),
+            sum(transaction.amount for transaction in transactions)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
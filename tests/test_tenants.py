@@ -0,0 +1,172 @@
+"""Module for testing multi-tenant support."""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from app import create_app, db, services
+from app.models import MpesaTransaction
+from app.tenants import (
+    Tenant, TenantBusyError, TenantRegistry, UnknownTenantError, load_tenants
+)
+from tests.mock_daraja import MockDaraja
+
+TENANTS = [
+    {'name': 'shop', 'shortcode': '600100', 'passkey': 'shop-passkey',
+     'consumer_key': 'shop-key', 'consumer_secret': 'shop-secret'},
+    {'name': 'noisy', 'shortcode': '600200', 'passkey': 'noisy-passkey',
+     'consumer_key': 'noisy-key', 'consumer_secret': 'noisy-secret',
+     'concurrency': 1, 'queue_timeout': 0.05},
+]
+
+
+class TestTenantSettings(unittest.TestCase):
+    """Test case for reading and looking up tenants."""
+
+    def test_load_from_json_or_file(self):
+        """Test that MPESA_TENANTS may be a JSON array or the path of a JSON file."""
+        self.assertEqual(load_tenants(''), [])
+        self.assertEqual(load_tenants(json.dumps(TENANTS)), TENANTS)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'tenants.json')
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(TENANTS, file)
+            self.assertEqual(load_tenants(path), TENANTS)
+
+    def test_invalid_settings_fail_at_startup(self):
+        """Test that an app with bad tenant settings isn't created."""
+        for tenants in ('{}', [{'name': 'shop'}], [dict(TENANTS[0], colour='red')],
+                        [TENANTS[0], dict(TENANTS[1], shortcode='600100')]):
+            with self.assertRaises(ValueError):
+                create_app({'MPESA_TENANTS': tenants})
+
+    def test_lookup_by_name_or_shortcode(self):
+        """Test that tenants are found by name or shortcode, and None is the default."""
+        app = create_app({'MPESA_TENANTS': TENANTS})
+        registry = TenantRegistry.from_config(app.config)
+
+        self.assertEqual(len(registry), 3)
+        self.assertIs(registry.get('shop'), registry.get('600100'))
+        self.assertEqual(registry.get().shortcode, str(app.config['MPESA_SHORTCODE']))
+        self.assertIs(registry.for_shortcode(None), registry.default)
+        with self.assertRaises(UnknownTenantError):
+            registry.get('unknown')
+        with self.assertRaises(UnknownTenantError):
+            registry.for_shortcode('999999')
+
+
+class TestTenantLimits(unittest.TestCase):
+    """Test case for the limits on a tenant's Daraja calls."""
+
+    def test_concurrency_budget(self):
+        """Test that calls beyond the budget wait, then are turned away."""
+        tenant = Tenant('shop', '600100', 'passkey', 'key', 'secret',
+                        concurrency=1, queue_timeout=0.01)
+        with tenant.budget():
+            with self.assertRaises(TenantBusyError):
+                tenant.acquire()
+        with tenant.budget():
+            pass
+
+    def test_rate_limit(self):
+        """Test that calls beyond the rate limit are turned away with a retry delay."""
+        tenant = Tenant('shop', '600100', 'passkey', 'key', 'secret', rate=2, queue_timeout=0)
+        tenant.acquire()
+        tenant.acquire()
+        with self.assertRaises(TenantBusyError) as context:
+            tenant.acquire()
+        self.assertEqual(context.exception.retry_after, 0.5)
+
+
+class TestTenantRouting(unittest.TestCase):
+    """Test case for routing requests to tenants against a mock Daraja."""
+
+    def setUp(self):
+        """Start the mock server and an app serving the test tenants."""
+        self.server = MockDaraja(latency=0.3).start()
+        # A database file, as requests of different tenants record transactions concurrently
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app({
+            'MPESA_API_BASE_URL': self.server.url,
+            'MPESA_TENANTS': TENANTS,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory, 'payments.db')}",
+        })
+        self.app.config['TESTING'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+
+    def tearDown(self):
+        """Stop the mock server and drop the database."""
+        for tenant in services.tenant_registry:
+            tenant.client.close()
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.app_context.pop()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def push(self, tenant=None):
+        """Post an STK push for ``tenant``."""
+        body = {'full_name': 'John Doe', 'phone_number': '254708374149', 'amount': 1}
+        if tenant:
+            body['tenant'] = tenant
+        return self.app.test_client().post('/initiate_mpesa_stk_push', json=body)
+
+    def test_requests_use_their_tenants_credentials(self):
+        """Test that each tenant's calls carry its shortcode and its own access token."""
+        default_shortcode = str(self.app.config['MPESA_SHORTCODE'])
+        checkout_request_id = self.push('shop').json['CheckoutRequestID']
+        self.assertEqual(self.push().status_code, 200)
+
+        self.assertEqual(self.server.shortcodes, {'600100': 1, default_shortcode: 1})
+        self.assertEqual(self.server.calls['/oauth/v1/generate'], 2)
+        self.assertIsNot(services.get_tenant('shop').client, services.client._get_current_object())
+        self.assertEqual(
+            {row.shortcode for row in MpesaTransaction.query.all()},
+            {'600100', default_shortcode}
+        )
+
+        # The status query goes out for the tenant the transaction was made for
+        self.client.post(
+            '/query_transaction_status', json={'checkout_request_id': checkout_request_id}
+        )
+        self.assertEqual(self.server.shortcodes['600100'], 2)
+
+    def test_unknown_tenant_is_rejected(self):
+        """Test that a request for an unknown tenant is a bad request."""
+        response = self.push('unknown')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json['error'], "Unknown tenant 'unknown'.")
+        self.assertEqual(sum(self.server.calls.values()), 0)
+
+    def test_busy_tenant_does_not_hold_up_the_others(self):
+        """Test that calls over a tenant's budget are turned away while others go through."""
+        responses = {}
+
+        def push(name, tenant):
+            with self.app.app_context():
+                responses[name] = self.push(tenant)
+
+        threads = [
+            threading.Thread(target=push, args=(f'noisy-{number}', 'noisy'))
+            for number in range(3)
+        ] + [threading.Thread(target=push, args=('shop', 'shop'))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        noisy = [responses[f'noisy-{number}'] for number in range(3)]
+        self.assertEqual(sorted(response.status_code for response in noisy), [200, 429, 429])
+        for response in noisy:
+            if response.status_code == 429:
+                self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(responses['shop'].status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
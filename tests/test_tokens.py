@@ -0,0 +1,164 @@
+"""Module for testing the access token manager."""
+
+import threading
+import time
+import unittest
+from app import create_app, services
+from app.tokens import TokenManager
+from tests.mock_daraja import MockDaraja
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenManager(unittest.TestCase):
+    """Test case for the TokenManager class."""
+
+    def setUp(self):
+        """Set up a token manager with a counting fetcher and a fake clock."""
+        self.clock = FakeClock()
+        self.fetches = 0
+        self.manager = TokenManager(
+            self.fetch, expiry_margin=60, refresh_ahead=300, clock=self.clock
+        )
+
+    def fetch(self):
+        """Return a new token valid for an hour."""
+        self.fetches += 1
+        return f"token-{self.fetches}", 3600
+
+    def test_token_is_cached(self):
+        """Test that repeated calls are served from the cache."""
+        self.assertEqual(self.manager.get_token(), 'token-1')
+        self.assertEqual(self.manager.get_token(), 'token-1')
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual(self.manager.stats(), {
+            'hits': 1, 'misses': 1, 'refreshes': 1, 'failures': 0, 'shared': 0
+        })
+
+    def test_token_is_not_served_within_expiry_margin(self):
+        """Test that a token about to expire is replaced synchronously."""
+        self.manager.refresh_ahead = 0
+        self.manager.get_token()
+        self.clock.now += 3600 - 30
+        self.assertEqual(self.manager.get_token(), 'token-2')
+        self.assertEqual(self.manager.misses, 2)
+
+    def test_background_refresh_before_expiry(self):
+        """Test that a token in the refresh-ahead window is refreshed in the background."""
+        self.manager.get_token()
+        self.clock.now += 3600 - 200
+        # The current token is still served while the refresh runs
+        self.assertEqual(self.manager.get_token(), 'token-1')
+        deadline = time.monotonic() + 2
+        while self.manager.refreshes < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.manager.get_token(), 'token-2')
+        self.assertEqual(self.manager.misses, 1)
+
+    def test_concurrent_misses_share_one_fetch(self):
+        """Test that concurrent callers coalesce into a single fetch."""
+        release = threading.Event()
+
+        def slow_fetch():
+            release.wait(2)
+            return self.fetch()
+
+        manager = TokenManager(slow_fetch)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(manager.get_token()))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual(results, ['token-1'] * 10)
+        self.assertEqual(manager.refreshes, 1)
+
+    def test_fetch_error_is_raised_and_not_cached(self):
+        """Test that a failed fetch raises and the next call retries."""
+        calls = []
+
+        def flaky_fetch():
+            calls.append(1)
+            if len(calls) == 1:
+                raise ConnectionError('OAuth endpoint unavailable')
+            return 'token', 3600
+
+        manager = TokenManager(flaky_fetch)
+        with self.assertRaises(ConnectionError):
+            manager.get_token()
+        self.assertEqual(manager.get_token(), 'token')
+        self.assertEqual(manager.failures, 1)
+
+    def test_invalidate(self):
+        """Test that invalidating forces a new fetch."""
+        self.manager.get_token()
+        self.manager.invalidate()
+        self.assertEqual(self.manager.get_token(), 'token-2')
+
+    def test_invalidate_stale_token_keeps_new_one(self):
+        """Test that invalidating a token that was already replaced is a no-op."""
+        self.manager.get_token()
+        self.manager.invalidate('token-1')
+        self.manager.get_token()
+        self.manager.invalidate('token-1')
+        self.assertEqual(self.manager.get_token(), 'token-2')
+        self.assertEqual(self.fetches, 2)
+
+
+class TestTokenManagerWithStubServer(unittest.TestCase):
+    """Test the service token cache against a local OAuth endpoint."""
+
+    def setUp(self):
+        """Start the stub server and an app pointed at it."""
+        self.server = MockDaraja().start()
+        self.app_context = create_app({'MPESA_API_BASE_URL': self.server.url}).app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        """Stop the stub server and the app's Daraja client."""
+        services.client.close()
+        self.app_context.pop()
+        self.server.stop()
+
+    def test_generate_access_token_uses_cache(self):
+        """Test that only the first call reaches the OAuth endpoint."""
+        first = services.generate_access_token()
+        second = services.generate_access_token()
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.calls['/oauth/v1/generate'], 1)
+
+    def test_fetch_access_token_reads_expiry(self):
+        """Test that the token lifetime is taken from the response."""
+        self.server.token_ttl = 120
+        token, expires_in = services.fetch_access_token()
+        self.assertTrue(token.startswith('mock-token-'))
+        self.assertEqual(expires_in, 120)
+
+    def test_revoked_token_is_replaced(self):
+        """Test that a call rejected for its token is retried once with a new token."""
+        services.generate_access_token()
+        self.server.revoke_tokens()
+
+        response = services.request_transaction_status('ws_CO_13012021093521236557')
+
+        self.assertEqual(response['ResultCode'], '0')
+        self.assertEqual(self.server.calls['/oauth/v1/generate'], 2)
+        self.assertEqual(self.server.calls['/mpesa/stkpushquery/v1/query'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
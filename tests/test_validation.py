@@ -0,0 +1,160 @@
+"""Module for testing the validation of request bodies and the JSON providers."""
+
+import unittest
+from unittest.mock import patch
+from app import create_app, db
+from app.serialization import OrjsonProvider
+from app.validation import ValidationError, compile_schemas
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CONFIG = {'STK_PUSH_MIN_AMOUNT': 1, 'STK_PUSH_MAX_AMOUNT': 250000, 'BULK_MAX_ITEMS': 3}
+
+
+class TestSchemas(unittest.TestCase):
+    """Test case for the compiled request schemas."""
+
+    def setUp(self):
+        """Compile the schemas."""
+        self.schemas = compile_schemas(CONFIG)
+
+    def push(self, phone_number='254708374149', amount=1, full_name='John Doe'):
+        """Validate an STK push body."""
+        return self.schemas['stk_push'].validate({
+            'full_name': full_name, 'phone_number': phone_number, 'amount': amount
+        })
+
+    def assert_invalid(self, message, **fields):
+        """Assert that an STK push body with ``fields`` is rejected with ``message``."""
+        with self.assertRaises(ValidationError) as context:
+            self.push(**fields)
+        self.assertEqual(str(context.exception), message)
+
+    def test_phone_numbers_are_normalized(self):
+        """Test that local, national and international numbers become 2547/2541 integers."""
+        for phone_number in ('254708374149', 254708374149, '0708374149', '708374149',
+                             '+254708374149', '0708 374 149', '254-708-374-149'):
+            self.assertEqual(self.push(phone_number=phone_number)[1], 254708374149)
+        self.assertEqual(self.push(phone_number='0110123456')[1], 254110123456)
+
+    def test_invalid_phone_numbers(self):
+        """Test that numbers that aren't Kenyan mobile numbers are rejected."""
+        for phone_number in ('invalid_phone', -254708374149, '25470837414', '2547083741490',
+                             '254208374149', '0208374149', True, 708374149.0, ['0708374149']):
+            self.assert_invalid('Invalid phone number.', phone_number=phone_number)
+
+    def test_amount_bounds(self):
+        """Test that amounts must be whole numbers within the configured bounds."""
+        self.assertEqual(self.push(amount='10')[2], 10)
+        self.assertEqual(self.push(amount=250000.0)[2], 250000)
+        for amount in ('invalid_amount', 1.5, True, '-5'):
+            self.assert_invalid('Invalid amount.', amount=amount)
+        for amount in (-5, 250001):
+            self.assert_invalid('Amount must be between 1 and 250000.', amount=amount)
+
+    def test_full_name_length(self):
+        """Test that names are stripped and must fit their column."""
+        self.assertEqual(self.push(full_name='  John Doe ')[0], 'John Doe')
+        self.assert_invalid('Full name must be at most 50 characters.', full_name='J' * 51)
+        self.assert_invalid('Invalid full name.', full_name=42)
+
+    def test_missing_fields(self):
+        """Test that bodies lacking a field, or not objects, are rejected."""
+        for body in (None, [], 'John', {'full_name': 'John Doe', 'phone_number': '0708374149'},
+                     {'full_name': '', 'phone_number': '0708374149', 'amount': 1}):
+            with self.assertRaises(ValidationError) as context:
+                self.schemas['stk_push'].validate(body)
+            self.assertEqual(
+                str(context.exception), 'Full name, phone number, and amount are required.'
+            )
+
+    def test_checkout_request_ids(self):
+        """Test the status query and status sync schemas."""
+        self.assertEqual(
+            self.schemas['status_query'].validate({'checkout_request_id': ' ws_CO_1 '}),
+            ('ws_CO_1',)
+        )
+        with self.assertRaises(ValidationError):
+            self.schemas['status_query'].validate({'checkout_request_id': 7})
+        with self.assertRaises(ValidationError) as context:
+            self.schemas['status_sync'].validate({'checkout_request_ids': ['a', 'b', 'c', 'd']})
+        self.assertEqual(str(context.exception), 'At most 3 checkout request IDs are allowed.')
+
+
+class TestRouteValidation(unittest.TestCase):
+    """Test case for rejecting malformed requests before any Daraja call."""
+
+    def setUp(self):
+        """Create an app and its database."""
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+        self.app.config['TESTING'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+
+    def tearDown(self):
+        """Drop the database."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @patch('app.services.token_manager')
+    @patch('app.services.client')
+    def test_rejected_before_token_or_upstream_call(self, client, token_manager):
+        """Test that malformed bodies get a 400 without fetching a token or calling Daraja."""
+        requests = [
+            ('/initiate_mpesa_stk_push', {'full_name': 'John Doe', 'phone_number': '-1',
+                                          'amount': 1}),
+            ('/initiate_mpesa_stk_push', {'full_name': 'John Doe',
+                                          'phone_number': '0708374149', 'amount': 0}),
+            ('/initiate_mpesa_stk_push', ['not', 'an', 'object']),
+            ('/query_transaction_status', ['ws_CO_1']),
+            ('/sync_transaction_statuses', {'checkout_request_ids': 'ws_CO_1'}),
+        ]
+        for path, body in requests:
+            response = self.client.post(path, json=body)
+            self.assertEqual(response.status_code, 400, path)
+            self.assertIn('error', response.get_json())
+        client.post.assert_not_called()
+        token_manager.get_token.assert_not_called()
+
+    @patch('app.services.initiate_stk_push')
+    def test_normalized_phone_number_is_sent(self, initiate_stk_push):
+        """Test that the push is sent for the normalized phone number."""
+        initiate_stk_push.return_value = {'ResponseCode': '0'}
+        response = self.client.post('/initiate_mpesa_stk_push', json={
+            'full_name': 'John Doe', 'phone_number': '0708374149', 'amount': '3'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(initiate_stk_push.call_args.args, ('John Doe', 254708374149, 3))
+
+
+class TestJsonProviders(unittest.TestCase):
+    """Test case for the pluggable JSON encoder and decoder."""
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_provider(self):
+        """Test that the orjson provider encodes, decodes and serves responses."""
+        app = create_app({'JSON_PROVIDER': 'orjson'})
+        self.assertIsInstance(app.json, OrjsonProvider)
+        self.assertEqual(app.json.dumps({'b': 1, 'a': [2]}), '{"a":[2],"b":1}')
+        self.assertEqual(app.json.dumps({'b': 1, 'a': 2}, sort_keys=False), '{"b":1,"a":2}')
+        self.assertEqual(app.json.loads('{"a": [1, 2]}'), {'a': [1, 2]})
+        with app.test_request_context():
+            response = app.json.response({'a': 1})
+        self.assertEqual(response.get_data(), b'{"a":1}')
+        self.assertEqual(response.mimetype, 'application/json')
+
+    def test_unknown_provider_fails_at_startup(self):
+        """Test that an app with an unknown JSON provider isn't created."""
+        for name in ('simplejson', 'app.serialization:Missing'):
+            with self.assertRaises((ValueError, AttributeError)):
+                create_app({'JSON_PROVIDER': name})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""Module for testing write-behind batching of transaction inserts."""
+
+import unittest
+from unittest.mock import patch
+from app import create_app, db, lifecycle, services
+from app.models import MpesaTransaction
+from tests.test_callbacks import stk_callback
+
+app = create_app({'TRANSACTION_WRITE_BEHIND': True, 'TRANSACTION_FLUSH_INTERVAL': 60})
+
+
+def accepted(checkout_request_id):
+    """Build the Daraja response of an accepted STK push."""
+    return {'CheckoutRequestID': checkout_request_id, 'ResponseCode': '0'}
+
+
+class TestWriteBehind(unittest.TestCase):
+    """Test case for buffered transaction inserts."""
+
+    def setUp(self):
+        """Set up a test client and an in-memory database."""
+        app.config['TESTING'] = True
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.app = app.test_client()
+        db.create_all()
+
+    def tearDown(self):
+        """Empty the buffers and drop the database."""
+        services.transaction_buffer.flush()
+        services.callback_buffer.flush()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def stored(self):
+        """Checkout request IDs and statuses of the transactions in the database."""
+        db.session.expire_all()
+        return {
+            transaction.checkout_request_id: transaction.status
+            for transaction in MpesaTransaction.query.all()
+        }
+
+    def test_transactions_are_inserted_in_one_batch(self):
+        """Test that recorded transactions are only written when the buffer flushes."""
+        batches = services.transaction_buffer.batches
+        for number in range(5):
+            services.record_transaction('John Doe', '254708374149', 1, accepted(f'ws_CO_{number}'))
+        self.assertEqual(self.stored(), {})
+
+        self.assertEqual(services.transaction_buffer.flush(), 5)
+        self.assertEqual(len(self.stored()), 5)
+        self.assertEqual(services.transaction_buffer.batches, batches + 1)
+
+    def test_buffered_transaction_can_be_read(self):
+        """Test that a transaction is found before it has been written."""
+        services.record_transaction('John Doe', '254708374149', 1, accepted('ws_CO_read'))
+        transaction = services.find_transaction('ws_CO_read')
+        self.assertEqual(transaction.status, 'Pending')
+        self.assertEqual(transaction.full_name, 'John Doe')
+        self.assertIsNone(services.find_transaction('ws_CO_unknown'))
+
+        services.transaction_buffer.flush()
+        self.assertEqual(services.find_transaction('ws_CO_read').id, 1)
+
+    @patch('app.services.request_transaction_status')
+    def test_status_query_completes_buffered_transaction(self, mock_status):
+        """Test that a status query right after the push completes the new transaction."""
+        services.record_transaction('John Doe', '254708374149', 1, accepted('ws_CO_query'))
+        mock_status.return_value = {'ResponseCode': '0', 'ResultCode': '0'}
+
+        response = self.app.post(
+            '/query_transaction_status', json={'checkout_request_id': 'ws_CO_query'}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stored(), {'ws_CO_query': 'Completed'})
+
+    def test_callback_for_buffered_transaction(self):
+        """Test that a callback flush writes buffered transactions before updating them."""
+        services.record_transaction('John Doe', '254708374149', 1, accepted('ws_CO_callback'))
+        self.app.post('/mpesa_callback', json=stk_callback('ws_CO_callback'))
+        services.callback_buffer.flush()
+        self.assertEqual(self.stored(), {'ws_CO_callback': 'Completed'})
+
+    def test_rejected_row_does_not_block_the_batch(self):
+        """Test that a row rejected by the database is dropped and the others written."""
+        services.record_transaction('John Doe', '254708374149', 1, accepted('ws_CO_dup'))
+        services.transaction_buffer.flush()
+        services.record_transaction('John Doe', '254708374149', 1, accepted('ws_CO_dup'))
+        services.record_transaction('John Doe', '254708374149', 1, accepted('ws_CO_new'))
+
+        with self.assertLogs('app.services', 'ERROR'):
+            self.assertEqual(services.transaction_buffer.flush(), 2)
+        self.assertEqual(self.stored(), {'ws_CO_dup': 'Pending', 'ws_CO_new': 'Pending'})
+        self.assertEqual(len(services.transaction_buffer), 0)
+
+    def test_shutdown_flushes_buffered_transactions(self):
+        """Test that a stopping worker writes the transactions still in the buffer."""
+        services.record_transaction('John Doe', '254708374149', 1, accepted('ws_CO_exit'))
+        with patch.object(db.engine, 'dispose'):
+            lifecycle.shutdown_worker(app, timeout=1)
+        self.assertEqual(self.stored(), {'ws_CO_exit': 'Pending'})
+
+    def test_disabled_by_default(self):
+        """Test that transactions are committed at once unless write-behind is enabled."""
+        self.assertFalse(create_app().config['TRANSACTION_WRITE_BEHIND'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,15 @@
+"""
+Entry point of the STK push queue workers, run next to the web app with ``python worker.py``.
+"""
+import logging
+from app import create_app
+from app.stk_queue import start_workers
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    app = create_app()
+    workers = start_workers(
+        app, app.config['STK_QUEUE_WORKERS'], app.config['STK_QUEUE_WORKER_TYPE']
+    )
+    for worker in workers:
+        worker.join()